@@ -1,5 +1,5 @@
 from .config import settings
-from .database import engine, SessionLocal, get_db
-from .redis_client import redis_conn, queue, get_pubsub
+from .database import engine, SessionLocal, ReadSessionLocal, get_db
+from .redis_client import redis_conn, queue, queues, get_pubsub
 
-__all__ = ['settings', 'engine', 'SessionLocal', 'get_db', 'redis_conn', 'queue', 'get_pubsub']
+__all__ = ['settings', 'engine', 'SessionLocal', 'ReadSessionLocal', 'get_db', 'redis_conn', 'queue', 'queues', 'get_pubsub']
@@ -0,0 +1,427 @@
+"""
+Tiered cold storage for old requests.
+
+The archiver (python -m app.core.archive) moves requests older than
+ARCHIVE_AFTER_DAYS (whole UTC days) out of webhook_request on every shard
+into compressed Parquet files, one or more per webhook and day:
+
+    ARCHIVE_DIR/webhook=<id>/day=<YYYY-MM-DD>/part-<first id>-<last id>.parquet
+
+Each file has an archive_partition row (the manifest) on the primary database
+with its webhook, day, request count and id range. A file is written and
+fsynced, then its manifest row is committed, then its requests are deleted
+from the hot table, but only those the committed manifest's files hold.
+Archived requests keep their ids, which are never reused (webhook_request is
+AUTOINCREMENT on SQLite), so:
+
+- Showing, replaying and deleting a request by id fall back to the partitions
+  whose id range covers it. Deleting an archived request rewrites its file.
+- The request list and export continue into archived partitions, newest
+  first, after the hot rows.
+
+A run interrupted between a manifest commit and the hot delete leaves those
+requests in both places; the next run finds them, by id and timestamp, in the
+manifest and only deletes them. Reading and writing partitions needs pyarrow.
+
+Run with: python -m app.core.archive [--once]
+"""
+
+import argparse
+import logging
+import os
+import signal
+import time
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from sqlalchemy import func
+
+from . import sharding
+from .config import settings
+from .database import shard_router
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed once requests are archived
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveUnavailable(RuntimeError):
+    """Archived requests can't be read or written without pyarrow"""
+
+
+def archive_available() -> bool:
+    return pq is not None
+
+
+def _require_pyarrow():
+    if pq is None:
+        raise ArchiveUnavailable("Archived requests need pyarrow (pip install pyarrow)")
+
+
+def _schema():
+    return pa.schema([
+        ("id", pa.int64()),
+        ("webhook_id", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("headers", pa.string()),
+        ("body", pa.binary()),
+        ("query_params", pa.string()),
+    ])
+
+
+def partition_path(webhook_id, day, min_id, max_id) -> str:
+    """File path relative to ARCHIVE_DIR"""
+    return os.path.join(f"webhook={webhook_id}", f"day={day.isoformat()}", f"part-{min_id}-{max_id}.parquet")
+
+
+def _full_path(relative: str) -> str:
+    return os.path.join(settings.ARCHIVE_DIR, relative)
+
+
+def _write_file(relative: str, requests) -> int:
+    """Write requests to a Parquet file, replacing it atomically once on disk; returns its size"""
+    _require_pyarrow()
+    table = pa.Table.from_pydict({
+        "id": [r.id for r in requests],
+        "webhook_id": [r.webhook_id for r in requests],
+        "timestamp": [r.timestamp for r in requests],
+        "headers": [r.headers for r in requests],
+        "body": [r.body_bytes for r in requests],
+        "query_params": [r.query_params for r in requests],
+    }, schema=_schema())
+    path = _full_path(relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path, compression=settings.ARCHIVE_COMPRESSION)
+    fd = os.open(tmp_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
+    dir_fd = os.open(os.path.dirname(path), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+    return os.path.getsize(path)
+
+
+def _remove_file(relative: str):
+    try:
+        os.unlink(_full_path(relative))
+    except FileNotFoundError:
+        pass
+
+
+def _read_file(partition, request_id=None) -> list:
+    """Requests in a partition, newest first (only `request_id` if given), as detached WebhookRequests"""
+    from app.models import WebhookRequest
+
+    _require_pyarrow()
+    filters = [("id", "=", request_id)] if request_id is not None else None
+    try:
+        table = pq.read_table(_full_path(partition.path), filters=filters)
+    except FileNotFoundError:
+        logger.warning(f"Archive partition {partition.path} is missing")
+        return []
+    requests = [
+        WebhookRequest(
+            id=row["id"],
+            webhook_id=row["webhook_id"],
+            timestamp=row["timestamp"],
+            headers=row["headers"],
+            raw_body=row["body"],
+            query_params=row["query_params"]
+        )
+        for row in table.to_pylist()
+    ]
+    requests.sort(key=lambda r: (r.timestamp, r.id), reverse=True)
+    return requests
+
+
+def _partitions_newest_first(db, webhook_id) -> list:
+    from app.models import ArchivePartition
+
+    return db.query(ArchivePartition)\
+        .filter(ArchivePartition.webhook_id == webhook_id)\
+        .order_by(ArchivePartition.day.desc(), ArchivePartition.max_id.desc())\
+        .all()
+
+
+def _partitions_covering(db, request_id, webhook_id=None) -> list:
+    from app.models import ArchivePartition
+
+    query = db.query(ArchivePartition).filter(
+        ArchivePartition.min_id <= request_id,
+        ArchivePartition.max_id >= request_id
+    )
+    if webhook_id is not None:
+        query = query.filter(ArchivePartition.webhook_id == webhook_id)
+    return query.all()
+
+
+def archived_count(db, webhook_id) -> int:
+    from app.models import ArchivePartition
+
+    return db.query(func.coalesce(func.sum(ArchivePartition.request_count), 0))\
+        .filter(ArchivePartition.webhook_id == webhook_id)\
+        .scalar()
+
+
+def archived_requests(db, webhook_id, offset: int = 0, limit: int = 100) -> list:
+    """Archived requests of a webhook, newest first; whole partitions before `offset` are skipped unread"""
+    result = []
+    for partition in _partitions_newest_first(db, webhook_id):
+        if len(result) >= limit:
+            break
+        if offset >= partition.request_count:
+            offset -= partition.request_count
+            continue
+        requests = _read_file(partition)[offset:]
+        offset = 0
+        result.extend(requests[:limit - len(result)])
+    return result
+
+
+def iter_archived(db, webhook_id):
+    """Every archived request of a webhook, newest first, one partition in memory at a time"""
+    for partition in _partitions_newest_first(db, webhook_id):
+        yield from _read_file(partition)
+
+
+def find_request(db, request_id, timestamp=None):
+    """
+    An archived request by id (and timestamp, if given), or None. Databases
+    from before ids were AUTOINCREMENT may have archived one id twice; then
+    the newest is returned unless `timestamp` picks one.
+    """
+    matches = [
+        request
+        for partition in _partitions_covering(db, request_id)
+        for request in _read_file(partition, request_id)
+        if timestamp is None or request.timestamp == timestamp
+    ]
+    return max(matches, key=lambda r: r.timestamp) if matches else None
+
+
+def requests_page(sessions, db, webhook_id, offset: int = 0, limit: int = 100):
+    """
+    (total, requests) for one page of a webhook's requests, newest first: hot
+    rows from its shard sessions, then archived ones. `db` reads the manifest.
+    """
+    hot_total = sharding.count_requests(sessions, webhook_id)
+    requests = sharding.recent_requests(sessions, webhook_id, offset, limit) if offset < hot_total else []
+    if len(requests) < limit:
+        requests += archived_requests(db, webhook_id, max(0, offset - hot_total), limit - len(requests))
+    return hot_total + archived_count(db, webhook_id), requests
+
+
+def delete_archived(db, webhook_id) -> int:
+    """Remove a webhook's archived requests: files now, manifest rows with `db`'s next commit"""
+    partitions = _partitions_newest_first(db, webhook_id)
+    for partition in partitions:
+        _remove_file(partition.path)
+        db.delete(partition)
+    return sum(partition.request_count for partition in partitions)
+
+
+def delete_archived_request(db, request_id, webhook_id, timestamp=None) -> bool:
+    """
+    Rewrite the partition holding an archived request (the one with `timestamp`,
+    if given) without it; the manifest change commits with `db`
+    """
+    for partition in _partitions_covering(db, request_id, webhook_id):
+        requests = _read_file(partition)
+        kept = [r for r in requests if r.id != request_id or (timestamp is not None and r.timestamp != timestamp)]
+        if len(kept) == len(requests):
+            continue
+        if kept:
+            kept.sort(key=lambda r: (r.timestamp, r.id))
+            partition.size_bytes = _write_file(partition.path, kept)
+            partition.request_count = len(kept)
+            partition.min_id = min(r.id for r in kept)
+            partition.max_id = max(r.id for r in kept)
+        else:
+            _remove_file(partition.path)
+            db.delete(partition)
+        return True
+    return False
+
+
+def archive_stats(db) -> dict:
+    from app.models import ArchivePartition
+
+    partitions, requests, size = db.query(
+        func.count(ArchivePartition.id),
+        func.coalesce(func.sum(ArchivePartition.request_count), 0),
+        func.coalesce(func.sum(ArchivePartition.size_bytes), 0)
+    ).one()
+    return {'partitions': partitions, 'requests': requests, 'bytes': size}
+
+
+def _archived_keys(db, webhook_id, low, high) -> set:
+    """(id, timestamp) of requests with ids in [low, high] already in this webhook's partitions"""
+    from app.models import ArchivePartition
+
+    partitions = db.query(ArchivePartition).filter(
+        ArchivePartition.webhook_id == webhook_id,
+        ArchivePartition.min_id <= high,
+        ArchivePartition.max_id >= low
+    ).all()
+    keys = set()
+    for partition in partitions:
+        try:
+            table = pq.read_table(_full_path(partition.path), columns=["id", "timestamp"])
+        except FileNotFoundError:
+            continue
+        keys.update(zip(table.column("id").to_pylist(), table.column("timestamp").to_pylist()))
+    return keys
+
+
+class Archiver:
+    """Moves requests older than the cutoff from every shard into Parquet partitions"""
+
+    def __init__(self, router=shard_router):
+        self.router = router
+        self.batch_size = settings.ARCHIVE_BATCH_SIZE
+        self.running = False
+        self.archived = 0
+
+    def stop(self, *args):
+        self.running = False
+
+    def cutoff(self) -> datetime:
+        """Start of the newest UTC day that is archived whole"""
+        day = (datetime.utcnow() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)).date()
+        return datetime.combine(day, datetime.min.time())
+
+    def run(self):
+        self.running = True
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Archive run failed: {e}")
+            next_run = time.monotonic() + settings.ARCHIVE_INTERVAL
+            while self.running and time.monotonic() < next_run:
+                time.sleep(1)
+
+    def run_once(self) -> int:
+        """Archive everything older than the cutoff; returns requests archived"""
+        _require_pyarrow()
+        self.running = True
+        cutoff = self.cutoff()
+        return sum(self.archive_shard(shard, cutoff) for shard in range(len(self.router)))
+
+    def archive_shard(self, shard: int, cutoff: datetime) -> int:
+        from app.models import Webhook, WebhookRequest
+
+        session = self.router.session(shard)
+        db = self.router.session(0)
+        archived = 0
+        try:
+            webhook_ids = [
+                webhook_id for (webhook_id,) in session.query(WebhookRequest.webhook_id)
+                .filter(WebhookRequest.timestamp < cutoff)
+                .distinct()
+            ]
+            for webhook_id in webhook_ids:
+                if db.query(Webhook.id).filter(Webhook.id == webhook_id).first() is None:
+                    logger.warning(f"Shard {shard} has requests of deleted webhook {webhook_id}; not archiving them")
+                    continue
+                while self.running:
+                    requests = session.query(WebhookRequest)\
+                        .filter(WebhookRequest.webhook_id == webhook_id, WebhookRequest.timestamp < cutoff)\
+                        .order_by(WebhookRequest.timestamp, WebhookRequest.id)\
+                        .limit(self.batch_size)\
+                        .all()
+                    if not requests:
+                        break
+                    archived_ids = self.archive_requests(db, webhook_id, requests)
+                    if archived_ids:
+                        session.query(WebhookRequest)\
+                            .filter(WebhookRequest.id.in_(archived_ids))\
+                            .delete(synchronize_session=False)
+                        session.commit()
+                    archived += len(archived_ids)
+                    self.archived += len(archived_ids)
+                    if len(archived_ids) < len(requests):
+                        logger.error(f"{len(requests) - len(archived_ids)} requests of webhook {webhook_id} on shard "
+                                     f"{shard} are not in the archive after writing it; keeping them")
+                        break
+        finally:
+            session.close()
+            db.close()
+        if archived:
+            logger.info(f"Archived {archived} requests from shard {shard}")
+        return archived
+
+    def archive_requests(self, db, webhook_id, requests) -> list:
+        """
+        Write one webhook's requests (oldest first) into per-day partitions and
+        commit their manifest rows. Returns the ids of those the committed
+        partitions now hold, the only ones safe to delete from the hot table.
+        """
+        from app.models import ArchivePartition
+
+        ids = [r.id for r in requests]
+        done = _archived_keys(db, webhook_id, min(ids), max(ids))
+        pending = [r for r in requests if (r.id, r.timestamp) not in done]
+        for day, day_requests in groupby(pending, key=lambda r: r.timestamp.date()):
+            day_requests = list(day_requests)
+            day_ids = [r.id for r in day_requests]
+            relative = partition_path(webhook_id, day, min(day_ids), max(day_ids))
+            if os.path.exists(_full_path(relative)):
+                # Same id range as an existing file: ids reused before webhook_request was AUTOINCREMENT
+                relative = relative.replace(".parquet", f"-{int(time.time() * 1000)}.parquet")
+            db.add(ArchivePartition(
+                webhook_id=webhook_id,
+                day=day,
+                path=relative,
+                request_count=len(day_requests),
+                min_id=min(day_ids),
+                max_id=max(day_ids),
+                size_bytes=_write_file(relative, day_requests)
+            ))
+        db.commit()
+        if pending:
+            done = _archived_keys(db, webhook_id, min(ids), max(ids))
+        return [r.id for r in requests if (r.id, r.timestamp) in done]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Whook request archiver')
+    parser.add_argument('--if-enabled', action='store_true', help='Exit quietly unless ARCHIVE_ENABLED=True')
+    parser.add_argument('--once', action='store_true', help='Archive once and exit (e.g. from cron)')
+    args = parser.parse_args()
+
+    if not settings.ARCHIVE_ENABLED and not args.once:
+        if args.if_enabled:
+            return 0
+        print("Archiver requires ARCHIVE_ENABLED=True (or run it with --once)")
+        return 1
+    if not archive_available():
+        print("❌ The archiver needs pyarrow: pip install pyarrow")
+        return 1
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    archiver = Archiver()
+    signal.signal(signal.SIGTERM, archiver.stop)
+    signal.signal(signal.SIGINT, archiver.stop)
+    if args.once:
+        archived = archiver.run_once()
+        print(f"✅ Archived {archived} requests from before {archiver.cutoff().date()}")
+        return 0
+    print(f"✅ Archiver started (after {settings.ARCHIVE_AFTER_DAYS} days, every {settings.ARCHIVE_INTERVAL:g}s, into {settings.ARCHIVE_DIR})")
+    archiver.run()
+    print(f"👋 Archiver stopped after archiving {archiver.archived} requests")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,189 @@
+"""
+Fingerprinted, precompressed static assets.
+
+`python -m app.core.assets` (run by the Dockerfile and run.sh) builds every
+.js and .css file under static/ into ASSET_DIR:
+
+- CSS is minified here; JS is minified with rjsmin when it is installed
+  (pip install whook[assets]) and copied as is otherwise.
+- Each file is written under a name carrying a hash of its content
+  (js/index.3f2a9c1b04de.js), with gzip and, when the brotli package is
+  installed, brotli variants next to it (.gz, .br).
+- manifest.json maps source paths to built ones.
+
+Templates link assets through asset_url('js/index.js'), which returns the
+built file under /assets/ when the manifest has it and /static/... otherwise,
+so an unbuilt checkout still works. Built files never change, so /assets/
+is served with a year-long immutable Cache-Control, the precompressed
+variant the browser accepts and no revalidation (AssetFiles, or nginx
+straight from ASSET_DIR, see nginx.conf).
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+from fastapi.staticfiles import StaticFiles
+from starlette.exceptions import HTTPException
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:  # optional: gzip variants only
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # optional: JS is copied unminified
+    rjsmin = None
+
+SOURCE_DIR = "static"
+URL_PREFIX = "/assets"
+MANIFEST = "manifest.json"
+EXTENSIONS = (".js", ".css")
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Accept-Encoding token -> file suffix, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def minify_css(text: str) -> str:
+    """Drop comments and layout whitespace; spacing inside selectors and values is kept"""
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,])\s*", r"\1", text)
+    return text.replace(";}", "}").strip()
+
+
+def minify(path: str, text: str) -> str:
+    if path.endswith(".css"):
+        return minify_css(text)
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    return text
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build(source: str = SOURCE_DIR, output: str = None, log=print) -> dict:
+    """Build every asset under `source` into `output`; returns the manifest"""
+    output = output or settings.ASSET_DIR
+    skip = os.path.abspath(output)
+    manifest, written = {}, {MANIFEST}
+    for root, dirs, files in os.walk(source):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != skip)
+        for name in sorted(files):
+            if not name.endswith(EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, source).replace(os.sep, "/")
+            with open(path, encoding="utf-8") as f:
+                content = minify(name, f.read()).encode("utf-8")
+
+            stem, extension = os.path.splitext(relative)
+            built = f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{extension}"
+            target = os.path.join(output, built)
+            _write(target, content)
+            variants = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants[".br"] = brotli.compress(content, quality=11)
+            written.add(built)
+            sizes = [f"{len(content)} bytes"]
+            for suffix, data in variants.items():
+                if len(data) < len(content):
+                    _write(target + suffix, data)
+                    written.add(built + suffix)
+                    sizes.append(f"{suffix[1:]} {len(data)}")
+            manifest[relative] = built
+            log(f"  {relative} → {built} ({', '.join(sizes)})")
+
+    _write(os.path.join(output, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    # Files of earlier builds
+    for root, _, files in os.walk(output):
+        for name in files:
+            relative = os.path.relpath(os.path.join(root, name), output).replace(os.sep, "/")
+            if relative not in written:
+                os.remove(os.path.join(root, name))
+    return manifest
+
+
+_manifest = (None, {})
+
+
+def load_manifest() -> dict:
+    """The current manifest, reread when a build replaces it ({} if assets are not built)"""
+    global _manifest
+    path = os.path.join(settings.ASSET_DIR, MANIFEST)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    if _manifest[0] != mtime:
+        with open(path, encoding="utf-8") as f:
+            _manifest = (mtime, json.load(f))
+    return _manifest[1]
+
+
+def asset_url(path: str) -> str:
+    """URL of a static asset for templates: the built file if there is one"""
+    built = load_manifest().get(path)
+    if built is None:
+        return f"/{SOURCE_DIR}/{path}"
+    return f"{URL_PREFIX}/{built}"
+
+
+class AssetFiles(StaticFiles):
+    """Serves built assets with immutable caching and their precompressed variants"""
+
+    async def get_response(self, path: str, scope):
+        if path == MANIFEST or path.endswith((".gz", ".br")):
+            raise HTTPException(status_code=404)
+        accepted = {
+            token.split(";")[0].strip()
+            for name, value in scope["headers"] if name == b"accept-encoding"
+            for token in value.decode("latin-1").split(",")
+        }
+        response = None
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted:
+                try:
+                    response = await super().get_response(path + suffix, scope)
+                except HTTPException:
+                    continue
+                response.headers["Content-Encoding"] = encoding
+                break
+        if response is None:
+            response = await super().get_response(path, scope)
+        media_type = mimetypes.guess_type(path)[0]
+        if media_type and response.status_code == 200:
+            response.headers["Content-Type"] = f"{media_type}; charset=utf-8"
+        response.headers["Cache-Control"] = IMMUTABLE
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build fingerprinted, precompressed static assets")
+    parser.add_argument("--source", default=SOURCE_DIR)
+    parser.add_argument("--output", default=None, help="Default: ASSET_DIR")
+    args = parser.parse_args()
+
+    output = args.output or settings.ASSET_DIR
+    print(f"Building assets into {output}" + ("" if brotli else " (no brotli package: gzip only)"))
+    manifest = build(args.source, output)
+    print(f"✅ Built {len(manifest)} assets")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,65 @@
+"""
+Queue-depth based scaling of the worker pool.
+
+Each lane runs between its WORKER_POOL_<LANE> (minimum) and
+WORKER_POOL_MAX_<LANE> (maximum) workers. Every WORKER_AUTOSCALE_INTERVAL
+seconds the pool compares each lane's load with its current size:
+
+- Scale up when the lane has more than WORKER_SCALE_UP_BACKLOG queued jobs
+  per worker, or its oldest job has waited longer than WORKER_SCALE_UP_WAIT_MS.
+  The lane grows to one worker per WORKER_SCALE_UP_BACKLOG jobs (at least one
+  more), capped at the maximum.
+- Scale down by one worker after the lane has been empty for
+  WORKER_SCALE_DOWN_IDLE_SECONDS. Removed workers get a warm shutdown, so the
+  job they are running finishes first.
+"""
+
+import math
+import time
+
+from .config import settings
+from .redis_client import oldest_job_wait
+
+
+def autoscaling_enabled(min_sizes: dict, max_sizes: dict) -> bool:
+    return any(max_sizes.get(lane, 0) > size for lane, size in min_sizes.items())
+
+
+def lane_load(lane_queue):
+    """(queued jobs, seconds the oldest has waited or 0)"""
+    return lane_queue.count, oldest_job_wait(lane_queue) or 0.0
+
+
+class Autoscaler:
+    def __init__(self, lane_queues: dict, min_sizes: dict, max_sizes: dict):
+        self.queues = lane_queues
+        self.min_sizes = min_sizes
+        self.max_sizes = {lane: max(max_sizes.get(lane, 0), size) for lane, size in min_sizes.items()}
+        self.idle_since = {}
+
+    def target(self, lane: str, current: int, depth: int, wait_seconds: float, now: float) -> int:
+        """Desired worker count for a lane given its load"""
+        low, high = self.min_sizes.get(lane, 0), self.max_sizes.get(lane, 0)
+        if depth:
+            self.idle_since.pop(lane, None)
+        else:
+            self.idle_since.setdefault(lane, now)
+
+        backlog = settings.WORKER_SCALE_UP_BACKLOG
+        if current < high and (depth > current * backlog or wait_seconds * 1000 > settings.WORKER_SCALE_UP_WAIT_MS):
+            return min(high, max(current + 1, math.ceil(depth / backlog)))
+        if current > low and not depth and now - self.idle_since[lane] >= settings.WORKER_SCALE_DOWN_IDLE_SECONDS:
+            self.idle_since[lane] = now  # one worker per idle period
+            return current - 1
+        return max(low, min(current, high))
+
+    def targets(self, current: dict) -> dict:
+        """lane -> desired worker count for every lane that can scale"""
+        now = time.monotonic()
+        result = {}
+        for lane, lane_queue in self.queues.items():
+            if self.max_sizes.get(lane, 0) <= self.min_sizes.get(lane, 0):
+                continue
+            depth, wait_seconds = lane_load(lane_queue)
+            result[lane] = self.target(lane, current.get(lane, 0), depth, wait_seconds, now)
+        return result
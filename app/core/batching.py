@@ -0,0 +1,286 @@
+"""
+Batched forwarding to destinations that accept arrays of events.
+
+A Destination with batch options does not get one forward job per delivery.
+Instead its deliveries are appended to a Redis buffer, and a flush job sends
+them as one request:
+
+    {"max_count": 100, "max_bytes": 1048576, "linger_ms": 1000, "format": "json"}
+
+- `format` is "json" (one array) or "ndjson" (one event per line).
+- A buffer is flushed `linger_ms` after its first delivery, or as soon as it
+  holds `max_count` deliveries or `max_bytes` bytes. A flush sends at most
+  that many deliveries, and anything left over is flushed again.
+
+Buffers are keyed by destination URL and options, so webhooks that forward to
+the same endpoint with the same options share one buffer.
+
+A flush moves its batch to an in-flight list of its own and drops that list
+once the send is done (delivered, dropped or handed to a retry job). Every
+BATCH_SWEEP_INTERVAL seconds a sweep on the maintenance lane puts batches
+whose flush died back at the head of their buffer, and flushes buffers whose
+timer or flush job was lost. A batch whose worker died after the POST
+succeeded is therefore sent again.
+"""
+
+import hashlib
+import time
+import uuid
+from functools import lru_cache
+
+from .config import settings
+from .serialization import dumps, dumps_bytes, loads
+
+BUFFER_KEY = "whook:batch:buf:{id}"
+BYTES_KEY = "whook:batch:bytes:{id}"
+TIMER_KEY = "whook:batch:timer:{id}"
+FLUSHING_KEY = "whook:batch:flushing:{id}"
+BUFFERS_KEY = "whook:batch:buffers"
+META_KEY = "whook:batch:meta"  # buffer id -> [destination URL, raw options], for the sweep
+IN_FLIGHT_KEY = "whook:batch:inflight:{member}"
+IN_FLIGHT_SET = "whook:batch:inflight"  # "<buffer id>:<flush id>" scored by take time
+STATS_KEY = "whook:batch:stats"
+SWEEP_KEY = "whook:batch:sweep"  # set while a sweep is queued for this interval
+
+FLUSH_TIMEOUT = 60
+# A flush job is killed after FLUSH_TIMEOUT, so an older in-flight batch has no owner
+IN_FLIGHT_STALE_SECONDS = 2 * FLUSH_TIMEOUT
+
+# Move the next batch (within max_count and max_bytes) from a buffer to an in-flight list
+TAKE_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+local max_bytes = tonumber(ARGV[2])
+local taken, size = 0, 0
+for _, item in ipairs(items) do
+    if taken > 0 and size + #item > max_bytes then
+        break
+    end
+    taken = taken + 1
+    size = size + #item
+end
+if taken == 0 then
+    return {}
+end
+redis.call('LTRIM', KEYS[1], taken, -1)
+redis.call('DECRBY', KEYS[2], size)
+local batch = {}
+for i = 1, taken do
+    batch[i] = items[i]
+    redis.call('RPUSH', KEYS[3], items[i])
+end
+redis.call('ZADD', KEYS[4], ARGV[4], ARGV[3])
+return batch
+"""
+
+# Put an abandoned in-flight batch back at the head of its buffer
+RESTORE_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, -1)
+local size = 0
+for i = #items, 1, -1 do
+    redis.call('LPUSH', KEYS[2], items[i])
+    size = size + #items[i]
+end
+if #items > 0 then
+    redis.call('INCRBY', KEYS[3], size)
+    redis.call('SADD', KEYS[4], ARGV[2])
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[5], ARGV[1])
+return #items
+"""
+
+# Forget an empty buffer, unless a delivery arrived since it was found empty
+FORGET_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[2], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+FORMATS = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+
+@lru_cache(maxsize=256)
+def parse_options(raw: str) -> dict:
+    """Validated batch options with defaults filled in; raises ValueError"""
+    options = loads(raw) if isinstance(raw, (str, bytes)) else raw
+    return _validate(options)
+
+
+def _validate(options) -> dict:
+    if not isinstance(options, dict):
+        raise ValueError("Batch options must be a JSON object")
+    unknown = set(options) - {"max_count", "max_bytes", "linger_ms", "format"}
+    if unknown:
+        raise ValueError(f"Unknown batch options: {', '.join(sorted(unknown))}")
+    result = {
+        "max_count": options.get("max_count", settings.BATCH_MAX_COUNT),
+        "max_bytes": options.get("max_bytes", settings.BATCH_MAX_BYTES),
+        "linger_ms": options.get("linger_ms", settings.BATCH_LINGER_MS),
+        "format": options.get("format", "json"),
+    }
+    for name in ("max_count", "max_bytes", "linger_ms"):
+        value = result[name]
+        if isinstance(value, bool) or not isinstance(value, int) or value < (0 if name == "linger_ms" else 1):
+            raise ValueError(f"'{name}' must be a {'non-negative' if name == 'linger_ms' else 'positive'} integer")
+    if result["format"] not in FORMATS:
+        raise ValueError(f"'format' must be one of {', '.join(FORMATS)}")
+    return result
+
+
+def validate_options(options):
+    """Raise ValueError if batch options are invalid"""
+    _validate(options)
+
+
+def buffer_id(dest_url: str, raw_options: str) -> str:
+    return hashlib.sha1(f"{dest_url}\0{raw_options}".encode("utf-8")).hexdigest()[:20]
+
+
+def add(redis_conn, dest_url: str, raw_options: str, body: bytes):
+    """
+    Buffer one delivery. Returns (buffer_id, flush) where flush is None, 'now'
+    (a limit was reached) or 'later' (first delivery; flush after the linger time).
+    """
+    options = parse_options(raw_options)
+    bid = buffer_id(dest_url, raw_options)
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.rpush(BUFFER_KEY.format(id=bid), body)
+    pipe.incrby(BYTES_KEY.format(id=bid), len(body))
+    pipe.sadd(BUFFERS_KEY, bid)
+    pipe.hset(META_KEY, bid, dumps([dest_url, raw_options]))
+    count, size, _, _ = pipe.execute()
+
+    if count >= options["max_count"] or size >= options["max_bytes"] or not options["linger_ms"]:
+        # One immediate flush at a time; the flush re-arms itself if more is waiting
+        if redis_conn.set(FLUSHING_KEY.format(id=bid), 1, nx=True, ex=FLUSH_TIMEOUT):
+            return bid, "now"
+        return bid, None
+    if redis_conn.set(TIMER_KEY.format(id=bid), 1, nx=True, px=options["linger_ms"] + 60000):
+        return bid, "later"
+    return bid, None
+
+
+def take(redis_conn, bid: str, options: dict):
+    """
+    Atomically move the next batch (within max_count and max_bytes) from a buffer
+    to an in-flight list. Returns (flush id, items); ack() the flush id once sent.
+    """
+    redis_conn.delete(TIMER_KEY.format(id=bid), FLUSHING_KEY.format(id=bid))
+    member = f"{bid}:{uuid.uuid4().hex[:12]}"
+    script = redis_conn.register_script(TAKE_SCRIPT)
+    keys = [BUFFER_KEY.format(id=bid), BYTES_KEY.format(id=bid), IN_FLIGHT_KEY.format(member=member), IN_FLIGHT_SET]
+    items = script(keys=keys, args=[options["max_count"], options["max_bytes"], member, time.time()])
+    return member, items
+
+
+def ack(redis_conn, member: str):
+    """A taken batch was sent (or handed to a retry job): drop its in-flight copy"""
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.delete(IN_FLIGHT_KEY.format(member=member))
+    pipe.zrem(IN_FLIGHT_SET, member)
+    pipe.execute()
+
+
+def rearm(redis_conn, bid: str, options: dict):
+    """After a flush, say when the rest of the buffer should go: 'now', 'later' or None if empty"""
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.llen(BUFFER_KEY.format(id=bid))
+    pipe.get(BYTES_KEY.format(id=bid))
+    count, size = pipe.execute()
+    if not count:
+        redis_conn.register_script(FORGET_SCRIPT)(
+            keys=[BUFFER_KEY.format(id=bid), BUFFERS_KEY, META_KEY], args=[bid]
+        )
+        return None
+    if count >= options["max_count"] or int(size or 0) >= options["max_bytes"] or not options["linger_ms"]:
+        if redis_conn.set(FLUSHING_KEY.format(id=bid), 1, nx=True, ex=FLUSH_TIMEOUT):
+            return "now"
+        return None
+    if redis_conn.set(TIMER_KEY.format(id=bid), 1, nx=True, px=options["linger_ms"] + 60000):
+        return "later"
+    return None
+
+
+def sweep(redis_conn, now: float = None) -> list:
+    """
+    Recover batches whose flush died and buffers nobody will flush. Returns
+    [(destination URL, raw options)] of buffers to flush now.
+    """
+    now = time.time() if now is None else now
+    restore = redis_conn.register_script(RESTORE_SCRIPT)
+    for member in redis_conn.zrangebyscore(IN_FLIGHT_SET, "-inf", now - IN_FLIGHT_STALE_SECONDS):
+        member = member.decode() if isinstance(member, bytes) else member
+        bid = member.split(":", 1)[0]
+        restore(
+            keys=[IN_FLIGHT_KEY.format(member=member), BUFFER_KEY.format(id=bid), BYTES_KEY.format(id=bid),
+                  BUFFERS_KEY, IN_FLIGHT_SET],
+            args=[member, bid]
+        )
+
+    # Buffers with a flush in progress; it re-arms them when it is done
+    flushing = {
+        (member.decode() if isinstance(member, bytes) else member).split(":", 1)[0]
+        for member in redis_conn.zrangebyscore(IN_FLIGHT_SET, now - IN_FLIGHT_STALE_SECONDS, "+inf")
+    }
+    due = []
+    for bid in redis_conn.smembers(BUFFERS_KEY):
+        bid = bid.decode() if isinstance(bid, bytes) else bid
+        if bid in flushing:
+            continue
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.llen(BUFFER_KEY.format(id=bid))
+        pipe.exists(TIMER_KEY.format(id=bid), FLUSHING_KEY.format(id=bid))
+        pipe.hget(META_KEY, bid)
+        count, pending, meta = pipe.execute()
+        # A live timer or flush job will get to it
+        if not count or pending or meta is None:
+            continue
+        if redis_conn.set(FLUSHING_KEY.format(id=bid), 1, nx=True, ex=FLUSH_TIMEOUT):
+            due.append(tuple(loads(meta)))
+    return due
+
+
+def encode(items: list, fmt: str) -> bytes:
+    """Request body for a batch; bodies that are not JSON are sent as JSON strings"""
+    events = []
+    for item in items:
+        try:
+            events.append(loads(item))
+        except ValueError:
+            events.append(item.decode("utf-8", errors="replace"))
+    if fmt == "ndjson":
+        return b"\n".join(dumps_bytes(event) for event in events) + b"\n"
+    return dumps_bytes(events)
+
+
+def failed_indexes(response_body: bytes, count: int):
+    """
+    Indexes a 2xx batch response reports as failed ({"failed": [0, 3]}), so only
+    those deliveries are retried. None when the response doesn't say.
+    """
+    try:
+        data = loads(response_body)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("failed"), list):
+        return None
+    return sorted({i for i in data["failed"] if isinstance(i, int) and not isinstance(i, bool) and 0 <= i < count})
+
+
+def record(redis_conn, **counters):
+    pipe = redis_conn.pipeline(transaction=False)
+    for name, value in counters.items():
+        if value:
+            pipe.hincrby(STATS_KEY, name, value)
+    pipe.execute()
+
+
+def batch_stats(redis_conn) -> dict:
+    """Counters and pending deliveries per buffer (decoded connection)"""
+    stats = {name: int(value) for name, value in redis_conn.hgetall(STATS_KEY).items()}
+    stats["pending"] = {bid: redis_conn.llen(BUFFER_KEY.format(id=bid)) for bid in sorted(redis_conn.smembers(BUFFERS_KEY))}
+    stats["in_flight"] = redis_conn.zcard(IN_FLIGHT_SET)
+    return stats
@@ -12,9 +12,138 @@ class Settings:
     DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
     DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
     
+    # Read replicas (comma-separated URLs) for dashboard/API reads; PostgreSQL and MySQL only
+    DATABASE_REPLICA_URLS: list = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+    REPLICA_MAX_LAG_SECONDS: float = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+    REPLICA_LAG_CHECK_INTERVAL: float = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "5"))
+    # Reads stay on the primary for this long after a user's own write
+    READ_YOUR_WRITES_SECONDS: float = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+    
+    # Sharding: extra databases (comma-separated URLs) for webhook_request rows; shard 0 is DATABASE_URL.
+    # Shard numbers are positions in this list, so only append to it.
+    DATABASE_SHARD_URLS: list = [u.strip() for u in os.getenv("DATABASE_SHARD_URLS", "").split(",") if u.strip()]
+    SHARD_KEY: str = os.getenv("SHARD_KEY", "webhook")  # webhook or user: what new webhooks are placed by
+    SHARD_MOVE_BATCH_SIZE: int = int(os.getenv("SHARD_MOVE_BATCH_SIZE", "500"))
+    SHARD_MOVE_GRACE_SECONDS: float = float(os.getenv("SHARD_MOVE_GRACE_SECONDS", "5"))
+    
+    # SQLite tuning (applied to every SQLite connection)
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE: int = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative = KiB
+    SQLITE_WAL_AUTOCHECKPOINT: int = int(os.getenv("SQLITE_WAL_AUTOCHECKPOINT", "1000"))
+    
+    # SQLite high-throughput mode: funnel request inserts/deletes through one writer process
+    SQLITE_WRITER: bool = os.getenv("SQLITE_WRITER", "False").lower() == "true"
+    SQLITE_WRITER_BATCH_SIZE: int = int(os.getenv("SQLITE_WRITER_BATCH_SIZE", "500"))
+    SQLITE_WRITER_LINGER_MS: float = float(os.getenv("SQLITE_WRITER_LINGER_MS", "5"))
+    SQLITE_CHECKPOINT_INTERVAL: float = float(os.getenv("SQLITE_CHECKPOINT_INTERVAL", "30"))
+    
     # Redis
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
     
+    # "rq": Redis queue lanes worked by worker.py. "embedded": in-process asyncio queue in the web process
+    QUEUE_MODE: str = os.getenv("QUEUE_MODE", "rq").lower()
+    EMBEDDED_QUEUE_SIZE: int = int(os.getenv("EMBEDDED_QUEUE_SIZE", "10000"))  # full queue answers 503
+    EMBEDDED_CONSUMERS: int = int(os.getenv("EMBEDDED_CONSUMERS", "2"))
+    EMBEDDED_BATCH_SIZE: int = int(os.getenv("EMBEDDED_BATCH_SIZE", "100"))
+    EMBEDDED_LINGER_MS: float = float(os.getenv("EMBEDDED_LINGER_MS", "0"))
+    EMBEDDED_THREADS: int = int(os.getenv("EMBEDDED_THREADS", "4"))  # store and transform
+    EMBEDDED_FORWARD_CONCURRENCY: int = int(os.getenv("EMBEDDED_FORWARD_CONCURRENCY", "100"))
+    
+    # Worker pool size per queue lane (python worker.py starts this many workers per lane)
+    WORKER_POOL_SIZES: dict = {
+        "ingest": int(os.getenv("WORKER_POOL_INGEST", "2")),
+        "forward": int(os.getenv("WORKER_POOL_FORWARD", "4")),
+        "ordered": int(os.getenv("WORKER_POOL_ORDERED", "2")),
+        "retry": int(os.getenv("WORKER_POOL_RETRY", "1")),
+        "maintenance": int(os.getenv("WORKER_POOL_MAINTENANCE", "1")),
+    }
+    # Autoscaling: a lane grows up to its max (default: its pool size, i.e. no scaling) by queue depth and wait
+    WORKER_POOL_MAX_SIZES: dict = {
+        lane: int(os.getenv(f"WORKER_POOL_MAX_{lane.upper()}", str(size)))
+        for lane, size in WORKER_POOL_SIZES.items()
+    }
+    WORKER_AUTOSCALE_INTERVAL: float = float(os.getenv("WORKER_AUTOSCALE_INTERVAL", "5"))
+    WORKER_SCALE_UP_BACKLOG: int = int(os.getenv("WORKER_SCALE_UP_BACKLOG", "10"))  # queued jobs per worker
+    WORKER_SCALE_UP_WAIT_MS: float = float(os.getenv("WORKER_SCALE_UP_WAIT_MS", "1000"))
+    WORKER_SCALE_DOWN_IDLE_SECONDS: float = float(os.getenv("WORKER_SCALE_DOWN_IDLE_SECONDS", "60"))
+    
+    # serve.py: API processes, and how long each service gets to drain on shutdown before it is killed
+    WEB_WORKERS: int = int(os.getenv("WEB_WORKERS", "1"))
+    SHUTDOWN_TIMEOUT: float = float(os.getenv("SHUTDOWN_TIMEOUT", "60"))
+    
+    # Ingest spool (python -m app.core.spool drains it): deliveries go to local disk while Redis is down or slow
+    SPOOL_ENABLED: bool = os.getenv("SPOOL_ENABLED", "False").lower() == "true"
+    SPOOL_DIR: str = os.getenv("SPOOL_DIR", "spool")
+    SPOOL_SEGMENT_BYTES: int = int(os.getenv("SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+    SPOOL_FSYNC_MS: float = float(os.getenv("SPOOL_FSYNC_MS", "20"))
+    SPOOL_SEAL_MS: float = float(os.getenv("SPOOL_SEAL_MS", "500"))
+    # Queueing slower than the budget (or failing) sends deliveries to the spool for the cooldown
+    SPOOL_LATENCY_BUDGET_MS: float = float(os.getenv("SPOOL_LATENCY_BUDGET_MS", "100"))
+    SPOOL_COOLDOWN_MS: float = float(os.getenv("SPOOL_COOLDOWN_MS", "1000"))
+    SPOOL_REDIS_TIMEOUT_MS: float = float(os.getenv("SPOOL_REDIS_TIMEOUT_MS", "250"))
+    
+    # Forwarding retries (failed forwards move to the retry lane with these delays in seconds)
+    FORWARD_MAX_RETRIES: int = int(os.getenv("FORWARD_MAX_RETRIES", "3"))
+    FORWARD_RETRY_DELAYS: list = [int(d) for d in os.getenv("FORWARD_RETRY_DELAYS", "10,60,300").split(",") if d.strip()]
+    # Defaults for destinations with batched forwarding (per-destination options override them)
+    BATCH_MAX_COUNT: int = int(os.getenv("BATCH_MAX_COUNT", "100"))
+    BATCH_MAX_BYTES: int = int(os.getenv("BATCH_MAX_BYTES", "1048576"))
+    BATCH_LINGER_MS: int = int(os.getenv("BATCH_LINGER_MS", "1000"))
+    # How often the maintenance lane recovers batches whose flush died (0 = never)
+    BATCH_SWEEP_INTERVAL: int = int(os.getenv("BATCH_SWEEP_INTERVAL", "30"))
+    # Non-HTTP destinations (redis-stream://, file://, sql+...://) write to this server's resources
+    SINKS_ENABLED: bool = os.getenv("SINKS_ENABLED", "False").lower() == "true"
+    SINK_FILE_ROOT: str = os.getenv("SINK_FILE_ROOT", "sinks")
+    # sql+ sinks on databases other than SQLite files under SINK_FILE_ROOT (comma-separated SQLAlchemy URLs)
+    SINK_SQL_ALLOWED_URLS: list = [u.strip() for u in os.getenv("SINK_SQL_ALLOWED_URLS", "").split(",") if u.strip()]
+    
+    # RQ job payload encoding: "msgpack" (compact, falls back to pickle per job) or "pickle"
+    QUEUE_SERIALIZER: str = os.getenv("QUEUE_SERIALIZER", "msgpack").lower()
+    
+    # Sandboxed transform pool (python -m app.transforms.pool); off = transforms run inline in the worker
+    TRANSFORM_POOL: bool = os.getenv("TRANSFORM_POOL", "False").lower() == "true"
+    TRANSFORM_POOL_SIZE: int = int(os.getenv("TRANSFORM_POOL_SIZE", "4"))
+    TRANSFORM_TIMEOUT_MS: float = float(os.getenv("TRANSFORM_TIMEOUT_MS", "1000"))
+    TRANSFORM_CPU_SECONDS: int = int(os.getenv("TRANSFORM_CPU_SECONDS", "1"))
+    TRANSFORM_MEMORY_MB: int = int(os.getenv("TRANSFORM_MEMORY_MB", "512"))
+    TRANSFORM_CACHE_SIZE: int = int(os.getenv("TRANSFORM_CACHE_SIZE", "256"))
+    TRANSFORM_MAX_TASKS_PER_SANDBOX: int = int(os.getenv("TRANSFORM_MAX_TASKS_PER_SANDBOX", "10000"))
+    TRANSFORM_KILL_GRACE_SECONDS: float = float(os.getenv("TRANSFORM_KILL_GRACE_SECONDS", "2"))
+    # How long a worker waits for a free sandbox on top of the transform timeout
+    TRANSFORM_QUEUE_WAIT_SECONDS: float = float(os.getenv("TRANSFORM_QUEUE_WAIT_SECONDS", "5"))
+    # Webhooks hitting limits this often within the window have transforms skipped for the penalty time
+    TRANSFORM_MAX_STRIKES: int = int(os.getenv("TRANSFORM_MAX_STRIKES", "5"))
+    TRANSFORM_STRIKE_WINDOW_SECONDS: int = int(os.getenv("TRANSFORM_STRIKE_WINDOW_SECONDS", "60"))
+    TRANSFORM_PENALTY_SECONDS: int = int(os.getenv("TRANSFORM_PENALTY_SECONDS", "300"))
+    
+    # Duplicate suppression: how long a webhook's dedup key values are remembered (per-webhook window overrides)
+    DEDUP_WINDOW_SECONDS: int = int(os.getenv("DEDUP_WINDOW_SECONDS", "86400"))
+    
+    # Ordered delivery: partitions per webhook bound the parallelism of an ordered webhook
+    ORDERED_PARTITIONS: int = int(os.getenv("ORDERED_PARTITIONS", "64"))
+    ORDERED_DRAIN_BATCH: int = int(os.getenv("ORDERED_DRAIN_BATCH", "50"))  # deliveries per job before yielding
+    ORDERED_LOCK_TTL: int = int(os.getenv("ORDERED_LOCK_TTL", "120"))
+    ORDERED_SWEEP_INTERVAL: int = int(os.getenv("ORDERED_SWEEP_INTERVAL", "30"))  # restart stalled partitions (0 = never)
+    
+    # Fair scheduling: per-tenant sub-queues dispatched into the ingest lane by deficit round-robin
+    FAIR_SCHEDULING: bool = os.getenv("FAIR_SCHEDULING", "False").lower() == "true"
+    FAIR_SCHEDULING_KEY: str = os.getenv("FAIR_SCHEDULING_KEY", "webhook")  # "webhook" or "user"
+    # Comma-separated tenant:weight pairs, e.g. "abc123:4,user:7:0.5"
+    FAIR_WEIGHTS: dict = {
+        k.strip(): float(w) for k, _, w in
+        (p.rpartition(":") for p in os.getenv("FAIR_WEIGHTS", "").split(",") if ":" in p)
+    }
+    FAIR_DEFAULT_WEIGHT: float = float(os.getenv("FAIR_DEFAULT_WEIGHT", "1"))
+    FAIR_QUANTUM: float = float(os.getenv("FAIR_QUANTUM", "1"))
+    FAIR_MAX_IN_FLIGHT: int = int(os.getenv("FAIR_MAX_IN_FLIGHT", "0"))  # per tenant, 0 = unlimited
+    FAIR_INFLIGHT_LEASE_SECONDS: float = float(os.getenv("FAIR_INFLIGHT_LEASE_SECONDS", "120"))
+    # Ingest lane depth the dispatcher keeps topped up; small keeps the FIFO from refilling
+    FAIR_DISPATCH_WINDOW: int = int(os.getenv("FAIR_DISPATCH_WINDOW", "8"))
+    FAIR_IDLE_SLEEP_MS: float = float(os.getenv("FAIR_IDLE_SLEEP_MS", "5"))
+    # Deliveries of one webhook dispatched (and transformed) together when it has a backlog
+    FAIR_BATCH_SIZE: int = int(os.getenv("FAIR_BATCH_SIZE", "20"))
+    
     # Application
     APP_HOST: str = os.getenv("APP_HOST", "0.0.0.0")
     APP_PORT: int = int(os.getenv("APP_PORT", "5000"))
@@ -28,8 +157,42 @@ class Settings:
     GOOGLE_CLIENT_SECRET: str = os.getenv("GOOGLE_CLIENT_SECRET", "")
     REDIRECT_URI: str = os.getenv("REDIRECT_URI", "http://localhost:5000/auth/callback")
     
+    # Live per-webhook metrics: Redis ring buffers of one-second and one-minute slots
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+    METRICS_SECONDS: int = int(os.getenv("METRICS_SECONDS", "120"))
+    METRICS_MINUTES: int = int(os.getenv("METRICS_MINUTES", "60"))
+    
+    # Rendered request lists kept per API process (invalidated by new-request events; 0 = off)
+    REQUEST_LIST_CACHE_SECONDS: float = float(os.getenv("REQUEST_LIST_CACHE_SECONDS", "10"))
+    REQUEST_LIST_CACHE_SIZE: int = int(os.getenv("REQUEST_LIST_CACHE_SIZE", "1000"))
+    
     # Data Retention
     WEBHOOK_RETENTION_DAYS: int = int(os.getenv("WEBHOOK_RETENTION_DAYS", "30"))
+    
+    # Cold storage (python -m app.core.archive, needs pyarrow): requests older than ARCHIVE_AFTER_DAYS
+    # move to Parquet files under ARCHIVE_DIR, one or more per webhook and day
+    ARCHIVE_ENABLED: bool = os.getenv("ARCHIVE_ENABLED", "False").lower() == "true"
+    ARCHIVE_DIR: str = os.getenv("ARCHIVE_DIR", "archive")
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+    ARCHIVE_INTERVAL: float = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+    ARCHIVE_BATCH_SIZE: int = int(os.getenv("ARCHIVE_BATCH_SIZE", "10000"))
+    ARCHIVE_COMPRESSION: str = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+    
+    # Admin (comma-separated emails allowed to use /admin endpoints)
+    ADMIN_EMAILS: list = [e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()]
+    
+    # Built static assets (python -m app.core.assets), served under /assets/
+    ASSET_DIR: str = os.getenv("ASSET_DIR", "static/build")
+    
+    # Profiling (all opt-in; thresholds of 0 disable)
+    PROFILE_OUTPUT_DIR: str = os.getenv("PROFILE_OUTPUT_DIR", "profiles")
+    PROFILE_SAMPLE_INTERVAL_MS: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+    PROFILE_SLOW_REQUEST_MS: float = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))
+    PROFILE_SLOW_JOB_MS: float = float(os.getenv("PROFILE_SLOW_JOB_MS", "0"))
+    PROFILE_SLOW_SAMPLE_RATE: float = float(os.getenv("PROFILE_SLOW_SAMPLE_RATE", "0.1"))
+    PROFILE_SQL: bool = os.getenv("PROFILE_SQL", "False").lower() == "true"
+    PROFILE_SLOW_SQL_MS: float = float(os.getenv("PROFILE_SLOW_SQL_MS", "10"))
+    PROFILE_SLOW_SQL_TOP_N: int = int(os.getenv("PROFILE_SLOW_SQL_TOP_N", "20"))
 
 
 settings = Settings()
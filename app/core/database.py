@@ -1,36 +1,42 @@
-from sqlalchemy import create_engine, event
+import itertools
+import logging
+import os
+import threading
+import time
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
 from .config import settings
 
-# Configure engine based on database type
-if settings.DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(
-        settings.DATABASE_URL,
-        connect_args={"check_same_thread": False, "timeout": 30},
-        echo=False
-    )
-    
-    @event.listens_for(engine, "connect")
-    def set_sqlite_pragma(dbapi_connection, connection_record):
-        cursor = dbapi_connection.cursor()
-        cursor.execute("PRAGMA journal_mode=WAL")
-        cursor.execute("PRAGMA busy_timeout=30000")
-        cursor.execute("PRAGMA synchronous=NORMAL")
-        cursor.close()
-
-elif settings.DATABASE_URL.startswith("mysql"):
-    engine = create_engine(
-        settings.DATABASE_URL,
-        pool_size=settings.DB_POOL_SIZE,
-        max_overflow=settings.DB_MAX_OVERFLOW,
-        pool_pre_ping=True,
-        pool_recycle=3600,
-        echo=False
-    )
+logger = logging.getLogger(__name__)
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """Tune a new SQLite connection for concurrent WAL access"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={settings.SQLITE_CACHE_SIZE}")
+    cursor.execute(f"PRAGMA wal_autocheckpoint={settings.SQLITE_WAL_AUTOCHECKPOINT}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
 
-else:  # PostgreSQL
-    engine = create_engine(
-        settings.DATABASE_URL,
+
+def create_db_engine(url: str):
+    """Create an engine configured for the database type in `url`"""
+    if url.startswith("sqlite"):
+        sqlite_engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000},
+            echo=False
+        )
+        event.listen(sqlite_engine, "connect", apply_sqlite_pragmas)
+        return sqlite_engine
+
+    # MySQL/MariaDB and PostgreSQL
+    return create_engine(
+        url,
         pool_size=settings.DB_POOL_SIZE,
         max_overflow=settings.DB_MAX_OVERFLOW,
         pool_pre_ping=True,
@@ -38,6 +44,9 @@ else:  # PostgreSQL
         echo=False
     )
 
+
+engine = create_db_engine(settings.DATABASE_URL)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -48,3 +57,135 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+class ReplicaRouter:
+    """
+    Round-robins read sessions over replicas whose replication lag is within bounds.
+    Lag is measured by one background thread per replica (started on first use in
+    each process), so picking a replica never waits on a lag query. A replica whose
+    last measurement is older than three check intervals, e.g. because the check
+    hangs, counts as lagging.
+    """
+
+    def __init__(self, engines):
+        self.engines = engines
+        self.session_factories = [sessionmaker(autocommit=False, autoflush=False, bind=e) for e in engines]
+        self._cycle = itertools.cycle(range(len(engines))) if engines else None
+        self._lag = {}
+        self._lock = threading.Lock()
+        self._checker_pid = None
+
+    def _measure_lag(self, replica_engine) -> float:
+        """Replication lag in seconds; infinity if the replica can't be queried"""
+        try:
+            with replica_engine.connect() as conn:
+                if replica_engine.dialect.name == "postgresql":
+                    lag = conn.execute(text(
+                        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                    )).scalar()
+                    return float(lag or 0)
+                if replica_engine.dialect.name == "mysql":
+                    try:
+                        row = conn.execute(text("SHOW REPLICA STATUS")).mappings().first()
+                    except Exception:
+                        row = conn.execute(text("SHOW SLAVE STATUS")).mappings().first()
+                    if row is None:
+                        return 0.0
+                    lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+                    return float("inf") if lag is None else float(lag)
+                return 0.0
+        except Exception as e:
+            logger.warning(f"Replica lag check failed for {replica_engine.url.host}: {e}")
+            return float("inf")
+
+    def _check_loop(self, index: int):
+        while True:
+            self._lag[index] = (time.monotonic(), self._measure_lag(self.engines[index]))
+            time.sleep(settings.REPLICA_LAG_CHECK_INTERVAL)
+
+    def _start_checkers(self):
+        # Threads don't survive fork, so each (uvicorn worker) process starts its own
+        with self._lock:
+            if self._checker_pid == os.getpid():
+                return
+            self._checker_pid = os.getpid()
+            self._lag.clear()
+            for index in range(len(self.engines)):
+                threading.Thread(target=self._check_loop, args=(index,), name=f"replica-lag-{index}", daemon=True).start()
+
+    def lag(self, index: int) -> float:
+        """Last measured lag; infinity before the first check or when checks have stalled"""
+        checked_at, lag = self._lag.get(index, (0.0, None))
+        if lag is None or time.monotonic() - checked_at > 3 * settings.REPLICA_LAG_CHECK_INTERVAL:
+            return float("inf")
+        return lag
+
+    def pick(self):
+        """Session factory of the next healthy replica, or None to use the primary"""
+        if not self.engines:
+            return None
+        if self._checker_pid != os.getpid():
+            self._start_checkers()
+        with self._lock:
+            indexes = [next(self._cycle) for _ in range(len(self.engines))]
+        for index in indexes:
+            if self.lag(index) <= settings.REPLICA_MAX_LAG_SECONDS:
+                return self.session_factories[index]
+        return None
+
+    def status(self) -> list:
+        return [
+            {"replica": e.url.render_as_string(hide_password=True), "lag_seconds": self._lag.get(i, (0, None))[1]}
+            for i, e in enumerate(self.engines)
+        ]
+
+
+# Read replicas are only meaningful for server databases
+replica_router = ReplicaRouter(
+    [] if settings.DATABASE_URL.startswith("sqlite")
+    else [create_db_engine(url) for url in settings.DATABASE_REPLICA_URLS]
+)
+
+
+# Shard N issues webhook_request ids from N * SHARD_ID_SPAN up (see app.core.sharding)
+SHARD_ID_SPAN = 1 << 40
+
+
+class ShardRouter:
+    """
+    Databases holding webhook_request rows: shard 0 is the primary, the rest
+    come from DATABASE_SHARD_URLS. Each shard issues request ids from its own
+    range, so a request id alone names its shard.
+    """
+
+    def __init__(self, engines):
+        self.engines = engines
+        self.session_factories = [sessionmaker(autocommit=False, autoflush=False, bind=e) for e in engines]
+
+    def __len__(self):
+        return len(self.engines)
+
+    def session(self, shard: int):
+        return self.session_factories[shard]()
+
+    def shard_for_request(self, request_id: int):
+        """Shard holding request `request_id`, or None if no configured shard issues that id"""
+        shard = int(request_id) // SHARD_ID_SPAN
+        return shard if 0 <= shard < len(self.engines) else None
+
+    def status(self) -> list:
+        return [{"shard": i, "database": e.url.render_as_string(hide_password=True)} for i, e in enumerate(self.engines)]
+
+
+shard_router = ShardRouter([engine, *[create_db_engine(url) for url in settings.DATABASE_SHARD_URLS]])
+
+
+def ReadSessionLocal(prefer_primary: bool = False):
+    """Session for read-only queries: a healthy replica if configured, otherwise the primary"""
+    if not prefer_primary:
+        factory = replica_router.pick()
+        if factory is not None:
+            return factory()
+    return SessionLocal()
@@ -0,0 +1,83 @@
+"""
+Duplicate suppression at ingest.
+
+Providers retry deliveries they think failed, and each retry would otherwise
+be stored and forwarded again. A webhook with a dedup key accepts each key
+value once per window:
+
+- header:<name>, json:<path> or query:<name> (e.g. header:X-GitHub-Delivery,
+  json:id for Stripe), or "body" for a hash of the raw body.
+- A delivery without the key is never treated as a duplicate.
+
+Seen values are Redis keys set with SET NX and the window as TTL, so checking
+costs one round trip and expiry needs no cleanup. A value is forgotten again
+when its delivery could not be queued or the worker could not store it. Values are hashed, so a key
+costs the same memory whatever the provider's ids look like.
+"""
+
+import hashlib
+
+from .config import settings
+from app.utils.keys import extract_key, parse_key_spec
+
+SEEN_KEY = "whook:dedup:{webhook_id}:{digest}"
+HITS_KEY = "whook:dedup:hits"
+
+
+def validate_spec(spec):
+    """Raise ValueError if a dedup key spec is invalid"""
+    if spec and spec.strip().lower() != "body":
+        parse_key_spec(spec)
+
+
+def dedup_value(spec, headers: dict, body: bytes, query_params: dict = None):
+    """Digest identifying this delivery, or None when the webhook has no dedup key or the value is missing"""
+    if not spec or not spec.strip():
+        return None
+    if spec.strip().lower() == "body":
+        value = body
+    else:
+        value = extract_key(spec, headers, body, query_params)
+        if value is None:
+            return None
+        value = value.encode("utf-8")
+    return hashlib.blake2b(value, digest_size=16).hexdigest()
+
+
+def claim(redis_conn, webhook, headers: dict, body: bytes, query_params: dict = None):
+    """
+    Record this delivery as seen. Returns (duplicate, release): duplicate is True
+    (and counted) when the value was already seen within the window; release()
+    forgets the value again, for when the delivery could not be queued.
+    """
+    digest = dedup_value(webhook.dedup_key, headers, body, query_params)
+    if digest is None:
+        return False, lambda: None
+    key = SEEN_KEY.format(webhook_id=webhook.id, digest=digest)
+    window = webhook.dedup_window or settings.DEDUP_WINDOW_SECONDS
+    if redis_conn.set(key, 1, nx=True, ex=window):
+        return False, lambda: redis_conn.delete(key)
+    redis_conn.hincrby(HITS_KEY, webhook.id, 1)
+    return True, lambda: None
+
+
+def release(redis_conn, webhook_id, spec, deliveries):
+    """
+    Forget the values of claimed deliveries that could not be stored, so the
+    provider's retry is accepted instead of answered as a duplicate.
+    `deliveries` is a list of (headers, body, query_params).
+    """
+    keys = [
+        SEEN_KEY.format(webhook_id=webhook_id, digest=digest)
+        for digest in (dedup_value(spec, headers, body, query_params) for headers, body, query_params in deliveries)
+        if digest is not None
+    ]
+    if keys:
+        redis_conn.delete(*keys)
+
+
+def dedup_hits(redis_conn, webhook_id=None):
+    """Suppressed duplicates for one webhook, or for all webhooks by id (decoded connection)"""
+    if webhook_id is not None:
+        return int(redis_conn.hget(HITS_KEY, webhook_id) or 0)
+    return {int(webhook): int(hits) for webhook, hits in redis_conn.hgetall(HITS_KEY).items()}
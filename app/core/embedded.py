@@ -0,0 +1,188 @@
+"""
+Embedded queue mode for single-node installs (QUEUE_MODE=embedded).
+
+Instead of an RQ job per delivery (serialize, Redis write, Redis read, fork),
+handle_webhook puts deliveries on a bounded asyncio queue in the web process:
+
+- Consumer tasks take whatever is queued (up to EMBEDDED_BATCH_SIZE, waiting
+  EMBEDDED_LINGER_MS for more) and store and transform each webhook's share
+  in one store_requests call on a thread pool, the same code the RQ worker runs.
+- Forwards go out through one async HTTP client, at most
+  EMBEDDED_FORWARD_CONCURRENCY at a time, retried with FORWARD_RETRY_DELAYS.
+- New-request notifications are broadcast to WebSocket clients directly.
+
+Queued deliveries and pending retries live in memory: they are lost if the
+process dies (a clean shutdown drains the queue first). A full queue answers
+503 so providers retry later. Ordered delivery, fair scheduling, batched
+forwarding and the disk spool need the RQ mode; here every delivery is
+forwarded on its own.
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from . import sinks
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def embedded_enabled() -> bool:
+    return settings.QUEUE_MODE == "embedded"
+
+
+class EmbeddedQueue:
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=settings.EMBEDDED_QUEUE_SIZE)
+        self.executor = ThreadPoolExecutor(settings.EMBEDDED_THREADS, thread_name_prefix="whook-embedded")
+        self.forward_slots = asyncio.Semaphore(settings.EMBEDDED_FORWARD_CONCURRENCY)
+        self.consumers = []
+        self.tasks = set()  # forwards, retries and broadcasts in flight
+        self.client = None
+        self.broadcast = None
+        self.loop = None
+        self.counters = {'accepted': 0, 'rejected': 0, 'stored': 0, 'batches': 0,
+                         'forwarded': 0, 'retried': 0, 'failed': 0}
+
+    async def start(self, broadcast):
+        """Start the consumers; `broadcast` is an async function sending a notification to WebSocket clients"""
+        import httpx
+
+        self.loop = asyncio.get_running_loop()
+        self.broadcast = broadcast
+        self.client = httpx.AsyncClient(timeout=10)
+        self.consumers = [asyncio.create_task(self._consume()) for _ in range(settings.EMBEDDED_CONSUMERS)]
+
+    async def stop(self, timeout: float = 10):
+        """Drain the queue and in-flight forwards (up to `timeout` each), then stop"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Embedded queue stopped with {self.queue.qsize()} deliveries still queued")
+        for consumer in self.consumers:
+            consumer.cancel()
+        if self.tasks:
+            await asyncio.wait(self.tasks, timeout=timeout)
+        await self.client.aclose()
+        self.executor.shutdown(wait=False)
+
+    def submit(self, webhook_id, headers, body, query_params) -> bool:
+        """Queue a delivery; False when the queue is full"""
+        try:
+            self.queue.put_nowait((webhook_id, headers, body, query_params))
+        except asyncio.QueueFull:
+            self.counters['rejected'] += 1
+            return False
+        self.counters['accepted'] += 1
+        return True
+
+    def replay(self, request_id):
+        """Forward a stored request to its webhook's destinations again"""
+        self._spawn(self._replay(request_id))
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            'depth': self.queue.qsize(),
+            'capacity': self.queue.maxsize,
+            'in_flight': len(self.tasks),
+        }
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _consume(self):
+        while True:
+            batch = [await self.queue.get()]
+            if settings.EMBEDDED_LINGER_MS and self.queue.qsize() < settings.EMBEDDED_BATCH_SIZE - 1:
+                await asyncio.sleep(settings.EMBEDDED_LINGER_MS / 1000)
+            while len(batch) < settings.EMBEDDED_BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self._process(batch)
+            except Exception as e:
+                logger.error(f"Embedded batch failed: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _process(self, batch):
+        by_webhook = {}
+        for webhook_id, headers, body, query_params in batch:
+            by_webhook.setdefault(webhook_id, []).append((headers, body, query_params))
+        self.counters['batches'] += 1
+        await asyncio.gather(*(self._store(webhook_id, deliveries) for webhook_id, deliveries in by_webhook.items()))
+
+    async def _store(self, webhook_id, deliveries):
+        import worker
+
+        try:
+            stored = await self.loop.run_in_executor(self.executor, functools.partial(
+                worker.store_requests, webhook_id, deliveries, notify=self._notify, record_routing=False
+            ))
+        except Exception:
+            await self.loop.run_in_executor(self.executor, worker.release_dedup, webhook_id, deliveries)
+            raise
+        if stored is None:
+            return
+        self.counters['stored'] += len(deliveries)
+        _, destination_urls, transformed_bodies, _ = stored
+        for (headers, _, _), urls, body in zip(deliveries, destination_urls, transformed_bodies):
+            for url in urls:
+                self._spawn(self.forward(url, body, headers))
+
+    def _notify(self, notification):
+        """Called on a store thread: hand the notification to the event loop"""
+        self.loop.call_soon_threadsafe(self._spawn, self.broadcast(notification))
+
+    async def _replay(self, request_id):
+        import worker
+
+        prepared = await self.loop.run_in_executor(self.executor, functools.partial(
+            worker.prepare_replay, request_id, record_routing=False
+        ))
+        if prepared is None:
+            return
+        destination_urls, body, headers, _ = prepared
+        for url in destination_urls:
+            self._spawn(self.forward(url, body, headers))
+
+    async def forward(self, url, body, headers, attempt=0):
+        """Forward one delivery, retrying connection errors, 5xx/429 and sink errors with backoff"""
+        import httpx
+        import worker
+
+        async with self.forward_slots:
+            try:
+                if sinks.is_sink(url):
+                    await self.loop.run_in_executor(self.executor, lambda: sinks.get_sink(url).write([body]))
+                    error = None
+                else:
+                    resp = await self.client.post(url, content=body, headers=worker.forward_headers(headers))
+                    error = f"HTTP {resp.status_code}" if worker.is_retryable(resp.status_code) else None
+            except (httpx.HTTPError, sinks.SinkError) as e:
+                error = str(e) or type(e).__name__
+        if error is None:
+            self.counters['forwarded'] += 1
+            return
+        if attempt >= settings.FORWARD_MAX_RETRIES:
+            logger.error(f"Forward gave up after {attempt + 1} attempts: {url} - {error}")
+            self.counters['failed'] += 1
+            return
+        self.counters['retried'] += 1
+        await asyncio.sleep(worker.retry_delay(attempt))
+        await self.forward(url, body, headers, attempt + 1)
+
+
+_queue = None
+
+
+def get_queue() -> EmbeddedQueue:
+    global _queue
+    if _queue is None:
+        _queue = EmbeddedQueue()
+    return _queue
@@ -0,0 +1,241 @@
+"""
+Fair scheduling of ingest work across webhooks (or users).
+
+With FAIR_SCHEDULING=True, handle_webhook appends each delivery to a per-tenant
+Redis list instead of the shared ingest queue. A single dispatcher process
+moves work from those lists into the ingest lane using deficit round-robin:
+each tenant earns FAIR_QUANTUM x weight credits per round and spends one per
+delivery, subject to a per-tenant in-flight cap. The dispatcher keeps the
+ingest lane only a few jobs deep, so a burst from one tenant waits in its own
+list instead of ahead of everyone else. Up to FAIR_BATCH_SIZE consecutive
+deliveries of one webhook are dispatched as a single job.
+
+Run with: python -m app.core.fair_scheduler
+"""
+
+import argparse
+import logging
+import signal
+import time
+import uuid
+
+from .config import settings
+from .serialization import dumps, loads, encode_bytes, decode_bytes
+
+logger = logging.getLogger(__name__)
+
+TENANT_QUEUE_KEY = "whook:fair:q:{tenant}"
+ACTIVE_KEY = "whook:fair:active"
+INFLIGHT_KEY = "whook:fair:inflight:{tenant}"
+DISPATCHER_LOCK_KEY = "whook:fair:dispatcher"
+
+# Pop one item and drop the tenant from the active set once its list is empty
+POP_SCRIPT = """
+local item = redis.call('LPOP', KEYS[1])
+if redis.call('LLEN', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[2], ARGV[1])
+end
+return item
+"""
+
+
+def fair_scheduling_enabled() -> bool:
+    return settings.FAIR_SCHEDULING
+
+
+def tenant_for(webhook) -> str:
+    """Scheduling tenant of a webhook: its URL path, or its owner's user id"""
+    if settings.FAIR_SCHEDULING_KEY == "user":
+        return f"user:{webhook.user_id}"
+    return f"webhook:{webhook.url}"
+
+
+def weight_for(tenant: str) -> float:
+    """Configured weight for a tenant (FAIR_WEIGHTS keys may omit the webhook:/user: prefix)"""
+    name = tenant.split(":", 1)[-1]
+    return settings.FAIR_WEIGHTS.get(tenant, settings.FAIR_WEIGHTS.get(name, settings.FAIR_DEFAULT_WEIGHT))
+
+
+def submit(redis_conn, tenant: str, webhook_id: int, headers: dict, body: bytes, query_params: dict):
+    """Queue a delivery on its tenant's list"""
+    payload = dumps({
+        'webhook_id': webhook_id,
+        'headers': headers,
+        'body': encode_bytes(body),
+        'query_params': query_params,
+    })
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.rpush(TENANT_QUEUE_KEY.format(tenant=tenant), payload)
+    pipe.sadd(ACTIVE_KEY, tenant)
+    pipe.execute()
+
+
+def release(redis_conn, tenant: str, *tokens: str):
+    """Called by the worker when dispatched deliveries finish"""
+    redis_conn.zrem(INFLIGHT_KEY.format(tenant=tenant), *tokens)
+
+
+class FairDispatcher:
+    """Deficit round-robin from tenant lists into the ingest lane"""
+
+    def __init__(self, redis_conn, ingest_queue):
+        self.redis = redis_conn
+        self.ingest_queue = ingest_queue
+        self.pop = redis_conn.register_script(POP_SCRIPT)
+        self.deficits = {}
+        self.order = []
+        self.running = False
+        self.dispatched = 0
+        self.lock_token = uuid.uuid4().hex
+
+    def stop(self, *args):
+        self.running = False
+
+    def in_flight(self, tenant: str) -> int:
+        """Deliveries of `tenant` currently queued or running (expired leases are dropped)"""
+        key = INFLIGHT_KEY.format(tenant=tenant)
+        self.redis.zremrangebyscore(key, 0, time.time())
+        return self.redis.zcard(key)
+
+    def refresh_tenants(self):
+        """Keep a stable round-robin order, adding new tenants at the end"""
+        active = self.redis.smembers(ACTIVE_KEY)
+        self.order = [t for t in self.order if t in active] + sorted(active - set(self.order))
+        for tenant in list(self.deficits):
+            if tenant not in active:
+                del self.deficits[tenant]
+
+    def window_open(self) -> bool:
+        return self.ingest_queue.count < settings.FAIR_DISPATCH_WINDOW
+
+    def dispatch_round(self) -> int:
+        """One DRR pass over all active tenants; returns deliveries dispatched"""
+        self.refresh_tenants()
+        dispatched = 0
+        cap = settings.FAIR_MAX_IN_FLIGHT
+        for tenant in self.order:
+            if not self.window_open():
+                break
+            deficit = self.deficits.get(tenant, 0.0) + settings.FAIR_QUANTUM * weight_for(tenant)
+            in_flight = self.in_flight(tenant) if cap else 0
+            queue_key = TENANT_QUEUE_KEY.format(tenant=tenant)
+
+            while deficit >= 1 and (not cap or in_flight < cap) and self.window_open():
+                item = self.pop(keys=[queue_key, ACTIVE_KEY], args=[tenant])
+                if item is None:
+                    deficit = 0.0
+                    break
+                batch = [loads(item)]
+                deficit -= 1
+                in_flight += 1
+                # Consecutive deliveries of the same webhook go out as one job, so the
+                # worker stores them together and runs the transform once for all of them.
+                # A batch may borrow credit; the tenant then sits out rounds until it is repaid.
+                while len(batch) < settings.FAIR_BATCH_SIZE and (not cap or in_flight < cap):
+                    head = self.redis.lindex(queue_key, 0)
+                    if head is None:
+                        break
+                    delivery = loads(head)
+                    if delivery['webhook_id'] != batch[0]['webhook_id']:
+                        break
+                    self.pop(keys=[queue_key, ACTIVE_KEY], args=[tenant])
+                    batch.append(delivery)
+                    deficit -= 1
+                    in_flight += 1
+                self.enqueue(tenant, batch)
+                dispatched += len(batch)
+
+            self.deficits[tenant] = deficit
+        self.dispatched += dispatched
+        return dispatched
+
+    def enqueue(self, tenant: str, batch: list):
+        lease_until = time.time() + settings.FAIR_INFLIGHT_LEASE_SECONDS
+        tokens = [uuid.uuid4().hex for _ in batch]
+        self.redis.zadd(INFLIGHT_KEY.format(tenant=tenant), {token: lease_until for token in tokens})
+        if len(batch) == 1:
+            delivery = batch[0]
+            self.ingest_queue.enqueue(
+                'worker.process_fair_delivery',
+                tenant,
+                tokens[0],
+                delivery['webhook_id'],
+                delivery['headers'],
+                decode_bytes(delivery['body']),
+                delivery['query_params'],
+                job_timeout=30,
+                result_ttl=3600
+            )
+            return
+        self.ingest_queue.enqueue(
+            'worker.process_fair_batch',
+            tenant,
+            tokens,
+            batch[0]['webhook_id'],
+            [(d['headers'], decode_bytes(d['body']), d['query_params']) for d in batch],
+            job_timeout=30 + len(batch),
+            result_ttl=3600
+        )
+
+    def hold_lock(self) -> bool:
+        """Only one dispatcher may run; the lock is a lease renewed every loop"""
+        if self.redis.set(DISPATCHER_LOCK_KEY, self.lock_token, nx=True, ex=10):
+            return True
+        if self.redis.get(DISPATCHER_LOCK_KEY) == self.lock_token:
+            self.redis.expire(DISPATCHER_LOCK_KEY, 10)
+            return True
+        return False
+
+    def run(self):
+        self.running = True
+        while self.running:
+            if not self.hold_lock():
+                time.sleep(1)
+                continue
+            try:
+                if not self.dispatch_round():
+                    time.sleep(settings.FAIR_IDLE_SLEEP_MS / 1000.0)
+            except Exception as e:
+                logger.error(f"Fair dispatch error: {e}")
+                time.sleep(1)
+        if self.redis.get(DISPATCHER_LOCK_KEY) == self.lock_token:
+            self.redis.delete(DISPATCHER_LOCK_KEY)
+
+
+def backlog(redis_conn) -> dict:
+    """Pending deliveries and in-flight count per active tenant"""
+    result = {}
+    for tenant in sorted(redis_conn.smembers(ACTIVE_KEY)):
+        result[tenant] = {
+            'pending': redis_conn.llen(TENANT_QUEUE_KEY.format(tenant=tenant)),
+            'in_flight': redis_conn.zcard(INFLIGHT_KEY.format(tenant=tenant)),
+            'weight': weight_for(tenant),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Whook fair scheduling dispatcher')
+    parser.add_argument('--if-enabled', action='store_true', help='Exit quietly unless FAIR_SCHEDULING=True')
+    args = parser.parse_args()
+
+    if not fair_scheduling_enabled():
+        if args.if_enabled:
+            return 0
+        print("Fair dispatcher requires FAIR_SCHEDULING=True")
+        return 1
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+    from .redis_client import redis_conn, queues
+
+    dispatcher = FairDispatcher(redis_conn, queues['ingest'])
+    signal.signal(signal.SIGTERM, dispatcher.stop)
+    signal.signal(signal.SIGINT, dispatcher.stop)
+    print(f"✅ Fair dispatcher started (key={settings.FAIR_SCHEDULING_KEY}, window={settings.FAIR_DISPATCH_WINDOW})")
+    dispatcher.run()
+    print(f"👋 Fair dispatcher stopped after {dispatcher.dispatched} deliveries")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
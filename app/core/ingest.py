@@ -0,0 +1,34 @@
+"""
+Queueing of accepted deliveries, shared by the webhook route and the spool drainer.
+"""
+
+from . import fair_scheduler, ordered
+
+
+def enqueue_delivery(webhook, headers, body, query_params, redis_conn, lane_queues):
+    """Queue one accepted delivery on its webhook's path; returns the RQ job id when there is one"""
+    if webhook.ordered_delivery:
+        # Stored and forwarded by the partition's drain job, in arrival order
+        ordered.submit(redis_conn, lane_queues['ordered'], webhook, headers, body, query_params)
+        return None
+    if fair_scheduler.fair_scheduling_enabled():
+        # The dispatcher moves it to the ingest lane in this tenant's turn
+        fair_scheduler.submit(
+            redis_conn,
+            fair_scheduler.tenant_for(webhook),
+            webhook.id,
+            headers,
+            body,
+            query_params
+        )
+        return None
+    job = lane_queues['ingest'].enqueue(
+        'worker.process_webhook_in_background',
+        webhook.id,
+        headers,
+        body,
+        query_params,
+        job_timeout=30,
+        result_ttl=3600
+    )
+    return job.id
@@ -0,0 +1,167 @@
+"""
+Live per-webhook traffic metrics in Redis ring buffers.
+
+Each webhook has two fixed-size ring buffers, Redis hashes of
+METRICS_SECONDS one-second slots (whook:metrics:{webhook_id}:s) and
+METRICS_MINUTES one-minute slots (whook:metrics:{webhook_id}:m). A slot holds
+one bucket's counters as "bucket,requests,bytes,forwarded,failed,<latency
+histogram>"; a write landing on a slot from an earlier lap resets it first.
+Recording an event updates both buffers with one Lua script call, so the
+worker adds a single round trip per store or forward.
+
+Stored requests and bytes are counted when the worker stores them. Forwards
+are counted per attempt: `forwarded` when the destination answered with a
+non-retryable status, `failed` on connection errors, 5xx/429 and sink errors.
+Latency percentiles come from the summed histograms (LATENCY_BOUNDS_MS) and
+report the upper bound of the percentile's bucket. Batched forwards and
+replays are not counted.
+
+Reading only touches Redis, so dashboards can poll without database load.
+"""
+
+import bisect
+import time
+
+from .config import settings
+
+SECONDS_KEY = "whook:metrics:{webhook_id}:s"
+MINUTES_KEY = "whook:metrics:{webhook_id}:m"
+
+COUNTERS = ('requests', 'bytes', 'forwarded', 'failed')
+# Forward latency histogram bucket upper bounds; one more bucket holds anything slower
+LATENCY_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+PERCENTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+
+RESOLUTIONS = ('second', 'minute')
+
+# KEYS: per-second ring, per-minute ring
+# ARGV: now (unix seconds), second slots, minute slots, ttl, then one increment per counter
+RECORD_SCRIPT = """
+local now = tonumber(ARGV[1])
+local width = #ARGV - 4
+local rings = {{KEYS[1], 1, tonumber(ARGV[2])}, {KEYS[2], 60, tonumber(ARGV[3])}}
+for _, ring in ipairs(rings) do
+    local bucket = math.floor(now / ring[2])
+    local slot = bucket % ring[3]
+    local counts = {}
+    local current = redis.call('HGET', ring[1], slot)
+    if current then
+        for value in string.gmatch(current, '[^,]+') do
+            counts[#counts + 1] = tonumber(value)
+        end
+    end
+    if counts[1] ~= bucket or #counts ~= width + 1 then
+        counts = {bucket}
+        for i = 1, width do
+            counts[i + 1] = 0
+        end
+    end
+    for i = 1, width do
+        counts[i + 1] = counts[i + 1] + tonumber(ARGV[i + 4])
+    end
+    redis.call('HSET', ring[1], slot, table.concat(counts, ','))
+    redis.call('EXPIRE', ring[1], tonumber(ARGV[4]))
+end
+return 1
+"""
+
+
+_record_script = None
+
+
+def _record(redis_conn):
+    """RECORD_SCRIPT, registered once; a Script runs on whichever client it is given"""
+    global _record_script
+    if _record_script is None:
+        _record_script = redis_conn.register_script(RECORD_SCRIPT)
+    return _record_script
+
+
+def metrics_enabled() -> bool:
+    # Embedded mode may run without Redis
+    return settings.METRICS_ENABLED and settings.QUEUE_MODE != "embedded"
+
+
+def record(redis_conn, webhook_id, requests: int = 0, body_bytes: int = 0, forwarded: int = 0, failed: int = 0,
+           latency_ms: float = None, now: float = None):
+    """Add to the current second and minute of a webhook's ring buffers"""
+    histogram = [0] * (len(LATENCY_BOUNDS_MS) + 1)
+    if latency_ms is not None:
+        histogram[bisect.bisect_left(LATENCY_BOUNDS_MS, latency_ms)] = 1
+    _record(redis_conn)(
+        client=redis_conn,
+        keys=[SECONDS_KEY.format(webhook_id=webhook_id), MINUTES_KEY.format(webhook_id=webhook_id)],
+        args=[
+            int(now if now is not None else time.time()),
+            settings.METRICS_SECONDS,
+            settings.METRICS_MINUTES,
+            settings.METRICS_MINUTES * 60,
+            requests, body_bytes, forwarded, failed, *histogram,
+        ]
+    )
+
+
+def _ring(resolution: str):
+    """(key template, seconds per slot, slots)"""
+    if resolution == 'minute':
+        return MINUTES_KEY, 60, settings.METRICS_MINUTES
+    return SECONDS_KEY, 1, settings.METRICS_SECONDS
+
+
+def _percentile(histogram, fraction):
+    total = sum(histogram)
+    if not total:
+        return None
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= fraction * total:
+            return LATENCY_BOUNDS_MS[min(index, len(LATENCY_BOUNDS_MS) - 1)]
+    return LATENCY_BOUNDS_MS[-1]
+
+
+def _series(raw: dict, first_bucket: int, size: int) -> dict:
+    """Counters per bucket (oldest first) from a ring buffer's slots, skipping stale ones"""
+    width = len(COUNTERS) + len(LATENCY_BOUNDS_MS) + 1
+    points = [[0] * width for _ in range(size)]
+    for value in raw.values():
+        if isinstance(value, bytes):
+            value = value.decode()
+        counts = [int(float(v)) for v in value.split(',')]
+        index = counts[0] - first_bucket
+        if 0 <= index < size and len(counts) == width + 1:
+            points[index] = counts[1:]
+
+    histograms = [point[len(COUNTERS):] for point in points]
+    window = [sum(column) for column in zip(*histograms)]
+    series = {name: [point[i] for point in points] for i, name in enumerate(COUNTERS)}
+    series['latency_ms'] = {
+        name: [_percentile(histogram, fraction) for histogram in histograms] for name, fraction in PERCENTILES
+    }
+    series['totals'] = {
+        **{name: sum(series[name]) for name in COUNTERS},
+        **{name: _percentile(window, fraction) for name, fraction in PERCENTILES},
+    }
+    return series
+
+
+def read_series(redis_conn, webhook_ids, resolution: str = 'second', now: float = None) -> dict:
+    """
+    Ring buffers of several webhooks in one round trip:
+    {'resolution', 'step', 'start', 'points', 'webhooks': {webhook_id: series}}
+    """
+    key, step, size = _ring(resolution)
+    current = int((now if now is not None else time.time()) // step)
+    first_bucket = current - size + 1
+    pipe = redis_conn.pipeline(transaction=False)
+    for webhook_id in webhook_ids:
+        pipe.hgetall(key.format(webhook_id=webhook_id))
+    return {
+        'resolution': resolution,
+        'step': step,
+        'start': first_bucket * step,
+        'points': size,
+        'webhooks': {
+            webhook_id: _series(raw, first_bucket, size) for webhook_id, raw in zip(webhook_ids, pipe.execute())
+        },
+    }
@@ -0,0 +1,104 @@
+"""
+Strictly ordered per-webhook delivery.
+
+Deliveries of webhooks with ordered_delivery enabled skip the shared ingest
+and forward lanes. Each webhook has its own ORDERED_PARTITIONS Redis lists,
+and its deliveries are hashed by ordering key onto one of them. Partitions
+never mix webhooks, so a delivery waiting on a retry holds up only later
+deliveries of its own webhook. Each partition has at most one drain job on
+the `ordered` lane, guarded by a lock key, which stores and forwards the
+partition's deliveries one at a time in arrival order. Different partitions
+drain in parallel, so throughput scales with the ordered-lane workers.
+Partitions with work are kept in a set, for the backlog report and for a
+sweep on the maintenance lane that restarts partitions whose drain job died
+(the lock expired with deliveries still queued).
+"""
+
+import zlib
+
+from .config import settings
+from .serialization import dumps, encode_bytes
+from app.utils.keys import extract_key
+
+PARTITION_KEY = "whook:ordered:p:{partition}"
+LOCK_KEY = "whook:ordered:lock:{partition}"
+ACTIVE_KEY = "whook:ordered:active"
+SWEEP_KEY = "whook:ordered:sweep"  # set while a sweep is queued for this interval
+
+# Release the partition lock only if nothing arrived since the last pop
+RELEASE_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) == 0 then
+    redis.call('DEL', KEYS[2])
+    redis.call('SREM', KEYS[3], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+def partition_for(webhook_id: int, key) -> str:
+    """Stable partition of a (webhook, ordering key) pair: '<webhook id>:<slot>'"""
+    slot = zlib.crc32((key or '').encode("utf-8")) % settings.ORDERED_PARTITIONS
+    return f"{webhook_id}:{slot}"
+
+
+def submit(redis_conn, ordered_queue, webhook, headers: dict, body: bytes, query_params: dict) -> str:
+    """Append a delivery to its partition and make sure a drain job is scheduled"""
+    key = extract_key(webhook.ordering_key, headers, body, query_params)
+    partition = partition_for(webhook.id, key)
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.rpush(PARTITION_KEY.format(partition=partition), dumps({
+        'webhook_id': webhook.id,
+        'headers': headers,
+        'body': encode_bytes(body),
+        'query_params': query_params,
+    }))
+    pipe.sadd(ACTIVE_KEY, partition)
+    pipe.execute()
+    schedule_drain(redis_conn, ordered_queue, partition)
+    return partition
+
+
+def schedule_drain(redis_conn, ordered_queue, partition) -> bool:
+    """Enqueue a drain job unless one already holds the partition"""
+    if redis_conn.set(LOCK_KEY.format(partition=partition), 1, nx=True, ex=settings.ORDERED_LOCK_TTL):
+        ordered_queue.enqueue('worker.drain_partition', partition, job_timeout=settings.ORDERED_LOCK_TTL, result_ttl=0)
+        return True
+    return False
+
+
+def hold(redis_conn, partition, seconds: float):
+    """Extend the partition lock while its drain job (or a delayed retry) is pending"""
+    redis_conn.expire(LOCK_KEY.format(partition=partition), int(seconds) + settings.ORDERED_LOCK_TTL)
+
+
+def release(redis_conn, partition) -> bool:
+    """Drop the lock if the partition is empty; False means more work arrived"""
+    script = redis_conn.register_script(RELEASE_SCRIPT)
+    keys = [PARTITION_KEY.format(partition=partition), LOCK_KEY.format(partition=partition), ACTIVE_KEY]
+    return bool(script(keys=keys, args=[partition]))
+
+
+def sweep(redis_conn, ordered_queue) -> int:
+    """Schedule a drain for every partition with deliveries but no lock; returns how many"""
+    scheduled = 0
+    for partition in redis_conn.smembers(ACTIVE_KEY):
+        partition = partition.decode() if isinstance(partition, bytes) else partition
+        if redis_conn.exists(LOCK_KEY.format(partition=partition)):
+            continue
+        if not redis_conn.llen(PARTITION_KEY.format(partition=partition)):
+            # Drained; only its set entry was left
+            release(redis_conn, partition)
+            continue
+        if schedule_drain(redis_conn, ordered_queue, partition):
+            scheduled += 1
+    return scheduled
+
+
+def backlog(redis_conn) -> dict:
+    """Pending deliveries per non-empty partition ("<webhook id>:<slot>")"""
+    partitions = sorted(redis_conn.smembers(ACTIVE_KEY))
+    pipe = redis_conn.pipeline(transaction=False)
+    for partition in partitions:
+        pipe.llen(PARTITION_KEY.format(partition=partition))
+    return {str(p): n for p, n in zip(partitions, pipe.execute()) if n}
@@ -1,13 +1,54 @@
+import time
+from datetime import timezone
 from redis import Redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
 from rq import Queue
+from rq.exceptions import NoSuchJobError
+from rq.job import Job
 from .config import settings
+from .serialization import QueueSerializer
+
+# Queue lanes, highest priority first. Workers of a lane also take work from
+# higher-priority lanes when their own lane is empty, never from lower ones.
+LANES = ['ingest', 'forward', 'ordered', 'retry', 'maintenance']
+
+LANE_WAIT_KEY = 'whook:lane:wait:{lane}'
+LANE_WAIT_SAMPLES = 1000
+
+
+def make_lane_queues(connection):
+    """One RQ queue per lane on the given (bytes) connection"""
+    return {lane: Queue(lane, connection=connection, serializer=QueueSerializer) for lane in LANES}
+
+
+def lane_listen_order(lane):
+    """Queues a worker of `lane` listens on: its own lane, then higher-priority lanes"""
+    index = LANES.index(lane)
+    return [lane] + LANES[:index][::-1]
+
 
 # Initialize Redis connection
 redis_conn = Redis.from_url(settings.REDIS_URL, decode_responses=True)
 
-# Initialize the queue (needs bytes for RQ)
+# Initialize the queues (needs bytes for RQ)
 queue_conn = Redis.from_url(settings.REDIS_URL, decode_responses=False)
-queue = Queue(connection=queue_conn)
+queues = make_lane_queues(queue_conn)
+queue = queues['ingest']
+
+# Connections handle_webhook queues on. With the disk spool on they time out
+# quickly and don't retry, so a stalled Redis sends deliveries to the spool
+# instead of holding up the response.
+if settings.SPOOL_ENABLED:
+    _ingest_options = dict(
+        socket_timeout=settings.SPOOL_REDIS_TIMEOUT_MS / 1000,
+        socket_connect_timeout=settings.SPOOL_REDIS_TIMEOUT_MS / 1000,
+        retry=Retry(NoBackoff(), 0),
+    )
+    ingest_conn = Redis.from_url(settings.REDIS_URL, decode_responses=True, **_ingest_options)
+    ingest_queues = make_lane_queues(Redis.from_url(settings.REDIS_URL, decode_responses=False, **_ingest_options))
+else:
+    ingest_conn, ingest_queues = redis_conn, queues
 
 # Redis pubsub for worker communication - subscribe lazily
 pubsub = None
@@ -19,3 +60,59 @@ def get_pubsub():
         pubsub = redis_conn.pubsub()
         pubsub.subscribe('webhook_events')
     return pubsub
+
+
+def get_async_pubsub():
+    """A new asyncio pubsub for this process's event loop (one per API worker process)"""
+    from redis.asyncio import Redis as AsyncRedis
+    return AsyncRedis.from_url(settings.REDIS_URL, decode_responses=True).pubsub()
+
+
+def job_age_seconds(enqueued_at):
+    """Seconds since an RQ timestamp (older RQ versions store naive UTC)"""
+    if enqueued_at.tzinfo is None:
+        enqueued_at = enqueued_at.replace(tzinfo=timezone.utc)
+    return time.time() - enqueued_at.timestamp()
+
+
+def record_lane_wait(connection, lane, wait_seconds):
+    """Keep a rolling window of queue wait times for a lane"""
+    key = LANE_WAIT_KEY.format(lane=lane)
+    pipe = connection.pipeline(transaction=False)
+    pipe.lpush(key, round(wait_seconds * 1000, 3))
+    pipe.ltrim(key, 0, LANE_WAIT_SAMPLES - 1)
+    pipe.execute()
+
+
+def oldest_job_wait(lane_queue):
+    """Seconds the job at the head of a queue has been waiting, or None when it is empty"""
+    head = lane_queue.get_job_ids(0, 1)
+    if not head:
+        return None
+    try:
+        job = Job.fetch(head[0], connection=lane_queue.connection, serializer=QueueSerializer)
+    except NoSuchJobError:
+        return None
+    return job_age_seconds(job.enqueued_at) if job.enqueued_at else None
+
+
+def lane_stats():
+    """Depth, oldest-job age and recent wait percentiles for every lane"""
+    stats = {}
+    for lane, lane_queue in queues.items():
+        depth = lane_queue.count
+        oldest_wait = oldest_job_wait(lane_queue)
+        if oldest_wait is not None:
+            oldest_wait = round(oldest_wait, 3)
+
+        waits = sorted(float(w) for w in redis_conn.lrange(LANE_WAIT_KEY.format(lane=lane), 0, -1))
+        stats[lane] = {
+            'depth': depth,
+            'started': lane_queue.started_job_registry.count,
+            'failed': lane_queue.failed_job_registry.count,
+            'oldest_wait_seconds': oldest_wait,
+            'wait_p50_ms': waits[len(waits) // 2] if waits else None,
+            'wait_p99_ms': waits[min(len(waits) - 1, int(len(waits) * 0.99))] if waits else None,
+            'workers': settings.WORKER_POOL_SIZES[lane],
+        }
+    return stats
@@ -0,0 +1,119 @@
+"""
+HTTP caching for request pages.
+
+Stored requests never change, so a request's detail response is cached by the
+browser for good: its URL carries the request's timestamp (?v=...), and a
+reused id gets a new URL. Rendered request lists (the webhook page and the
+list API) are kept per process for REQUEST_LIST_CACHE_SECONDS, keyed by user,
+so a repeat view skips the database, including the ownership check. Lists are
+served with a strong ETag (a hash of the body) and answered 304 when the
+browser's copy is current.
+
+A cached list is dropped when its webhook changes:
+
+- new-request events on webhook_events (the Redis listener, or the embedded
+  queue's broadcast) drop that webhook's lists in every API process;
+- deletes, settings changes and shard moves call publish_change, which drops
+  them here and publishes a change event for the other API processes.
+
+Lists read from a lagging replica right after an event may be cached stale;
+the TTL bounds that.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from .config import settings
+from .serialization import dumps
+
+CHANGE_EVENT = 'webhook_requests_changed'
+# Request detail responses: the URL changes if the content could
+IMMUTABLE = "private, max-age=31536000, immutable"
+# Lists: browsers keep a copy but ask (If-None-Match) before using it
+REVALIDATE = "private, no-cache"
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    """Whether an If-None-Match header names `etag` (weak comparison, as RFC 9110 asks for GET)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+class ListCache:
+    """LRU of (expires at, body, etag) per key, with each key belonging to one webhook"""
+
+    def __init__(self, ttl: float, size: int):
+        self.ttl = ttl
+        self.size = size
+        self.entries = OrderedDict()
+        self.by_webhook = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """(body, etag), or None if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            webhook_id, expires, body, etag = entry
+            if time.monotonic() >= expires:
+                self._drop(key)
+                return None
+            self.entries.move_to_end(key)
+            return body, etag
+
+    def put(self, key, webhook_id, body: bytes) -> str:
+        """Cache `body` under `key`; returns its ETag"""
+        etag = etag_for(body)
+        if self.ttl <= 0 or self.size <= 0:
+            return etag
+        with self.lock:
+            self._drop(key)
+            self.entries[key] = (webhook_id, time.monotonic() + self.ttl, body, etag)
+            self.by_webhook.setdefault(webhook_id, set()).add(key)
+            while len(self.entries) > self.size:
+                self._drop(next(iter(self.entries)))
+        return etag
+
+    def invalidate(self, webhook_id):
+        with self.lock:
+            for key in list(self.by_webhook.get(webhook_id, ())):
+                self._drop(key)
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            keys = self.by_webhook.get(entry[0])
+            keys.discard(key)
+            if not keys:
+                del self.by_webhook[entry[0]]
+
+
+list_cache = ListCache(settings.REQUEST_LIST_CACHE_SECONDS, settings.REQUEST_LIST_CACHE_SIZE)
+
+
+def handle_event(event: dict):
+    """Drop cached lists an event on webhook_events makes stale"""
+    if event.get('type') in ('new_webhook_request', CHANGE_EVENT):
+        list_cache.invalidate(event.get('webhook_id'))
+
+
+def publish_change(redis_conn, webhook_id):
+    """A webhook's requests or settings changed: drop its cached lists in every API process"""
+    list_cache.invalidate(webhook_id)
+    if settings.QUEUE_MODE == "embedded":
+        return
+    try:
+        redis_conn.publish('webhook_events', dumps({'type': CHANGE_EVENT, 'webhook_id': webhook_id}))
+    except Exception:
+        # Other processes' copies expire within REQUEST_LIST_CACHE_SECONDS
+        pass
@@ -0,0 +1,231 @@
+"""
+Content-based routing of deliveries to destinations.
+
+A Destination may carry routing rules (JSON). Without rules it receives
+every delivery, as before:
+
+    {
+        "match": "all",
+        "conditions": [
+            {"key": "header:X-GitHub-Event", "op": "in", "value": ["push", "release"]},
+            {"key": "json:repository.private", "op": "eq", "value": false}
+        ],
+        "sample": 25
+    }
+
+- `key` uses the same specs as ordering keys: header:<name>, json:<path>,
+  query:<name>. Header and query values are strings; JSON values keep their type.
+- `op` is one of eq, ne, in, not_in, contains, exists, missing, gt, gte, lt,
+  lte or regex.
+- `match` is "all" (default) or "any".
+- `sample` forwards only that percentage of matching deliveries. The choice
+  is a hash of the body, so a redelivered payload is sampled the same way.
+
+Rules are compiled once per webhook into a RouteIndex. The worker consults it
+before enqueuing forwards, so a filtered delivery never costs a forward job.
+"""
+
+import re
+import zlib
+from functools import lru_cache
+
+from .serialization import loads
+from app.utils.keys import json_path, parse_key_spec
+
+MATCHED_KEY = "whook:routing:matched:{webhook_id}"
+SKIPPED_KEY = "whook:routing:skipped:{webhook_id}"
+
+MISSING = object()
+
+COMPARISONS = {
+    "eq": lambda value, expected: value == expected,
+    "ne": lambda value, expected: value != expected,
+    "in": lambda value, expected: value in expected,
+    "not_in": lambda value, expected: value not in expected,
+    "contains": lambda value, expected: expected in value,
+    "gt": lambda value, expected: value > expected,
+    "gte": lambda value, expected: value >= expected,
+    "lt": lambda value, expected: value < expected,
+    "lte": lambda value, expected: value <= expected,
+}
+
+
+def _compile_condition(condition):
+    """Compile one condition into (check(headers, data, query_params), needs_json)"""
+    if not isinstance(condition, dict):
+        raise ValueError(f"Condition must be an object, got {condition!r}")
+    source, name = parse_key_spec(condition.get("key"))
+    if source is None:
+        raise ValueError("Condition needs a 'key' (header:<name>, json:<path> or query:<name>)")
+    op = condition.get("op", "exists")
+
+    if source == "header":
+        lowered = name.lower()
+
+        def get(headers, data, query_params):
+            for header, value in headers.items():
+                if header.lower() == lowered:
+                    return value
+            return MISSING
+    elif source == "query":
+        def get(headers, data, query_params):
+            value = query_params.get(name)
+            return MISSING if value is None else str(value)
+    else:
+        def get(headers, data, query_params):
+            value = json_path(data, name) if data is not None else None
+            return MISSING if value is None else value
+
+    needs_json = source == "json"
+    if op == "exists":
+        return (lambda *args: get(*args) is not MISSING), needs_json
+    if op == "missing":
+        return (lambda *args: get(*args) is MISSING), needs_json
+    if "value" not in condition:
+        raise ValueError(f"Op '{op}' needs a 'value'")
+    expected = condition["value"]
+    if op == "regex":
+        try:
+            pattern = re.compile(expected)
+        except (re.error, TypeError) as e:
+            raise ValueError(f"Invalid regex {expected!r}: {e}")
+        compare = lambda value, _: pattern.search(value if isinstance(value, str) else str(value)) is not None
+    elif op in COMPARISONS:
+        if op in ("in", "not_in") and not isinstance(expected, list):
+            raise ValueError(f"Op '{op}' needs a list value")
+        compare = COMPARISONS[op]
+    else:
+        raise ValueError(f"Unknown op '{op}' (use {', '.join(sorted([*COMPARISONS, 'exists', 'missing', 'regex']))})")
+
+    def check(*args):
+        value = get(*args)
+        if value is MISSING:
+            return False
+        try:
+            return bool(compare(value, expected))
+        except TypeError:
+            return False
+
+    return check, needs_json
+
+
+class Rule:
+    """Compiled routing rules of one destination"""
+
+    def __init__(self, url: str, rules):
+        if isinstance(rules, (str, bytes)):
+            try:
+                rules = loads(rules)
+            except ValueError as e:
+                raise ValueError(f"Routing rules are not valid JSON: {e}")
+        if not isinstance(rules, dict):
+            raise ValueError("Routing rules must be a JSON object")
+        unknown = set(rules) - {"match", "conditions", "sample"}
+        if unknown:
+            raise ValueError(f"Unknown routing keys: {', '.join(sorted(unknown))}")
+
+        match = rules.get("match", "all")
+        if match not in ("all", "any"):
+            raise ValueError("'match' must be 'all' or 'any'")
+        conditions = rules.get("conditions", [])
+        if not isinstance(conditions, list):
+            raise ValueError("'conditions' must be a list")
+        compiled = [_compile_condition(condition) for condition in conditions]
+        sample = rules.get("sample", 100)
+        if isinstance(sample, bool) or not isinstance(sample, (int, float)) or not 0 <= sample <= 100:
+            raise ValueError("'sample' must be a percentage between 0 and 100")
+
+        self.url = url
+        self.checks = tuple(check for check, _ in compiled)
+        self.needs_json = any(needs_json for _, needs_json in compiled)
+        self.combine = all if match == "all" else any
+        self.sample_threshold = int(sample * 100)
+        self.salt = zlib.crc32(url.encode("utf-8"))
+
+    def matches(self, headers: dict, data, query_params: dict, body: bytes) -> bool:
+        if self.checks and not self.combine(check(headers, data, query_params) for check in self.checks):
+            return False
+        if self.sample_threshold >= 10000:
+            return True
+        return zlib.crc32(body, self.salt) % 10000 < self.sample_threshold
+
+
+def validate_rules(rules):
+    """Raise ValueError if a destination's routing rules are invalid"""
+    Rule("", rules)
+
+
+class RouteIndex:
+    """A webhook's destinations with their compiled rules"""
+
+    def __init__(self, routes):
+        self.routes = tuple((url, Rule(url, rules) if rules and rules.strip() else None) for url, rules in routes)
+        self.urls = [url for url, _ in self.routes]
+        self.has_rules = any(rule is not None for _, rule in self.routes)
+        self.needs_json = any(rule.needs_json for _, rule in self.routes if rule is not None)
+
+    def select(self, headers: dict, body: bytes, query_params: dict = None):
+        """Destination URLs this delivery goes to, plus (matched, skipped) URLs of ruled destinations"""
+        if not self.has_rules:
+            return self.urls, [], []
+        data = None
+        if self.needs_json:
+            try:
+                data = loads(body)
+            except ValueError:
+                data = None
+        headers, query_params = headers or {}, query_params or {}
+        selected, matched, skipped = [], [], []
+        for url, rule in self.routes:
+            if rule is None:
+                selected.append(url)
+            elif rule.matches(headers, data, query_params, body):
+                selected.append(url)
+                matched.append(url)
+            else:
+                skipped.append(url)
+        return selected, matched, skipped
+
+
+@lru_cache(maxsize=256)
+def route_index(routes: tuple) -> RouteIndex:
+    """
+    Compiled index for ((url, rules_json), ...). Destinations with invalid rules
+    (saved before validation existed) are treated as having none.
+    """
+    try:
+        return RouteIndex(routes)
+    except ValueError:
+        return RouteIndex(tuple((url, rules if _valid(rules) else None) for url, rules in routes))
+
+
+def _valid(rules) -> bool:
+    if not rules or not rules.strip():
+        return True
+    try:
+        validate_rules(rules)
+        return True
+    except ValueError:
+        return False
+
+
+def record(redis_conn, webhook_id, matched: list, skipped: list):
+    """Count matched and skipped deliveries per ruled destination"""
+    if not matched and not skipped:
+        return
+    pipe = redis_conn.pipeline(transaction=False)
+    for url in matched:
+        pipe.hincrby(MATCHED_KEY.format(webhook_id=webhook_id), url, 1)
+    for url in skipped:
+        pipe.hincrby(SKIPPED_KEY.format(webhook_id=webhook_id), url, 1)
+    pipe.execute()
+
+
+def routing_stats(redis_conn, webhook_id) -> dict:
+    """Matched/skipped counters per destination URL (decoded connection)"""
+    matched = redis_conn.hgetall(MATCHED_KEY.format(webhook_id=webhook_id))
+    skipped = redis_conn.hgetall(SKIPPED_KEY.format(webhook_id=webhook_id))
+    return {
+        url: {'matched': int(matched.get(url, 0)), 'skipped': int(skipped.get(url, 0))}
+        for url in sorted(set(matched) | set(skipped))
+    }
@@ -0,0 +1,88 @@
+"""
+One place for (de)serialization across the pipeline.
+
+- JSON (stored headers/query params, Redis payloads, API responses) uses
+  orjson when installed, the stdlib json module otherwise.
+- RQ job payloads use msgpack via QueueSerializer instead of pickle. Payloads
+  msgpack can't represent fall back to pickle; the first byte tells them apart,
+  so jobs queued before the switch still load.
+"""
+
+import base64
+import json
+import pickle
+
+from starlette.responses import JSONResponse as StarletteJSONResponse
+
+from .config import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional speedup
+    msgpack = None
+
+MSGPACK_MARKER = b"\x00"
+
+
+def dumps_bytes(obj) -> bytes:
+    """Compact UTF-8 JSON"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            pass  # e.g. integers beyond 64 bits, which the stdlib encoder accepts
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def dumps(obj) -> str:
+    """Compact JSON text (for Text columns and decoded Redis connections)"""
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def loads(data):
+    """Parse JSON from str or bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encode_bytes(data: bytes) -> str:
+    """Bytes as base64 text, for binary bodies inside JSON payloads"""
+    return base64.b64encode(data).decode("ascii")
+
+
+def decode_bytes(text: str) -> bytes:
+    return base64.b64decode(text)
+
+
+class JSONResponse(StarletteJSONResponse):
+    """JSONResponse rendered with the fast encoder"""
+
+    def render(self, content) -> bytes:
+        return dumps_bytes(content)
+
+
+class QueueSerializer:
+    """RQ serializer: msgpack for plain data, pickle for anything else"""
+
+    @staticmethod
+    def dumps(obj) -> bytes:
+        if msgpack is not None and settings.QUEUE_SERIALIZER == "msgpack":
+            try:
+                return MSGPACK_MARKER + msgpack.packb(obj, use_bin_type=True)
+            except (TypeError, ValueError, OverflowError):
+                pass
+        return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def loads(data: bytes):
+        if data[:1] == MSGPACK_MARKER:
+            if msgpack is None:
+                raise RuntimeError("msgpack is required to load this job")
+            return msgpack.unpackb(data[1:], raw=False, strict_map_key=False)
+        return pickle.loads(data)
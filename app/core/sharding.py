@@ -0,0 +1,338 @@
+"""
+Horizontal sharding of webhook_request storage.
+
+DATABASE_URL (shard 0) keeps users, webhooks and destinations. Each URL in
+DATABASE_SHARD_URLS adds a database holding only a webhook_request table:
+
+- Every webhook records its shard. New webhooks are placed by webhook id or
+  user id (SHARD_KEY) modulo the number of shards; existing webhooks stay on
+  shard 0 until moved.
+- Shard N issues request ids from N * SHARD_ID_SPAN up, so a request id alone
+  names its shard (app.core.database.ShardRouter.shard_for_request).
+- The worker writes and the routes read through the webhook's shard.
+
+Moving a webhook (python -m app.core.sharding move <webhook> <shard>) is
+online. New deliveries go to the target shard straight away, and reads cover
+both shards until the move finishes. Stored requests are copied in batches of
+SHARD_MOVE_BATCH_SIZE and then deleted from the source. Moved requests get
+new ids in the target shard's range. An interrupted move resumes when run
+again. A batch interrupted between its copy and its delete can be copied
+twice.
+
+Run with: python -m app.core.sharding status|init|move
+"""
+
+import argparse
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import BigInteger, Column, Index, Integer, MetaData, Table, func, inspect, text
+
+from .config import settings
+from .database import SHARD_ID_SPAN, shard_router
+
+
+def sharding_enabled() -> bool:
+    return bool(settings.DATABASE_SHARD_URLS)
+
+
+def shard_of(webhook) -> int:
+    """Shard new requests of `webhook` are written to"""
+    return webhook.shard or 0
+
+
+def read_shards(webhook) -> list:
+    """Shards holding requests of `webhook`: two while it is being moved"""
+    shards = [shard_of(webhook)]
+    if webhook.previous_shard is not None and webhook.previous_shard not in shards:
+        shards.append(webhook.previous_shard)
+    return shards
+
+
+def assign_shard(webhook, router=shard_router) -> int:
+    """Shard for a new webhook (its id must be assigned, i.e. flushed, first)"""
+    key = webhook.user_id if settings.SHARD_KEY == "user" else webhook.id
+    return key % len(router)
+
+
+def shard_table(metadata: MetaData) -> Table:
+    """webhook_request as created on shards 1+: no foreign key to webhook, 64-bit ids"""
+    from app.models import WebhookRequest
+
+    source = WebhookRequest.__table__
+    return Table(
+        source.name,
+        metadata,
+        Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+        *[
+            Column(column.name, column.type, nullable=column.nullable, index=column.index)
+            for column in source.columns if column.name != "id"
+        ],
+        Index('idx_webhook_timestamp', 'webhook_id', 'timestamp'),
+        sqlite_autoincrement=True
+    )
+
+
+def reserve_id_range(shard_engine, shard: int):
+    """Start a new shard's request ids at shard * SHARD_ID_SPAN"""
+    start = shard * SHARD_ID_SPAN
+    with shard_engine.begin() as conn:
+        dialect = shard_engine.dialect.name
+        if dialect == "sqlite":
+            conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'webhook_request'"))
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('webhook_request', :seq)"), {"seq": start - 1})
+        elif dialect == "postgresql":
+            conn.execute(text("SELECT setval(pg_get_serial_sequence('webhook_request', 'id'), :start, false)"), {"start": start})
+        elif dialect in ("mysql", "mariadb"):
+            conn.execute(text(f"ALTER TABLE webhook_request AUTO_INCREMENT = {start}"))
+        else:
+            raise ValueError(f"Sharding does not support {dialect} databases")
+
+
+def init_shards(router=shard_router) -> list:
+    """Create webhook_request on every extra shard that lacks it; returns the shards created"""
+    created = []
+    for shard in range(1, len(router)):
+        shard_engine = router.engines[shard]
+        if inspect(shard_engine).has_table("webhook_request"):
+            continue
+        metadata = MetaData()
+        shard_table(metadata)
+        metadata.create_all(bind=shard_engine)
+        reserve_id_range(shard_engine, shard)
+        created.append(shard)
+    return created
+
+
+@contextmanager
+def request_sessions(webhook, primary_session, router=shard_router):
+    """
+    Sessions to read `webhook`'s requests from. Shard 0 uses `primary_session`
+    (which may be a replica session); other shards get sessions closed on exit.
+    """
+    opened = []
+    try:
+        sessions = []
+        for shard in read_shards(webhook):
+            if shard == 0:
+                sessions.append(primary_session)
+            else:
+                opened.append(router.session(shard))
+                sessions.append(opened[-1])
+        yield sessions
+    finally:
+        for session in opened:
+            session.close()
+
+
+def count_requests(sessions, webhook_id) -> int:
+    from app.models import WebhookRequest
+
+    return sum(
+        session.query(WebhookRequest).filter(WebhookRequest.webhook_id == webhook_id).count()
+        for session in sessions
+    )
+
+
+def recent_requests(sessions, webhook_id, offset: int = 0, limit: int = 100) -> list:
+    """Newest requests first across `sessions`"""
+    from app.models import WebhookRequest
+
+    def newest(session, skip, count):
+        return session.query(WebhookRequest)\
+            .filter(WebhookRequest.webhook_id == webhook_id)\
+            .order_by(WebhookRequest.timestamp.desc())\
+            .offset(skip)\
+            .limit(count)\
+            .all()
+
+    if len(sessions) == 1:
+        return newest(sessions[0], offset, limit)
+    merged = [row for session in sessions for row in newest(session, 0, offset + limit)]
+    merged.sort(key=lambda row: row.timestamp, reverse=True)
+    return merged[offset:offset + limit]
+
+
+def last_request_time(sessions, webhook_id):
+    from app.models import WebhookRequest
+
+    times = [
+        session.query(func.max(WebhookRequest.timestamp)).filter(WebhookRequest.webhook_id == webhook_id).scalar()
+        for session in sessions
+    ]
+    return max((t for t in times if t is not None), default=None)
+
+
+def delete_requests(webhook, primary_session, router=shard_router) -> int:
+    """
+    Delete every stored request of `webhook`. Rows on other shards are committed
+    here; rows on shard 0 go with `primary_session`'s next commit.
+    """
+    from app.models import WebhookRequest
+
+    deleted = 0
+    for shard in read_shards(webhook):
+        session = primary_session if shard == 0 else router.session(shard)
+        try:
+            deleted += session.query(WebhookRequest)\
+                .filter(WebhookRequest.webhook_id == webhook.id)\
+                .delete(synchronize_session=False)
+            if session is not primary_session:
+                session.commit()
+        finally:
+            if session is not primary_session:
+                session.close()
+    return deleted
+
+
+def shard_counts(router=shard_router) -> list:
+    """Stored requests per shard"""
+    from app.models import WebhookRequest
+
+    counts = []
+    for shard in range(len(router)):
+        session = router.session(shard)
+        try:
+            counts.append(session.query(WebhookRequest).count())
+        finally:
+            session.close()
+    return counts
+
+
+def _copy_batch(router, webhook_id, source: int, target: int, batch_size: int) -> int:
+    """Copy the oldest batch from source to target, then delete it from source; returns rows moved"""
+    from app.models import WebhookRequest
+
+    source_session, target_session = router.session(source), router.session(target)
+    try:
+        rows = source_session.query(WebhookRequest)\
+            .filter(WebhookRequest.webhook_id == webhook_id)\
+            .order_by(WebhookRequest.id)\
+            .limit(batch_size)\
+            .all()
+        if not rows:
+            return 0
+        target_session.add_all([
+            WebhookRequest(
+                webhook_id=row.webhook_id,
+                headers=row.headers,
+                body=row.body,
+                raw_body=row.raw_body,
+                query_params=row.query_params,
+                timestamp=row.timestamp
+            )
+            for row in rows
+        ])
+        target_session.commit()
+        source_session.query(WebhookRequest)\
+            .filter(WebhookRequest.id.in_([row.id for row in rows]))\
+            .delete(synchronize_session=False)
+        source_session.commit()
+        return len(rows)
+    finally:
+        source_session.close()
+        target_session.close()
+
+
+def move_webhook(webhook_url: str, target: int, router=shard_router,
+                 batch_size: int = None, grace: float = None, log=print) -> int:
+    """Move a webhook's stored requests to shard `target` while it keeps receiving; returns rows moved"""
+    from app.models import Webhook
+
+    batch_size = batch_size or settings.SHARD_MOVE_BATCH_SIZE
+    grace = settings.SHARD_MOVE_GRACE_SECONDS if grace is None else grace
+    if not 0 <= target < len(router):
+        raise ValueError(f"Shard {target} is not configured (shards: 0-{len(router) - 1})")
+
+    db = router.session(0)
+    try:
+        webhook = db.query(Webhook).filter(Webhook.url == webhook_url).first()
+        if webhook is None:
+            raise ValueError(f"Webhook {webhook_url} not found")
+        webhook_id = webhook.id
+        if webhook.previous_shard is not None:
+            if shard_of(webhook) != target:
+                raise ValueError(
+                    f"Webhook {webhook_url} is being moved to shard {shard_of(webhook)}; finish that move first"
+                )
+            source = webhook.previous_shard
+            log(f"Resuming move of {webhook_url}: shard {source} → {target}")
+        else:
+            source = shard_of(webhook)
+            if source == target:
+                log(f"Webhook {webhook_url} is already on shard {target}")
+                return 0
+            # From here new deliveries are written to the target and reads cover both shards
+            webhook.previous_shard, webhook.shard = source, target
+            db.commit()
+            log(f"Moving {webhook_url}: shard {source} → {target}")
+    finally:
+        db.close()
+
+    from .redis_client import redis_conn
+    from .response_cache import publish_change
+
+    moved = 0
+    while True:
+        copied = _copy_batch(router, webhook_id, source, target, batch_size)
+        moved += copied
+        if copied:
+            # Moved requests have new ids
+            publish_change(redis_conn, webhook_id)
+            log(f"  {moved} requests moved")
+            continue
+        # Workers that loaded the webhook before the switch may still write to the source
+        time.sleep(grace)
+        if not _copy_batch(router, webhook_id, source, target, batch_size):
+            break
+
+    db = router.session(0)
+    try:
+        db.query(Webhook).filter(Webhook.id == webhook_id).update({Webhook.previous_shard: None})
+        db.commit()
+    finally:
+        db.close()
+    log(f"✅ Moved {moved} requests of {webhook_url} to shard {target}")
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Whook request storage shards')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('status', help='Show shards, stored requests and webhooks per shard')
+    commands.add_parser('init', help='Create webhook_request on new shards (init_db.py does this too)')
+    move = commands.add_parser('move', help="Move a webhook's stored requests to another shard, online")
+    move.add_argument('webhook', help='Webhook path (the part after the host)')
+    move.add_argument('shard', type=int)
+    move.add_argument('--batch-size', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        created = init_shards()
+        print(f"✅ Created webhook_request on shards: {', '.join(map(str, created)) or 'none needed'}")
+        return 0
+    if args.command == 'move':
+        try:
+            move_webhook(args.webhook, args.shard, batch_size=args.batch_size)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        return 0
+
+    from app.models import Webhook
+
+    db = shard_router.session(0)
+    try:
+        placed = dict(db.query(func.coalesce(Webhook.shard, 0), func.count(Webhook.id)).group_by(func.coalesce(Webhook.shard, 0)).all())
+        moving = db.query(Webhook.url, Webhook.previous_shard, Webhook.shard).filter(Webhook.previous_shard.isnot(None)).all()
+    finally:
+        db.close()
+    for status, count in zip(shard_router.status(), shard_counts()):
+        print(f"shard {status['shard']}: {placed.get(status['shard'], 0)} webhooks, {count} requests ({status['database']})")
+    for url, source, target in moving:
+        print(f"moving: {url} shard {source} → {target}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,264 @@
+"""
+Non-HTTP destinations, chosen by URL scheme.
+
+- redis-stream://[host[:port]]/<stream>?db=0&maxlen=100000
+  XADD each delivery to a stream. An empty host means the app's own Redis,
+  where the stream key is always whook:sink:<stream> so it cannot touch the
+  app's own keys.
+- file:///<name>.ndjson?max_bytes=104857600&backups=5
+  Append one JSON line per delivery under SINK_FILE_ROOT, rotating at max_bytes.
+- sql+<sqlalchemy url>?table=<name>, e.g. sql+postgresql://user:pass@db/events?table=webhook_events
+  Insert rows (id, received_at, body) into a table, created if missing.
+  SQLite files must be under SINK_FILE_ROOT; other databases must be listed
+  in SINK_SQL_ALLOWED_URLS. Whook's own databases are always refused.
+
+Sink destinations are always forwarded through batch buffers
+(app.core.batching), so each flush is one bulk write: one pipelined XADD,
+one appended block of lines or one multi-row INSERT. Sinks are cached per URL
+per process, so a job opens at most one connection per sink however many
+deliveries it writes. Failures raise SinkError and go through the usual
+forward retries.
+
+Sinks write to the server's own Redis, disk and databases, so they are off
+unless SINKS_ENABLED=True.
+"""
+
+import fcntl
+import os
+import re
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit, urlunsplit, urlencode
+
+from .config import settings
+from .serialization import dumps_bytes, loads
+
+TABLE_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]{0,62}$")
+OWN_REDIS_PREFIX = "whook:sink:"
+DEFAULT_PORTS = {"postgresql": 5432, "mysql": 3306, "mariadb": 3306, "mssql": 1433, "oracle": 1521}
+
+
+class SinkError(Exception):
+    """A sink write failed; the batch is retried"""
+
+
+def is_sink(url: str) -> bool:
+    scheme = url.split(":", 1)[0].lower()
+    return scheme in ("redis-stream", "file") or scheme.startswith("sql+")
+
+
+def _query(parts) -> dict:
+    return {name: values[-1] for name, values in parse_qs(parts.query).items()}
+
+
+def _int_option(options: dict, name: str, default: int) -> int:
+    try:
+        value = int(options.get(name, default))
+    except ValueError:
+        raise ValueError(f"'{name}' must be an integer")
+    if value < 0:
+        raise ValueError(f"'{name}' must not be negative")
+    return value
+
+
+def _ndjson_line(body: bytes) -> bytes:
+    """One compact JSON line; bodies that are not JSON are written as JSON strings"""
+    try:
+        event = loads(body)
+    except ValueError:
+        event = body.decode("utf-8", errors="replace")
+    return dumps_bytes(event) + b"\n"
+
+
+def _redis_identity(redis_url: str) -> tuple:
+    """(host, port, db) a Redis URL connects to"""
+    parts = urlsplit(redis_url)
+    try:
+        db = int(parts.path.lstrip("/") or _query(parts).get("db", 0))
+    except ValueError:
+        db = 0
+    return (parts.hostname or "localhost").lower(), parts.port or 6379, db
+
+
+class RedisStreamSink:
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        options = _query(parts)
+        self.stream = parts.path.lstrip("/")
+        if not self.stream:
+            raise ValueError("redis-stream URL needs a stream name, e.g. redis-stream:///webhook-events")
+        self.maxlen = _int_option(options, "maxlen", 0) or None
+        self.url = url
+        if parts.netloc:
+            self.redis_url = urlunsplit(("redis", parts.netloc, f"/{_int_option(options, 'db', 0)}", "", ""))
+        else:
+            self.redis_url = settings.REDIS_URL
+        if _redis_identity(self.redis_url) == _redis_identity(settings.REDIS_URL):
+            self.stream = OWN_REDIS_PREFIX + self.stream
+        self._redis = None
+
+    def write(self, bodies: list):
+        from redis import Redis
+        from redis.exceptions import RedisError
+
+        if self._redis is None:
+            self._redis = Redis.from_url(self.redis_url, decode_responses=False)
+        pipe = self._redis.pipeline(transaction=False)
+        for body in bodies:
+            pipe.xadd(self.stream, {"body": body}, maxlen=self.maxlen, approximate=True)
+        try:
+            pipe.execute()
+        except RedisError as e:
+            raise SinkError(f"XADD to {self.stream} failed: {e}")
+
+
+class FileSink:
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        options = _query(parts)
+        relative = (parts.netloc + parts.path).lstrip("/")
+        root = os.path.realpath(settings.SINK_FILE_ROOT)
+        self.path = os.path.realpath(os.path.join(root, relative))
+        if not relative or os.path.commonpath([root, self.path]) != root:
+            raise ValueError(f"file sink path must be a file under SINK_FILE_ROOT ({settings.SINK_FILE_ROOT})")
+        self.max_bytes = _int_option(options, "max_bytes", 100 * 1024 * 1024)
+        self.backups = _int_option(options, "backups", 5)
+        self.url = url
+
+    def write(self, bodies: list):
+        block = b"".join(_ndjson_line(body) for body in bodies)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # Several worker processes share the file: one appender (and rotator) at a time
+            with open(self.path + ".lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if self.max_bytes and os.path.exists(self.path) and \
+                        os.path.getsize(self.path) + len(block) > self.max_bytes:
+                    self.rotate()
+                with open(self.path, "ab") as f:
+                    f.write(block)
+        except OSError as e:
+            raise SinkError(f"Write to {self.path} failed: {e}")
+
+    def rotate(self):
+        """events.ndjson -> events.ndjson.1 -> ... -> events.ndjson.<backups> (dropped)"""
+        if not self.backups:
+            os.remove(self.path)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+def _parse_database_url(database_url: str):
+    from sqlalchemy.engine import make_url
+    from sqlalchemy.exc import ArgumentError
+
+    try:
+        return make_url(database_url)
+    except ArgumentError:
+        raise ValueError(f"Invalid SQLAlchemy URL '{database_url}'")
+
+
+def _database_identity(database_url) -> tuple:
+    """What a URL connects to, whatever its driver, credentials and options"""
+    parsed = _parse_database_url(database_url) if isinstance(database_url, str) else database_url
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        return backend, os.path.realpath(parsed.database or "")
+    return backend, (parsed.host or "").lower(), parsed.port or DEFAULT_PORTS.get(backend), parsed.database
+
+
+def _sqlite_sink_url(parsed, options: dict) -> str:
+    """The sink's SQLite file as an absolute URL, if it is under SINK_FILE_ROOT"""
+    if options:
+        raise ValueError("SQLite sink URLs take no options besides 'table'")
+    relative = parsed.database or ""
+    root = os.path.realpath(settings.SINK_FILE_ROOT)
+    path = os.path.realpath(os.path.join(root, relative))
+    if not relative or relative == ":memory:" or relative.startswith("file:") or \
+            os.path.commonpath([root, path]) != root:
+        raise ValueError(f"SQLite sink database must be a file under SINK_FILE_ROOT ({settings.SINK_FILE_ROOT})")
+    return parsed.set(database=path).render_as_string(hide_password=False)
+
+
+class SQLSink:
+    def __init__(self, url: str):
+        # Split the query off by hand: urlunsplit would turn sqlite:////abs/path into sqlite://abs/path
+        database_url, _, query = url[len("sql+"):].partition("?")
+        options = {name: values[-1] for name, values in parse_qs(query).items()}
+        table_name = options.pop("table", "webhook_events")
+        if not TABLE_NAME.match(table_name):
+            raise ValueError(f"Invalid table name '{table_name}'")
+        parsed = _parse_database_url(database_url)
+        if parsed.get_backend_name() == "sqlite":
+            database_url = _sqlite_sink_url(parsed, options)
+        else:
+            database_url = f"{database_url}?{urlencode(options)}" if options else database_url
+            # Exactly as listed, options included: they can change what a connection does
+            allowed = [_parse_database_url(allowed_url) for allowed_url in settings.SINK_SQL_ALLOWED_URLS]
+            if _parse_database_url(database_url) not in allowed:
+                raise ValueError("SQL sink databases other than SQLite must be listed in SINK_SQL_ALLOWED_URLS")
+        own = [settings.DATABASE_URL, *settings.DATABASE_REPLICA_URLS, *settings.DATABASE_SHARD_URLS]
+        if _database_identity(database_url) in (_database_identity(own_url) for own_url in own):
+            raise ValueError("SQL sinks cannot write to Whook's own databases")
+        self.database_url = database_url
+        self.table_name = table_name
+        self.url = url
+        self._engine = None
+        self._table = None
+
+    def write(self, bodies: list):
+        from sqlalchemy import Column, DateTime, Integer, LargeBinary, MetaData, Table, create_engine
+        from sqlalchemy.exc import SQLAlchemyError
+
+        try:
+            if self._engine is None:
+                self._engine = create_engine(self.database_url, pool_pre_ping=True)
+                self._table = Table(
+                    self.table_name, MetaData(),
+                    Column("id", Integer, primary_key=True),
+                    Column("received_at", DateTime, nullable=False),
+                    Column("body", LargeBinary, nullable=False),
+                )
+                self._table.create(self._engine, checkfirst=True)
+            now = datetime.utcnow()
+            with self._engine.begin() as connection:
+                connection.execute(self._table.insert(), [{"received_at": now, "body": body} for body in bodies])
+        except SQLAlchemyError as e:
+            raise SinkError(f"Insert into {self.table_name} failed: {e}")
+
+
+def _build(url: str):
+    scheme = url.split(":", 1)[0].lower()
+    if scheme == "redis-stream":
+        return RedisStreamSink(url)
+    if scheme == "file":
+        return FileSink(url)
+    if scheme.startswith("sql+"):
+        return SQLSink(url)
+    raise ValueError(f"Unknown sink scheme '{scheme}'")
+
+
+def validate_sink(url: str):
+    """Raise ValueError if a sink URL is invalid or sinks are disabled"""
+    if not settings.SINKS_ENABLED:
+        raise ValueError("Non-HTTP destinations require SINKS_ENABLED=True")
+    _build(url)
+
+
+_sinks = {}
+
+
+def get_sink(url: str):
+    """Shared sink for a destination URL (one per URL per process)"""
+    sink = _sinks.get(url)
+    if sink is None:
+        if not settings.SINKS_ENABLED:
+            raise SinkError("Non-HTTP destinations require SINKS_ENABLED=True")
+        try:
+            sink = _sinks[url] = _build(url)
+        except ValueError as e:
+            raise SinkError(str(e))
+    return sink
@@ -0,0 +1,468 @@
+"""
+Local disk spool for ingest when Redis is down or slow.
+
+With SPOOL_ENABLED=True, handle_webhook queues deliveries as usual, but on a
+Redis error, or when queueing took longer than SPOOL_LATENCY_BUDGET_MS, it
+appends them to a spool on local disk instead and still answers 202. Once a
+process has spooled, it keeps spooling until the drainer has replayed
+everything, so deliveries reach the queue in the order they arrived.
+
+The spool is a directory of append-only segment files:
+
+- Each API process writes its own segment, preallocated to
+  SPOOL_SEGMENT_BYTES and memory-mapped. A record is an 8-byte header (length,
+  crc32) followed by the msgpack-encoded delivery.
+- A background thread msyncs the segment every SPOOL_FSYNC_MS, so a burst of
+  writes costs one flush. Segments are sealed (truncated, fsynced and renamed
+  to .seg) when full or SPOOL_SEAL_MS after they were opened. A full segment
+  is swapped for a new one under the writer lock and sealed after it is
+  released, so appends never wait on an fsync.
+- The drainer (python -m app.core.spool, started by run.sh) replays sealed
+  segments oldest first, records its position in a .pos file as it goes and
+  deletes a segment once it has been replayed. It also seals segments left
+  open by processes that died, up to their last intact record.
+
+Replay is at-least-once: a drainer killed mid-segment replays from its last
+saved position. Deliveries spooled before their dedup key could be checked
+are checked at replay.
+"""
+
+import argparse
+import fcntl
+import logging
+import mmap
+import os
+import signal
+import struct
+import threading
+import time
+import zlib
+
+from .config import settings
+from .serialization import QueueSerializer
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct("<II")  # payload length, crc32 of payload
+OPEN_SUFFIX = ".open"
+SEGMENT_SUFFIX = ".seg"
+POSITION_SUFFIX = ".pos"
+STATS_KEY = "whook:spool:stats"
+
+
+def spool_enabled() -> bool:
+    return settings.SPOOL_ENABLED
+
+
+def encode_record(webhook_id, headers, body, query_params, deduped: bool) -> bytes:
+    payload = QueueSerializer.dumps((webhook_id, headers, body, query_params, time.time(), deduped))
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_records(data, offset: int = 0):
+    """Yield (end offset, record) from segment bytes, stopping at the first empty or torn record"""
+    while offset + RECORD_HEADER.size <= len(data):
+        length, checksum = RECORD_HEADER.unpack_from(data, offset)
+        start, end = offset + RECORD_HEADER.size, offset + RECORD_HEADER.size + length
+        if length == 0 or end > len(data):
+            return
+        payload = bytes(data[start:end])
+        if zlib.crc32(payload) != checksum:
+            return
+        yield end, QueueSerializer.loads(payload)
+        offset = end
+
+
+def _fsync_directory(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sealed_segments(directory: str) -> list:
+    """Sealed segment paths, oldest first (names start with a nanosecond timestamp)"""
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in names]
+
+
+class Segment:
+    """An open segment: a preallocated, memory-mapped file owned (flock'd) by one process"""
+
+    def __init__(self, directory: str, size: int):
+        self.path = os.path.join(directory, f"{time.time_ns():020d}-{os.getpid()}{OPEN_SUFFIX}")
+        # The drainer treats an open segment it can lock as abandoned, so lock it before it gets its name
+        self.file = open(self.path + ".tmp", "w+b")
+        fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.file.truncate(size)
+        os.rename(self.path + ".tmp", self.path)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.size = size
+        self.used = 0
+        self.records = 0
+        self.dirty = False
+        self.opened_at = time.monotonic()
+
+    def fits(self, length: int) -> bool:
+        return self.used + length <= self.size
+
+    def append(self, record: bytes):
+        self.map[self.used:self.used + len(record)] = record
+        self.used += len(record)
+        self.records += 1
+        self.dirty = True
+
+    def flush(self):
+        if self.dirty:
+            self.dirty = False
+            self.map.flush()
+
+    def seal(self):
+        """Truncate to the written records, fsync and rename to .seg so the drainer picks it up"""
+        self.map.flush()
+        self.map.close()
+        self.file.truncate(self.used)
+        os.fsync(self.file.fileno())
+        os.rename(self.path, self.path[:-len(OPEN_SUFFIX)] + f"-{self.records}{SEGMENT_SUFFIX}")
+        _fsync_directory(os.path.dirname(self.path))
+        self.file.close()
+
+
+class Spool:
+    """The spool writer of one API process"""
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or settings.SPOOL_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        # lock guards the current segment and is all append waits for; seal_lock
+        # orders the slow msync/seal work so segments are sealed in the order they filled
+        self.lock = threading.Lock()
+        self.seal_lock = threading.Lock()
+        self.segment = None
+        self.retired = []
+        self.tripped_until = 0.0
+        self.pending = False
+        self.pending_checked_at = 0.0
+        self.spooled = 0
+        self.flusher = threading.Thread(target=self._flush_loop, name="spool-flusher", daemon=True)
+        self.flusher.start()
+
+    def trip(self):
+        """Send deliveries to the spool for the next SPOOL_COOLDOWN_MS"""
+        self.tripped_until = time.monotonic() + settings.SPOOL_COOLDOWN_MS / 1000
+
+    def should_spool(self) -> bool:
+        """True while Redis is considered unhealthy or earlier spooled deliveries are not replayed yet"""
+        now = time.monotonic()
+        if now < self.tripped_until or self.segment is not None or self.retired:
+            return True
+        if now - self.pending_checked_at > 0.1:
+            self.pending = bool(sealed_segments(self.directory))
+            self.pending_checked_at = now
+        return self.pending
+
+    def append(self, webhook_id, headers, body, query_params, deduped: bool):
+        record = encode_record(webhook_id, headers, body, query_params, deduped)
+        with self.lock:
+            if self.segment is not None and not self.segment.fits(len(record)):
+                self.retired.append(self.segment)
+                self.segment = None
+            if self.segment is None:
+                self.segment = Segment(self.directory, max(settings.SPOOL_SEGMENT_BYTES, len(record)))
+            self.segment.append(record)
+            self.spooled += 1
+            retired = bool(self.retired)
+        self.pending = True
+        if retired:
+            self._seal_retired()
+
+    def _seal_retired(self):
+        """Seal the segments swapped out of append, oldest first, without holding its lock"""
+        with self.seal_lock:
+            while True:
+                with self.lock:
+                    if not self.retired:
+                        return
+                    segment = self.retired.pop(0)
+                try:
+                    segment.seal()
+                except (OSError, ValueError) as e:
+                    # Closing it releases the flock, so the drainer seals it as abandoned
+                    logger.error(f"Spool seal failed, leaving {segment.path} to the drainer: {e}")
+                    segment.file.close()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(settings.SPOOL_FSYNC_MS / 1000)
+            with self.lock:
+                segment = self.segment
+                if segment is not None and time.monotonic() - segment.opened_at >= settings.SPOOL_SEAL_MS / 1000:
+                    self.retired.append(segment)
+                    self.segment = None
+                    segment = None
+            if segment is not None:
+                with self.seal_lock:
+                    try:
+                        segment.flush()
+                    except (OSError, ValueError) as e:
+                        logger.error(f"Spool flush failed: {e}")
+            self._seal_retired()
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def get_spool():
+    """This process's spool writer, or None when the spool is disabled"""
+    global _spool
+    if not spool_enabled():
+        return None
+    if _spool is None:
+        with _spool_lock:
+            if _spool is None:
+                _spool = Spool()
+    return _spool
+
+
+def seal_abandoned(directory: str) -> int:
+    """Seal open segments whose writer has exited (their lock is free); returns how many"""
+    sealed = 0
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(OPEN_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            f = open(path, "r+b")
+        except FileNotFoundError:
+            continue
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue  # still being written
+            if not os.path.exists(path):
+                continue  # sealed by its writer just before we locked it
+            data = f.read()
+            used, records = 0, 0
+            for used, _ in read_records(data):
+                records += 1
+            f.truncate(used)
+            os.fsync(f.fileno())
+            if records:
+                os.rename(path, path[:-len(OPEN_SUFFIX)] + f"-{records}{SEGMENT_SUFFIX}")
+            else:
+                os.remove(path)
+            sealed += 1
+    if sealed:
+        _fsync_directory(directory)
+    return sealed
+
+
+def _read_position(path: str):
+    try:
+        with open(path + POSITION_SUFFIX) as f:
+            offset, replayed = f.read().split()
+            return int(offset), int(replayed)
+    except (FileNotFoundError, ValueError):
+        return 0, 0
+
+
+def _write_position(path: str, offset: int, replayed: int):
+    tmp = path + POSITION_SUFFIX + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(f"{offset} {replayed}")
+    os.replace(tmp, path + POSITION_SUFFIX)
+
+
+def spool_depth(directory: str = None) -> dict:
+    """Segments, bytes and records waiting on disk"""
+    directory = directory or settings.SPOOL_DIR
+    depth = {'segments': 0, 'open_segments': 0, 'bytes': 0, 'records': 0}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return depth
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.endswith(SEGMENT_SUFFIX):
+            depth['segments'] += 1
+            try:
+                depth['bytes'] += os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+            total = int(name[:-len(SEGMENT_SUFFIX)].rpartition("-")[2])
+            depth['records'] += total - _read_position(path)[1]
+        elif name.endswith(OPEN_SUFFIX):
+            depth['open_segments'] += 1
+    return depth
+
+
+def spool_stats(redis_conn) -> dict:
+    """Depth on this host plus the drainer's replay counters (decoded connection)"""
+    stats = spool_depth()
+    try:
+        replay = redis_conn.hgetall(STATS_KEY)
+    except Exception:
+        replay = {}
+    stats['replayed'] = int(replay.get('replayed', 0))
+    stats['duplicates'] = int(replay.get('duplicates', 0))
+    stats['dropped'] = int(replay.get('dropped', 0))
+    stats['replay_rate'] = float(replay.get('replay_rate', 0))
+    spool = _spool
+    if spool is not None:
+        stats['spooled_by_this_process'] = spool.spooled
+    return stats
+
+
+class SpoolDrainer:
+    """Replays sealed segments into the queue, oldest first"""
+
+    def __init__(self, redis_conn, lane_queues, directory: str = None):
+        self.redis = redis_conn
+        self.queues = lane_queues
+        self.directory = directory or settings.SPOOL_DIR
+        self.running = True
+        self.webhooks = {}
+        self.webhooks_loaded_at = 0.0
+        self.replayed = 0
+        self.window_started = time.monotonic()
+        self.window_replayed = 0
+
+    def stop(self, *args):
+        self.running = False
+
+    def run(self):
+        os.makedirs(self.directory, exist_ok=True)
+        while self.running:
+            seal_abandoned(self.directory)
+            segments = sealed_segments(self.directory)
+            if not segments:
+                self.publish(force=True)
+                time.sleep(0.2)
+                continue
+            for path in segments:
+                if not self.running or not self.drain_segment(path):
+                    break
+
+    def drain_segment(self, path: str) -> bool:
+        """Replay one segment; True when it was fully replayed and removed"""
+        offset, replayed = _read_position(path)
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        try:
+            for end, record in read_records(data, offset):
+                if not self.replay(record):
+                    _write_position(path, offset, replayed)
+                    return False
+                offset, replayed = end, replayed + 1
+                if replayed % 100 == 0:
+                    _write_position(path, offset, replayed)
+                self.publish()
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+        os.remove(path)
+        try:
+            os.remove(path + POSITION_SUFFIX)
+        except FileNotFoundError:
+            pass
+        self.publish(force=True)
+        return True
+
+    def webhook(self, webhook_id):
+        """Webhook settings, reloaded every few seconds; None when it was deleted"""
+        now = time.monotonic()
+        if now - self.webhooks_loaded_at > 5:
+            self.webhooks, self.webhooks_loaded_at = {}, now
+        if webhook_id not in self.webhooks:
+            from app.core.database import SessionLocal
+            from app.models import Webhook
+
+            db = SessionLocal()
+            try:
+                webhook = db.query(Webhook).filter(Webhook.id == webhook_id).first()
+                if webhook is not None:
+                    db.expunge(webhook)
+                self.webhooks[webhook_id] = webhook
+            finally:
+                db.close()
+        return self.webhooks[webhook_id]
+
+    def replay(self, record) -> bool:
+        """Queue one spooled delivery, retrying while Redis is unavailable; False when stopping"""
+        from redis.exceptions import RedisError
+        from . import dedup
+        from .ingest import enqueue_delivery
+
+        webhook_id, headers, body, query_params, _, deduped = record
+        delay = 0.1
+        while self.running:
+            try:
+                webhook = self.webhook(webhook_id)
+                if webhook is None:
+                    self.redis.hincrby(STATS_KEY, 'dropped', 1)
+                    return True
+                if not deduped:
+                    duplicate, _ = dedup.claim(self.redis, webhook, headers, body, query_params)
+                    if duplicate:
+                        self.redis.hincrby(STATS_KEY, 'duplicates', 1)
+                        return True
+                    deduped = True  # claimed; a retry after a failed enqueue must not count it as a duplicate
+                enqueue_delivery(webhook, headers, body, query_params, self.redis, self.queues)
+                self.replayed += 1
+                self.window_replayed += 1
+                return True
+            except RedisError as e:
+                logger.warning(f"Spool replay waiting for Redis: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, 5)
+        return False
+
+    def publish(self, force: bool = False):
+        """Write replay counters and the replay rate (deliveries/second) about once a second"""
+        elapsed = time.monotonic() - self.window_started
+        if elapsed < 1 and not force:
+            return
+        from redis.exceptions import RedisError
+
+        rate = self.window_replayed / elapsed if elapsed > 0 else 0
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hincrby(STATS_KEY, 'replayed', self.window_replayed)
+            pipe.hset(STATS_KEY, 'replay_rate', round(rate, 1))
+            pipe.execute()
+        except RedisError:
+            return
+        self.window_started, self.window_replayed = time.monotonic(), 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Whook ingest spool drainer')
+    parser.add_argument('--if-enabled', action='store_true', help='Exit quietly unless SPOOL_ENABLED=True')
+    args = parser.parse_args()
+
+    if not spool_enabled():
+        if args.if_enabled:
+            return 0
+        print("Spool drainer requires SPOOL_ENABLED=True")
+        return 1
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+    from .redis_client import redis_conn, queues
+
+    drainer = SpoolDrainer(redis_conn, queues)
+    signal.signal(signal.SIGTERM, drainer.stop)
+    signal.signal(signal.SIGINT, drainer.stop)
+    print(f"✅ Spool drainer started (dir={settings.SPOOL_DIR})")
+    drainer.run()
+    print(f"👋 Spool drainer stopped after {drainer.replayed} deliveries")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
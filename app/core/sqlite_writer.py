@@ -0,0 +1,261 @@
+"""
+SQLite high-throughput mode.
+
+SQLite allows one writer at a time, so many work-horses inserting in parallel
+just queue on the database lock. With SQLITE_WRITER=True, workers and routes
+push webhook_request inserts/deletes onto a Redis list instead, and a single
+writer process drains it in batched transactions, publishes new-request
+notifications after each commit and checkpoints the WAL periodically.
+
+A batch is moved to a processing list when it is taken and dropped from it
+only after its commit, so a writer that dies mid-batch applies it again when
+it restarts. Deletes are idempotent; inserts committed just before such a
+crash may be stored twice.
+
+Run with: python -m app.core.sqlite_writer
+"""
+
+import argparse
+import logging
+import signal
+import time
+import uuid
+from datetime import datetime
+
+from .config import settings
+from .serialization import dumps, loads, decode_bytes
+
+logger = logging.getLogger(__name__)
+
+WRITE_QUEUE_KEY = "whook:sqlite:writes"
+PROCESSING_KEY = "whook:sqlite:processing"
+REPLY_KEY = "whook:sqlite:reply:{id}"
+REPLY_TTL = 60
+
+# Move up to ARGV[1] messages from the head of the queue to the processing list
+TAKE_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+
+def sqlite_writer_enabled() -> bool:
+    # Embedded mode batches its inserts in the web process and may run without Redis;
+    # with shards, requests are written to each webhook's own database
+    return (settings.SQLITE_WRITER and settings.DATABASE_URL.startswith("sqlite")
+            and settings.QUEUE_MODE != "embedded" and not settings.DATABASE_SHARD_URLS)
+
+
+def new_request_notification(webhook_id, webhook_url, request_id, timestamp, body_length) -> dict:
+    """Payload published on webhook_events when a request has been stored"""
+    return {
+        'type': 'new_webhook_request',
+        'webhook_id': webhook_id,
+        'webhook_url': webhook_url,
+        'request_id': request_id,
+        'timestamp': timestamp,
+        'body_length': body_length
+    }
+
+
+def submit_write(redis_conn, op: str, wait: bool = False, timeout: float = 30, **payload):
+    """Queue a write for the writer process; with wait=True block until it is committed"""
+    message = {'op': op, **payload}
+    if wait:
+        message['reply'] = REPLY_KEY.format(id=uuid.uuid4().hex)
+    redis_conn.rpush(WRITE_QUEUE_KEY, dumps(message))
+    if not wait:
+        return None
+
+    item = redis_conn.blpop(message['reply'], timeout=timeout)
+    if item is None:
+        raise TimeoutError("SQLite writer did not reply")
+    result = loads(item[1])
+    if 'error' in result:
+        raise RuntimeError(result['error'])
+    return result
+
+
+class SQLiteWriter:
+    """Single consumer of the write queue; applies each batch in one transaction"""
+
+    def __init__(self, redis_conn, session_factory, engine):
+        self.redis = redis_conn
+        self.session_factory = session_factory
+        self.engine = engine
+        self.batch_size = settings.SQLITE_WRITER_BATCH_SIZE
+        self.linger = settings.SQLITE_WRITER_LINGER_MS / 1000.0
+        self.checkpoint_interval = settings.SQLITE_CHECKPOINT_INTERVAL
+        self.running = False
+        self.written = 0
+        self.take = redis_conn.register_script(TAKE_SCRIPT)
+
+    def stop(self, *args):
+        self.running = False
+
+    def run(self):
+        self.running = True
+        last_checkpoint = time.monotonic()
+        unfinished = self.decode(self.redis.lrange(PROCESSING_KEY, 0, -1))
+        if unfinished:
+            logger.warning(f"Applying {len(unfinished)} writes left by a writer that stopped mid-batch")
+            self.apply(unfinished)
+        while self.running:
+            batch = self.next_batch()
+            if batch:
+                self.apply(batch)
+            if time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                self.checkpoint()
+                last_checkpoint = time.monotonic()
+        self.checkpoint()
+
+    def next_batch(self) -> list:
+        """
+        Block for the first message, then take whatever arrives within the linger
+        window; the batch stays on the processing list until apply() commits it
+        """
+        first = self.redis.blmove(WRITE_QUEUE_KEY, PROCESSING_KEY, 1, "LEFT", "RIGHT")
+        if first is None:
+            return []
+        items = [first]
+        deadline = time.monotonic() + self.linger
+        while len(items) < self.batch_size:
+            more = self.take(keys=[WRITE_QUEUE_KEY, PROCESSING_KEY], args=[self.batch_size - len(items)])
+            if more:
+                items.extend(more)
+                continue
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(0.001)
+        return self.decode(items)
+
+    @staticmethod
+    def decode(items: list) -> list:
+        messages = []
+        for item in items:
+            try:
+                messages.append(loads(item))
+            except ValueError as e:
+                logger.error(f"Dropping unreadable write message: {e}")
+        return messages
+
+    def apply(self, messages: list):
+        """Apply a batch in one transaction, falling back to one-by-one if it fails"""
+        try:
+            results = self._apply_in_transaction(messages)
+        except Exception as e:
+            logger.warning(f"Batch of {len(messages)} writes failed, retrying individually: {e}")
+            results = []
+            for message in messages:
+                try:
+                    results.extend(self._apply_in_transaction([message]))
+                except Exception as item_error:
+                    logger.error(f"SQLite write failed ({message.get('op')}): {item_error}")
+                    results.append((message, {'error': str(item_error)}))
+        self._after_commit(results)
+
+    def _apply_in_transaction(self, messages: list) -> list:
+        from app.models import WebhookRequest
+
+        session = self.session_factory()
+        try:
+            results = []
+            inserted = []
+            for message in messages:
+                op = message['op']
+                if op == 'insert_request':
+                    row = WebhookRequest(
+                        webhook_id=message['webhook_id'],
+                        headers=message['headers'],
+                        raw_body=decode_bytes(message['body']),
+                        query_params=message.get('query_params'),
+                        timestamp=datetime.fromisoformat(message['timestamp'])
+                    )
+                    session.add(row)
+                    inserted.append((message, row))
+                elif op == 'delete_request':
+                    deleted = session.query(WebhookRequest)\
+                        .filter(WebhookRequest.id == message['request_id'])\
+                        .delete(synchronize_session=False)
+                    results.append((message, {'deleted': deleted}))
+                elif op == 'delete_webhook_requests':
+                    deleted = session.query(WebhookRequest)\
+                        .filter(WebhookRequest.webhook_id == message['webhook_id'])\
+                        .delete(synchronize_session=False)
+                    results.append((message, {'deleted': deleted}))
+                else:
+                    results.append((message, {'error': f"unknown op {op}"}))
+            session.flush()
+            results.extend((message, {'request_id': row.id}) for message, row in inserted)
+            session.commit()
+            return results
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _after_commit(self, results: list):
+        """Publish notifications, reply to waiting callers and ack the batch in one round trip"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(PROCESSING_KEY)
+        for message, result in results:
+            if message['op'] == 'insert_request' and 'request_id' in result:
+                self.written += 1
+                pipe.publish('webhook_events', dumps(new_request_notification(
+                    message['webhook_id'],
+                    message.get('webhook_url'),
+                    result['request_id'],
+                    message['timestamp'],
+                    message['body_length']
+                )))
+            if message.get('reply'):
+                pipe.rpush(message['reply'], dumps(result))
+                pipe.expire(message['reply'], REPLY_TTL)
+        try:
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Post-commit notify failed: {e}")
+
+    def checkpoint(self):
+        """Move WAL pages into the main database without blocking readers"""
+        try:
+            with self.engine.connect() as conn:
+                busy, log_pages, checkpointed = conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            if busy:
+                logger.info(f"WAL checkpoint partially blocked ({checkpointed}/{log_pages} pages)")
+        except Exception as e:
+            logger.warning(f"WAL checkpoint failed: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Whook SQLite writer service')
+    parser.add_argument('--if-enabled', action='store_true',
+                        help='Exit quietly unless SQLITE_WRITER=True and DATABASE_URL is SQLite')
+    args = parser.parse_args()
+
+    if not sqlite_writer_enabled():
+        if args.if_enabled:
+            return 0
+        print("SQLite writer requires SQLITE_WRITER=True and a sqlite:// DATABASE_URL")
+        return 1
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+    from .database import engine, SessionLocal
+    from .redis_client import redis_conn
+
+    writer = SQLiteWriter(redis_conn, SessionLocal, engine)
+    signal.signal(signal.SIGTERM, writer.stop)
+    signal.signal(signal.SIGINT, writer.stop)
+    print(f"✅ SQLite writer started (batch={writer.batch_size}, linger={settings.SQLITE_WRITER_LINGER_MS}ms)")
+    writer.run()
+    print(f"👋 SQLite writer stopped after {writer.written} inserts")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,5 +1,6 @@
 from .user import User
 from .webhook import Webhook, WebhookRequest, Destination
+from .archive import ArchivePartition
 from .base import Base
 
-__all__ = ['User', 'Webhook', 'WebhookRequest', 'Destination', 'Base']
+__all__ = ['User', 'Webhook', 'WebhookRequest', 'Destination', 'ArchivePartition', 'Base']
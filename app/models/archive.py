@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, ForeignKey, Index
+from datetime import datetime
+from .base import Base
+
+
+class ArchivePartition(Base):
+    """Manifest entry for one Parquet file of archived requests (see app.core.archive)"""
+    __tablename__ = "archive_partition"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    webhook_id = Column(Integer, ForeignKey("webhook.id", ondelete="CASCADE"), nullable=False, index=True)
+    day = Column(Date, nullable=False)  # UTC day of the requests in the file
+    path = Column(String(500), nullable=False)  # relative to ARCHIVE_DIR
+    request_count = Column(Integer, nullable=False)
+    min_id = Column(BigInteger, nullable=False)  # request id range, for lookups by id
+    max_id = Column(BigInteger, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (
+        Index('idx_archive_webhook_day', 'webhook_id', 'day'),
+        Index('idx_archive_id_range', 'min_id', 'max_id'),
+    )
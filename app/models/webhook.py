@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, Text, DateTime, ForeignKey, Index
+import base64
+from sqlalchemy import Column, Integer, String, Boolean, Text, DateTime, ForeignKey, Index, LargeBinary, false
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .base import Base
@@ -12,6 +13,16 @@ class Webhook(Base):
     name = Column(String(100), nullable=False)
     status = Column(Boolean, default=True, nullable=False, index=True)
     transformation_script = Column(Text, nullable=True)
+    transformation_mapping = Column(Text, nullable=True)
+    # Ordered delivery: forwards for the same partition key run one at a time, in arrival order
+    ordered_delivery = Column(Boolean, default=False, server_default=false(), nullable=False)
+    ordering_key = Column(String(200), nullable=True)  # header:<name>, json:<path>, query:<name>; empty = whole webhook
+    # Duplicate suppression: deliveries repeating a dedup key value within the window are acknowledged and dropped
+    dedup_key = Column(String(200), nullable=True)  # header:<name>, json:<path>, query:<name> or "body"
+    dedup_window = Column(Integer, nullable=True)  # seconds; empty = DEDUP_WINDOW_SECONDS
+    # Sharding: database holding this webhook's requests (see app.core.sharding); empty = shard 0
+    shard = Column(Integer, nullable=True)
+    previous_shard = Column(Integer, nullable=True)  # set while its history is being moved off that shard
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     user_id = Column(Integer, ForeignKey("user.id", ondelete="CASCADE"), nullable=False, index=True)
     user = relationship("User", back_populates="webhooks")
@@ -28,6 +39,8 @@ class Destination(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     url = Column(String(500), nullable=False)
+    routing_rules = Column(Text, nullable=True)  # JSON; see app.core.routing (empty = every delivery)
+    batch_options = Column(Text, nullable=True)  # JSON; see app.core.batching (empty = one request per delivery)
     webhook_id = Column(Integer, ForeignKey("webhook.id", ondelete="CASCADE"), nullable=False, index=True)
     webhook = relationship("Webhook", back_populates="destinations")
 
@@ -38,11 +51,33 @@ class WebhookRequest(Base):
     id = Column(Integer, primary_key=True, index=True)
     webhook_id = Column(Integer, ForeignKey("webhook.id", ondelete="CASCADE"), nullable=False, index=True)
     headers = Column(Text, nullable=False)
-    body = Column(Text, nullable=False)
+    body = Column(Text, nullable=False, default="")  # text bodies stored before raw_body existed
+    raw_body = Column(LargeBinary, nullable=True)  # body bytes exactly as received
     query_params = Column(Text, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
     webhook = relationship("Webhook", back_populates="requests")
     
     __table_args__ = (
         Index('idx_webhook_timestamp', 'webhook_id', 'timestamp'),
+        # Never reuse ids: archived requests keep theirs (init_db rebuilds older SQLite tables)
+        {'sqlite_autoincrement': True},
     )
+    
+    @property
+    def body_bytes(self) -> bytes:
+        if self.raw_body is not None:
+            return self.raw_body
+        return (self.body or "").encode("utf-8")
+    
+    @property
+    def body_length(self) -> int:
+        return len(self.body_bytes)
+    
+    def decoded_body(self):
+        """(text, encoding) for display: UTF-8 text when possible, otherwise base64"""
+        if self.raw_body is None:
+            return self.body or "", "utf-8"
+        try:
+            return self.raw_body.decode("utf-8"), "utf-8"
+        except UnicodeDecodeError:
+            return base64.b64encode(self.raw_body).decode("ascii"), "base64"
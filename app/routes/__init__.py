@@ -1,5 +1,6 @@
 from .auth import router as auth_router
+from .admin import router as admin_router
 from .webhooks import router as webhooks_router
 from .websocket import router as websocket_router
 
-__all__ = ['auth_router', 'webhooks_router', 'websocket_router']
+__all__ = ['auth_router', 'admin_router', 'webhooks_router', 'websocket_router']
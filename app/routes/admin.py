@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Request, HTTPException
+from app.core import redis_conn
+from app.core.serialization import JSONResponse
+from app.utils.auth import require_admin
+from app.utils.profiling import profile_for, get_slow_queries, clear_slow_queries
+
+router = APIRouter(prefix="/admin")
+
+MAX_PROFILE_SECONDS = 300
+
+
+@router.post("/profile")
+async def start_profile(request: Request, seconds: float = 30):
+    """Sample this API process for N seconds and write a folded flamegraph profile"""
+    require_admin(request)
+
+    if seconds <= 0 or seconds > MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {MAX_PROFILE_SECONDS}")
+
+    path = profile_for(seconds, "api")
+    return JSONResponse({
+        "message": "Profiling started",
+        "seconds": seconds,
+        "output": path
+    }, status_code=202)
+
+
+@router.get("/slow-queries")
+async def slow_queries(request: Request, limit: int = 20):
+    """Slowest SQL statements recorded per route/job (requires PROFILE_SQL=true)"""
+    require_admin(request)
+    return JSONResponse(get_slow_queries(redis_conn, limit=min(limit, 100)))
+
+
+@router.post("/slow-queries/clear")
+async def reset_slow_queries(request: Request):
+    require_admin(request)
+    clear_slow_queries(redis_conn)
+    return JSONResponse({"message": "Slow query log cleared"})
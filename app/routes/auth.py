@@ -2,11 +2,13 @@ from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from authlib.integrations.starlette_client import OAuth
+from app.core.assets import asset_url
 from app.core.config import settings
 from app.utils.auth import get_current_user, get_or_create_user
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = asset_url
 
 # OAuth Configuration
 oauth = OAuth()
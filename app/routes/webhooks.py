@@ -1,15 +1,87 @@
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from app.models import Webhook, WebhookRequest, Destination
-from app.core import SessionLocal, queue
+from app.core import SessionLocal, ReadSessionLocal, queues, redis_conn
+from app.core.assets import asset_url
+from app.core.config import settings
+from app.core.sqlite_writer import sqlite_writer_enabled, submit_write
+from app.core import archive, batching, dedup, embedded, fair_scheduler, metrics, ordered, response_cache, routing, sharding, sinks, spool
+from app.core.database import shard_router
+from app.core.ingest import enqueue_delivery
+from app.core.redis_client import ingest_conn, ingest_queues
+from app.core.serialization import JSONResponse, QueueSerializer, dumps, loads
+from app.utils.keys import parse_key_spec
+from app.transforms import MappingError, compile_mapping
 from app.utils.auth import get_current_user, require_auth
+from redis.exceptions import RedisError
+from datetime import datetime
+import json
 import random
 import string
-import json
+import time
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = asset_url
+
+
+def mark_write(request: Request):
+    """Remember that this user just wrote, so their next reads see it"""
+    request.session['last_write'] = time.time()
+
+
+def read_session(request: Request):
+    """Replica session for reads, unless the user wrote recently (read-your-writes)"""
+    last_write = request.session.get('last_write', 0)
+    return ReadSessionLocal(prefer_primary=time.time() - last_write < settings.READ_YOUR_WRITES_SECONDS)
+
+
+def request_session(request_id, db):
+    """
+    Session on the shard holding request `request_id`: `db` itself for shard 0,
+    otherwise a new session the caller closes. None if no shard issues that id.
+    """
+    shard = shard_router.shard_for_request(request_id)
+    if shard is None:
+        return None
+    return db if shard == 0 else shard_router.session(shard)
+
+
+async def writer_write(op: str, **payload) -> dict:
+    """Apply a write through the SQLite writer and wait for its commit, off the event loop"""
+    try:
+        return await run_in_threadpool(submit_write, redis_conn, op, wait=True, **payload)
+    except (TimeoutError, RuntimeError, RedisError) as e:
+        raise HTTPException(status_code=503, detail=f"SQLite writer unavailable: {e}", headers={"Retry-After": "5"})
+
+
+# user id -> (loaded at, {webhook url: webhook id}), so metrics polling skips the database
+_owned_webhooks = {}
+OWNED_WEBHOOKS_TTL = 30
+
+
+def owned_webhooks(request: Request, user, refresh: bool = False) -> dict:
+    """The user's webhooks as {url: id}, cached per process for OWNED_WEBHOOKS_TTL seconds"""
+    cached = _owned_webhooks.get(user['id'])
+    if cached and not refresh and time.time() - cached[0] < OWNED_WEBHOOKS_TTL:
+        return cached[1]
+    db = read_session(request)
+    try:
+        owned = dict(db.query(Webhook.url, Webhook.id).filter(Webhook.user_id == user['id']).all())
+    finally:
+        db.close()
+    _owned_webhooks[user['id']] = (time.time(), owned)
+    return owned
+
+
+def list_response(request: Request, body: bytes, etag: str, media_type: str):
+    """A cached request list, or 304 if the browser's copy is current"""
+    headers = {"ETag": etag, "Cache-Control": response_cache.REVALIDATE, "Vary": "Cookie"}
+    if response_cache.etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
 
 
 @router.get("/", response_class=HTMLResponse)
@@ -20,19 +92,15 @@ async def index(request: Request):
         return RedirectResponse(url="/login")
     
     try:
-        db = SessionLocal()
+        db = read_session(request)
         webhooks = db.query(Webhook).filter(Webhook.user_id == user['id']).all()
         
         for webhook in webhooks:
-            count = db.query(WebhookRequest).filter(WebhookRequest.webhook_id == webhook.id).count()
-            webhook.request_count = count
-            
-            # Get the most recent request timestamp
-            last_request = db.query(WebhookRequest.timestamp)\
-                .filter(WebhookRequest.webhook_id == webhook.id)\
-                .order_by(WebhookRequest.timestamp.desc())\
-                .first()
-            webhook.last_activity = last_request[0] if last_request else None
+            with sharding.request_sessions(webhook, db) as sessions:
+                webhook.request_count = sharding.count_requests(sessions, webhook.id) + archive.archived_count(db, webhook.id)
+                
+                # Get the most recent request timestamp
+                webhook.last_activity = sharding.last_request_time(sessions, webhook.id)
         
         db.close()
         return templates.TemplateResponse("index.html", {
@@ -61,8 +129,12 @@ async def add_webhook(request: Request):
         user_id=user['id']
     )
     db.add(new_webhook)
+    db.flush()
+    new_webhook.shard = sharding.assign_shard(new_webhook)
     db.commit()
     db.close()
+    mark_write(request)
+    _owned_webhooks.pop(user['id'], None)
     
     return JSONResponse({"url": webhook_url, "name": webhook_name}, status_code=201)
 
@@ -82,6 +154,8 @@ async def pause_webhook(request: Request):
     if webhook:
         webhook.status = not webhook.status
         db.commit()
+        mark_write(request)
+        response_cache.publish_change(redis_conn, webhook.id)
         result = {
             "message": "Webhook status updated successfully",
             "status": webhook.status,
@@ -106,9 +180,21 @@ async def delete_webhook(request: Request):
     ).first()
     
     if webhook:
-        db.query(WebhookRequest).filter(WebhookRequest.webhook_id == webhook.id).delete()
+        if sqlite_writer_enabled():
+            try:
+                await writer_write('delete_webhook_requests', webhook_id=webhook.id)
+            except HTTPException:
+                db.close()
+                raise
+        else:
+            sharding.delete_requests(webhook, db)
+        archive.delete_archived(db, webhook.id)
+        webhook_id = webhook.id
         db.delete(webhook)
         db.commit()
+        mark_write(request)
+        _owned_webhooks.pop(user['id'], None)
+        response_cache.publish_change(redis_conn, webhook_id)
         db.close()
         return JSONResponse({"message": "Webhook deleted successfully"}, status_code=200)
     else:
@@ -123,9 +209,17 @@ async def delete_webhook_request(request: Request):
     wbhk_id = data["id"]
     
     db = SessionLocal()
-    webhookRequest = db.query(WebhookRequest).filter(WebhookRequest.id == wbhk_id).first()
+    store = request_session(wbhk_id, db)
+    webhookRequest = store.query(WebhookRequest).filter(WebhookRequest.id == wbhk_id).first() if store else None
+    # Archived requests keep their ids
+    archived = webhookRequest is None
     
-    if webhookRequest:
+    try:
+        if archived:
+            webhookRequest = archive.find_request(db, wbhk_id)
+        if not webhookRequest:
+            raise HTTPException(status_code=404, detail="Webhook request not found")
+        
         # Verify ownership
         webhook = db.query(Webhook).filter(
             Webhook.id == webhookRequest.webhook_id,
@@ -133,16 +227,59 @@ async def delete_webhook_request(request: Request):
         ).first()
         
         if not webhook:
-            db.close()
             raise HTTPException(status_code=403, detail="Forbidden")
         
-        db.delete(webhookRequest)
-        db.commit()
-        db.close()
+        webhook_id = webhook.id
+        if archived:
+            archive.delete_archived_request(db, webhookRequest.id, webhook.id, webhookRequest.timestamp)
+            db.commit()
+        elif sqlite_writer_enabled():
+            request_id = webhookRequest.id
+            db.close()
+            await writer_write('delete_request', request_id=request_id)
+        else:
+            store.delete(webhookRequest)
+            store.commit()
+        mark_write(request)
+        response_cache.publish_change(redis_conn, webhook_id)
         return JSONResponse({"message": "Webhook request deleted successfully"}, status_code=200)
-    else:
+    finally:
+        if store is not None and store is not db:
+            store.close()
+        db.close()
+
+
+@router.post("/replay_request")
+async def replay_webhook_request(request: Request):
+    """Forward a stored request to the webhook's destinations again (maintenance lane)"""
+    user = require_auth(request)
+    data = await request.json()
+    
+    db = SessionLocal()
+    store = request_session(data["id"], db)
+    try:
+        webhook_request = store.query(WebhookRequest).filter(WebhookRequest.id == data["id"]).first() if store else None
+        if not webhook_request:
+            webhook_request = archive.find_request(db, data["id"])
+        if not webhook_request:
+            raise HTTPException(status_code=404, detail="Webhook request not found")
+        
+        webhook = db.query(Webhook).filter(
+            Webhook.id == webhook_request.webhook_id,
+            Webhook.user_id == user['id']
+        ).first()
+        if not webhook:
+            raise HTTPException(status_code=403, detail="Forbidden")
+    finally:
+        if store is not None and store is not db:
+            store.close()
         db.close()
-        raise HTTPException(status_code=404, detail="Webhook request not found")
+    
+    if embedded.embedded_enabled():
+        embedded.get_queue().replay(data["id"])
+        return JSONResponse({"message": "Replay queued", "job_id": None}, status_code=202)
+    job = queues['maintenance'].enqueue('worker.replay_request', data["id"], job_timeout=30, result_ttl=3600)
+    return JSONResponse({"message": "Replay queued", "job_id": job.id}, status_code=202)
 
 
 @router.post("/webhooks/delete_all")
@@ -162,10 +299,22 @@ async def delete_all_webhooks(request: Request):
         raise HTTPException(status_code=404, detail="Webhook not found")
     
     try:
-        num_deleted = db.query(WebhookRequest).filter(WebhookRequest.webhook_id == webhook.id).delete()
-        db.commit()
-        db.close()
+        webhook_id = webhook.id
+        num_deleted = archive.delete_archived(db, webhook_id)
+        if sqlite_writer_enabled():
+            db.commit()
+            db.close()
+            num_deleted += (await writer_write('delete_webhook_requests', webhook_id=webhook_id))['deleted']
+        else:
+            num_deleted += sharding.delete_requests(webhook, db)
+            db.commit()
+            db.close()
+        mark_write(request)
+        response_cache.publish_change(redis_conn, webhook_id)
         return JSONResponse({"message": f"Successfully deleted {num_deleted} webhook requests."}, status_code=200)
+    except HTTPException:
+        db.close()
+        raise
     except Exception as e:
         db.rollback()
         db.close()
@@ -189,15 +338,33 @@ async def webhook_settings_get(webhook_id: str, request: Request):
         raise HTTPException(status_code=404, detail="Webhook not found")
     
     destinations = ", ".join([d.url for d in webhook.destinations])
+    routing_rules = {d.url: loads(d.routing_rules) for d in webhook.destinations if d.routing_rules}
+    batch_options = {d.url: loads(d.batch_options) for d in webhook.destinations if d.batch_options}
     db.close()
     return templates.TemplateResponse("settings.html", {
         "request": request,
         "webhook": webhook,
         "destinations": destinations,
+        "routing_rules": json.dumps(routing_rules, indent=4) if routing_rules else "",
+        "batch_options": json.dumps(batch_options, indent=4) if batch_options else "",
         "user": user
     })
 
 
+def destination_options(raw, urls, validate):
+    """Parse a settings field holding a JSON object of destination URL -> options"""
+    raw = (raw or "").strip()
+    options = loads(raw) if raw else {}
+    if not isinstance(options, dict):
+        raise ValueError("Expected a JSON object keyed by destination URL")
+    unknown = set(options) - set(urls)
+    if unknown:
+        raise ValueError(f"unknown destinations: {', '.join(sorted(unknown))}")
+    for value in options.values():
+        validate(value)
+    return options
+
+
 @router.post("/settings/{webhook_id}")
 async def webhook_settings_post(webhook_id: str, request: Request):
     user = get_current_user(request)
@@ -222,18 +389,127 @@ async def webhook_settings_post(webhook_id: str, request: Request):
     raw_urls = form_data.get("destination_urls", "")
     # Replace newlines with commas, then split
     urls = raw_urls.replace('\n', ',').replace('\r', '').split(',')
+    urls = [url.strip() for url in urls if url.strip()]
+    for url in urls:
+        if sinks.is_sink(url):
+            try:
+                sinks.validate_sink(url)
+            except ValueError as e:
+                db.rollback()
+                db.close()
+                raise HTTPException(status_code=400, detail=f"Invalid destination {url}: {e}")
+    
+    # Per-destination options: JSON objects of destination URL -> settings
+    try:
+        routing_rules = destination_options(form_data.get("routing_rules"), urls, routing.validate_rules)
+    except ValueError as e:
+        db.rollback()
+        db.close()
+        raise HTTPException(status_code=400, detail=f"Invalid routing rules: {e}")
+    try:
+        batch_options = destination_options(form_data.get("batch_options"), urls, batching.validate_options)
+    except ValueError as e:
+        db.rollback()
+        db.close()
+        raise HTTPException(status_code=400, detail=f"Invalid batch options: {e}")
+    
     for url in urls:
-        url = url.strip()
-        if url:
-            new_destination = Destination(url=url, webhook_id=webhook.id)
-            db.add(new_destination)
+        new_destination = Destination(
+            url=url,
+            webhook_id=webhook.id,
+            routing_rules=dumps(routing_rules[url]) if routing_rules.get(url) else None,
+            batch_options=dumps(batch_options[url]) if url in batch_options else None,
+        )
+        db.add(new_destination)
     
     webhook.transformation_script = form_data.get("transformation_script")
+    
+    transformation_mapping = (form_data.get("transformation_mapping") or "").strip()
+    if transformation_mapping:
+        try:
+            compile_mapping(transformation_mapping)
+        except MappingError as e:
+            db.rollback()
+            db.close()
+            raise HTTPException(status_code=400, detail=f"Invalid mapping: {e}")
+    webhook.transformation_mapping = transformation_mapping or None
+    
+    ordering_key = (form_data.get("ordering_key") or "").strip()
+    try:
+        parse_key_spec(ordering_key)
+    except ValueError as e:
+        db.rollback()
+        db.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    webhook.ordered_delivery = bool(form_data.get("ordered_delivery"))
+    webhook.ordering_key = ordering_key or None
+    
+    dedup_key = (form_data.get("dedup_key") or "").strip()
+    dedup_window = (form_data.get("dedup_window") or "").strip()
+    try:
+        dedup.validate_spec(dedup_key)
+        if dedup_window and (not dedup_window.isdigit() or int(dedup_window) < 1):
+            raise ValueError("Dedup window must be a positive number of seconds")
+    except ValueError as e:
+        db.rollback()
+        db.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    webhook.dedup_key = dedup_key or None
+    webhook.dedup_window = int(dedup_window) if dedup_window else None
     db.commit()
+    mark_write(request)
+    response_cache.publish_change(redis_conn, webhook.id)
     db.close()
     return RedirectResponse(url=f"/settings/{webhook_id}?saved=true", status_code=303)
 
 
+def accept_delivery(webhook, headers, body, query_params):
+    """
+    Dedup and queue one delivery, or spool it to disk while Redis is down or
+    slow. Returns (status, job_id) with status 'queued', 'spooled', 'duplicate'
+    or 'full' (embedded queue at capacity).
+    """
+    if embedded.embedded_enabled():
+        duplicate, release = dedup.claim(ingest_conn, webhook, headers, body, query_params)
+        if duplicate:
+            return 'duplicate', None
+        if not embedded.get_queue().submit(webhook.id, headers, body, query_params):
+            release()
+            return 'full', None
+        return 'queued', None
+
+    spooler = spool.get_spool()
+    if spooler is not None and spooler.should_spool():
+        # Dedup is checked when the drainer replays it
+        spooler.append(webhook.id, headers, body, query_params, deduped=False)
+        return 'spooled', None
+
+    started = time.monotonic()
+    claimed = False
+    try:
+        duplicate, release = dedup.claim(ingest_conn, webhook, headers, body, query_params)
+        if duplicate:
+            return 'duplicate', None
+        claimed = True
+        try:
+            job_id = enqueue_delivery(webhook, headers, body, query_params, ingest_conn, ingest_queues)
+        except Exception as e:
+            if spooler is None or not isinstance(e, RedisError):
+                # Not queued, so the provider's retry must not count as a duplicate
+                release()
+            raise
+    except RedisError:
+        if spooler is None:
+            raise
+        spooler.trip()
+        spooler.append(webhook.id, headers, body, query_params, deduped=claimed)
+        return 'spooled', None
+
+    if spooler is not None and time.monotonic() - started > settings.SPOOL_LATENCY_BUDGET_MS / 1000:
+        spooler.trip()
+    return 'queued', job_id
+
+
 @router.post("/{path:path}")
 async def handle_webhook(path: str, request: Request):
     """Handle incoming webhook - no auth required"""
@@ -251,25 +527,23 @@ async def handle_webhook(path: str, request: Request):
     try:
         headers = {k: v for k, v in request.headers.items()}
         query_params = dict(request.query_params)
+        # Kept as bytes end to end; only the UI decodes it
         body = await request.body()
-        body_text = body.decode('utf-8') if body else ""
-
-        job = queue.enqueue(
-            'worker.process_webhook_in_background',
-            webhook.id,
-            headers,
-            body_text,
-            query_params,
-            job_timeout=30,
-            result_ttl=3600
-        )
-        
+
+        # Redis calls and spool writes block, so keep them off the event loop
+        status, job_id = await run_in_threadpool(accept_delivery, webhook, headers, body, query_params)
         db.close()
         
+        if status == 'duplicate':
+            # 200 so the provider stops retrying
+            return JSONResponse({"message": "Duplicate delivery ignored", "status": "duplicate"}, status_code=200)
+        if status == 'full':
+            return JSONResponse({"message": "Queue full, retry later", "status": "full"},
+                                status_code=503, headers={"Retry-After": "1"})
         return JSONResponse({
             "message": "Webhook received and queued for processing",
-            "job_id": job.id,
-            "status": "queued"
+            "job_id": job_id,
+            "status": status
         }, status_code=202)
         
     except Exception as e:
@@ -287,8 +561,13 @@ async def show_webhook(path: str, request: Request):
     if not user:
         return RedirectResponse(url="/login")
     
+    cache_key = ("page", user['id'], path)
+    cached = response_cache.list_cache.get(cache_key)
+    if cached:
+        return list_response(request, *cached, "text/html; charset=utf-8")
+    
     try:
-        db = SessionLocal()
+        db = read_session(request)
         
         webhook = db.query(Webhook).filter(
             Webhook.url == path,
@@ -299,32 +578,26 @@ async def show_webhook(path: str, request: Request):
             db.close()
             raise HTTPException(status_code=404, detail="Webhook not found")
         
-        # Get total count
-        total_requests = db.query(WebhookRequest)\
-                          .filter(WebhookRequest.webhook_id == webhook.id)\
-                          .count()
-        
-        # Get latest 100 requests
-        requests_list = db.query(WebhookRequest)\
-                          .filter(WebhookRequest.webhook_id == webhook.id)\
-                          .order_by(WebhookRequest.timestamp.desc())\
-                          .limit(100)\
-                          .all()
+        # Get total count and latest 100 requests (hot, then archived)
+        with sharding.request_sessions(webhook, db) as sessions:
+            total_requests, requests_list = archive.requests_page(sessions, db, webhook.id, limit=100)
         
         for req in requests_list:
             try:
-                req.headers = json.loads(req.headers)
-            except json.JSONDecodeError:
+                req.headers = loads(req.headers)
+            except ValueError:
                 req.headers = {}
         
         db.close()
-        return templates.TemplateResponse("webhook_details.html", {
+        page = templates.TemplateResponse("webhook_details.html", {
             "request": request,
             "webhook": webhook,
             "requests": requests_list,
             "total_requests": total_requests,
             "user": user
         })
+        etag = response_cache.list_cache.put(cache_key, webhook.id, page.body)
+        return list_response(request, page.body, etag, "text/html; charset=utf-8")
                              
     except HTTPException:
         raise
@@ -337,7 +610,12 @@ async def get_webhook_requests(webhook_url: str, request: Request, offset: int =
     """API endpoint to get paginated webhook requests"""
     user = require_auth(request)
     
-    db = SessionLocal()
+    cache_key = ("list", user['id'], webhook_url, offset, limit)
+    cached = response_cache.list_cache.get(cache_key)
+    if cached:
+        return list_response(request, *cached, "application/json")
+    
+    db = read_session(request)
     try:
         webhook = db.query(Webhook).filter(
             Webhook.url == webhook_url,
@@ -347,25 +625,16 @@ async def get_webhook_requests(webhook_url: str, request: Request, offset: int =
         if not webhook:
             raise HTTPException(status_code=404, detail="Webhook not found")
         
-        # Get total count
-        total = db.query(WebhookRequest).filter(
-            WebhookRequest.webhook_id == webhook.id
-        ).count()
-        
-        # Get paginated requests
-        requests_list = db.query(WebhookRequest)\
-            .filter(WebhookRequest.webhook_id == webhook.id)\
-            .order_by(WebhookRequest.timestamp.desc())\
-            .offset(offset)\
-            .limit(min(limit, 100))\
-            .all()
+        # Get total count and paginated requests (hot, then archived)
+        with sharding.request_sessions(webhook, db) as sessions:
+            total, requests_list = archive.requests_page(sessions, db, webhook.id, offset, min(limit, 100))
         
         result = {
             "requests": [
                 {
                     "id": req.id,
                     "timestamp": req.timestamp.isoformat() + "Z" if req.timestamp else None,
-                    "body_length": len(req.body) if req.body else 0,
+                    "body_length": req.body_length,
                 }
                 for req in requests_list
             ],
@@ -374,17 +643,149 @@ async def get_webhook_requests(webhook_url: str, request: Request, offset: int =
             "limit": limit,
             "has_more": offset + len(requests_list) < total
         }
-        return JSONResponse(result)
+        body = JSONResponse(result).body
+        etag = response_cache.list_cache.put(cache_key, webhook.id, body)
+        return list_response(request, body, etag, "application/json")
     finally:
         db.close()
 
 
+@router.get("/api/webhook/{webhook_url}/export")
+async def export_webhook_requests(webhook_url: str, request: Request):
+    """Every stored request of a webhook as NDJSON: hot requests newest first, then archived ones"""
+    user = require_auth(request)
+    
+    db = read_session(request)
+    webhook = db.query(Webhook).filter(
+        Webhook.url == webhook_url,
+        Webhook.user_id == user['id']
+    ).first()
+    if not webhook:
+        db.close()
+        raise HTTPException(status_code=404, detail="Webhook not found")
+    
+    def export_line(req, archived):
+        body, body_encoding = req.decoded_body()
+        return dumps({
+            "id": req.id,
+            "timestamp": req.timestamp.isoformat() + "Z" if req.timestamp else None,
+            "headers": loads(req.headers),
+            "body": body,
+            "body_encoding": body_encoding,
+            "query_params": loads(req.query_params) if req.query_params else {},
+            "archived": archived,
+        }) + "\n"
+    
+    def lines():
+        try:
+            with sharding.request_sessions(webhook, db) as sessions:
+                for session in sessions:
+                    hot = session.query(WebhookRequest)\
+                        .filter(WebhookRequest.webhook_id == webhook.id)\
+                        .order_by(WebhookRequest.timestamp.desc())\
+                        .yield_per(500)
+                    for req in hot:
+                        yield export_line(req, False)
+            for req in archive.iter_archived(db, webhook.id):
+                yield export_line(req, True)
+        finally:
+            db.close()
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={
+        "Content-Disposition": f'attachment; filename="{webhook_url}.ndjson"'
+    })
+
+
+@router.get("/api/webhook/{webhook_url}/routing")
+async def get_webhook_routing(webhook_url: str, request: Request):
+    """Routing rules and matched/skipped delivery counters per destination"""
+    user = require_auth(request)
+    
+    db = read_session(request)
+    try:
+        webhook = db.query(Webhook).filter(
+            Webhook.url == webhook_url,
+            Webhook.user_id == user['id']
+        ).first()
+        
+        if not webhook:
+            raise HTTPException(status_code=404, detail="Webhook not found")
+        
+        counters = routing.routing_stats(redis_conn, webhook.id)
+        return JSONResponse({
+            "destinations": [
+                {
+                    "url": dest.url,
+                    "routing_rules": loads(dest.routing_rules) if dest.routing_rules else None,
+                    **counters.get(dest.url, {"matched": 0, "skipped": 0}),
+                }
+                for dest in webhook.destinations
+            ]
+        })
+    finally:
+        db.close()
+
+
+def check_metrics_request(resolution: str):
+    if not metrics.metrics_enabled():
+        raise HTTPException(status_code=404, detail="Live metrics are disabled")
+    if resolution not in metrics.RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of: {', '.join(metrics.RESOLUTIONS)}")
+
+
+def metrics_by_url(ids_by_url: dict, resolution: str) -> dict:
+    """metrics.read_series with the webhooks keyed by URL"""
+    series = metrics.read_series(redis_conn, list(ids_by_url.values()), resolution)
+    series["webhooks"] = {url: series["webhooks"][webhook_id] for url, webhook_id in ids_by_url.items()}
+    return series
+
+
+@router.get("/api/metrics")
+async def get_metrics(request: Request, resolution: str = "second"):
+    """Live throughput, outcome and latency series of all the user's webhooks (Redis only)"""
+    user = require_auth(request)
+    check_metrics_request(resolution)
+    return JSONResponse(metrics_by_url(owned_webhooks(request, user), resolution))
+
+
+@router.get("/api/webhook/{webhook_url}/metrics")
+async def get_webhook_metrics(webhook_url: str, request: Request, resolution: str = "second"):
+    """Live throughput, outcome and latency series of one webhook (Redis only)"""
+    user = require_auth(request)
+    check_metrics_request(resolution)
+    
+    owned = owned_webhooks(request, user)
+    if webhook_url not in owned:
+        owned = owned_webhooks(request, user, refresh=True)
+    if webhook_url not in owned:
+        raise HTTPException(status_code=404, detail="Webhook not found")
+    return JSONResponse(metrics_by_url({webhook_url: owned[webhook_url]}, resolution))
+
+
+def _parse_version(v):
+    """The timestamp a ?v= version names, or None if it is not one"""
+    try:
+        return datetime.fromisoformat(v) if v else None
+    except ValueError:
+        return None
+
+
 @router.get("/webhook/request/{request_id}")
-async def show_request(request_id: int, request: Request):
+async def show_request(request_id: int, request: Request, v: str = None):
+    """
+    A stored request. They never change, so when ?v= is the request's
+    timestamp (which differs if the id is ever reused) browsers cache it for
+    good. Any other v is revalidated against an ETag of the content.
+    """
     user = require_auth(request)
     
-    db = SessionLocal()
-    req = db.query(WebhookRequest).get(request_id)
+    db = read_session(request)
+    store = request_session(request_id, db)
+    req = store.get(WebhookRequest, request_id) if store else None
+    if store is not None and store is not db:
+        store.close()
+    if not req:
+        req = archive.find_request(db, request_id, timestamp=_parse_version(v))
     
     if not req:
         db.close()
@@ -400,14 +801,27 @@ async def show_request(request_id: int, request: Request):
         db.close()
         raise HTTPException(status_code=403, detail="Forbidden")
     
+    version = req.timestamp.isoformat() if req.timestamp else None
+    body, body_encoding = req.decoded_body()
     result = {
-        "headers": json.loads(req.headers),
-        "body": req.body,
-        "query_params": json.loads(req.query_params) if req.query_params else {},
-        "timestamp": req.timestamp.isoformat() if req.timestamp else None,
+        "headers": loads(req.headers),
+        "body": body,
+        "body_encoding": body_encoding,
+        "body_length": req.body_length,
+        "query_params": loads(req.query_params) if req.query_params else {},
+        "timestamp": version,
     }
     db.close()
-    return JSONResponse(result)
+    
+    body = JSONResponse(result).body
+    if v and v == version:
+        etag = response_cache.etag_for(f"{request_id}:{version}:{user['id']}".encode())
+        headers = {"ETag": etag, "Cache-Control": response_cache.IMMUTABLE, "Vary": "Cookie"}
+    else:
+        headers = {"ETag": response_cache.etag_for(body), "Cache-Control": response_cache.REVALIDATE, "Vary": "Cookie"}
+    if response_cache.etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @router.get("/results/{job_id}")
@@ -427,21 +841,29 @@ async def debug_db_status():
     try:
         from sqlalchemy import inspect
         from app.core import engine
+        from app.core.database import replica_router
         
         db = SessionLocal()
         inspector = inspect(engine)
         tables = inspector.get_table_names()
         
         webhook_count = db.query(Webhook).count()
-        request_count = db.query(WebhookRequest).count()
+        shard_counts = sharding.shard_counts()
+        archived = archive.archive_stats(db)
         
         db.close()
         
         return JSONResponse({
             'tables': tables,
             'webhook_count': webhook_count,
-            'request_count': request_count,
-            'database': str(engine.url)
+            'request_count': sum(shard_counts) + archived['requests'],
+            'archive': archived,
+            'database': str(engine.url),
+            'replicas': replica_router.status(),
+            'shards': [
+                {**status, 'request_count': count}
+                for status, count in zip(shard_router.status(), shard_counts)
+            ]
         })
         
     except Exception as e:
@@ -449,8 +871,8 @@ async def debug_db_status():
 
 
 @router.get('/debug/failed-jobs')
-async def debug_failed_jobs():
-    """Debug endpoint to check failed RQ jobs"""
+async def debug_failed_jobs(lane: str = 'ingest'):
+    """Debug endpoint to check failed RQ jobs for one queue lane"""
     try:
         from redis import Redis
         from rq import Queue
@@ -459,7 +881,7 @@ async def debug_failed_jobs():
         
         # Use raw bytes connection for RQ
         raw_conn = Redis.from_url(settings.REDIS_URL, decode_responses=False)
-        q = Queue(connection=raw_conn)
+        q = Queue(lane, connection=raw_conn, serializer=QueueSerializer)
         failed_registry = FailedJobRegistry(queue=q)
         started_registry = StartedJobRegistry(queue=q)
         
@@ -480,6 +902,7 @@ async def debug_failed_jobs():
         raw_conn.close()
         
         return JSONResponse({
+            'lane': lane,
             'queue_length': len(pending_job_ids),
             'pending_jobs': pending_job_ids[:10],
             'started_count': len(started_job_ids),
@@ -494,3 +917,27 @@ async def debug_failed_jobs():
             'error': str(e),
             'traceback': traceback.format_exc()
         })
+
+
+@router.get('/debug/transforms')
+async def debug_transforms():
+    """Per-webhook transform outcomes (ok, error, timeout, cpu, memory, skipped) from the sandbox pool"""
+    from app.transforms import transform_stats
+    return JSONResponse(transform_stats(redis_conn))
+
+
+@router.get('/debug/queues')
+async def debug_queues():
+    """Per-lane queue depth, oldest job age and recent wait-time percentiles"""
+    if embedded.embedded_enabled():
+        return JSONResponse({'embedded': embedded.get_queue().stats()})
+    from app.core.redis_client import lane_stats
+    stats = lane_stats()
+    if fair_scheduler.fair_scheduling_enabled():
+        stats['fair'] = fair_scheduler.backlog(redis_conn)
+    stats['ordered_partitions'] = ordered.backlog(redis_conn)
+    stats['batches'] = batching.batch_stats(redis_conn)
+    stats['dedup_hits'] = dedup.dedup_hits(redis_conn)
+    if spool.spool_enabled():
+        stats['spool'] = spool.spool_stats(redis_conn)
+    return JSONResponse(stats)
@@ -1,32 +1,46 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from app.utils.websocket import ConnectionManager
 import asyncio
-import json
-from app.core import get_pubsub
+import os
+from app.core import response_cache
+from app.core.redis_client import get_async_pubsub
+from app.core.serialization import loads
 
 router = APIRouter()
 manager = ConnectionManager()
 
 
+async def broadcast_event(data: dict):
+    """Hand a webhook_events event to this process: drop stale cached lists, tell WebSocket clients"""
+    response_cache.handle_event(data)
+    if data.get('type') == response_cache.CHANGE_EVENT:
+        return
+    if manager.active_connections:
+        await manager.broadcast(data)
+
+
 async def redis_listener():
-    """Background task to listen for Redis pub/sub messages and broadcast to WebSocket clients"""
-    pubsub = get_pubsub()
-    print("Redis listener started, subscribed to webhook_events")
+    """
+    Background task to listen for Redis pub/sub messages and broadcast to WebSocket clients.
+    Every API process runs one with its own subscription and serves its own
+    WebSocket clients, so with several uvicorn workers each event still reaches
+    every client exactly once. The async client waits without blocking the event loop.
+    """
+    pubsub = get_async_pubsub()
+    await pubsub.subscribe('webhook_events')
+    print(f"Redis listener started in process {os.getpid()}, subscribed to webhook_events")
     
     while True:
         try:
-            message = pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1)
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
             if message and message['type'] == 'message':
-                data_str = message['data']
-                print(f"Redis message received: {data_str}")
-                data = json.loads(data_str)
-                print(f"Broadcasting to {len(manager.active_connections)} clients: {data}")
-                await manager.broadcast(data)
+                await broadcast_event(loads(message['data']))
+        except asyncio.CancelledError:
+            await pubsub.aclose()
+            raise
         except Exception as e:
             print(f"Error in redis_listener: {e}")
-            import traceback
-            traceback.print_exc()
-        await asyncio.sleep(0.05)
+            await asyncio.sleep(1)
 
 
 @router.websocket("/ws")
@@ -0,0 +1,12 @@
+from .sandbox import (
+    ScriptCache, TransformError, compile_transform, compile_transform_batch, transform_body, transform_bodies
+)
+from .mapping import MappingError, compile_mapping
+from .pool import transform_pool_enabled, run_in_pool, run_batch_in_pool, transform_stats
+
+__all__ = [
+    'ScriptCache', 'TransformError', 'compile_transform', 'compile_transform_batch',
+    'transform_body', 'transform_bodies',
+    'MappingError', 'compile_mapping',
+    'transform_pool_enabled', 'run_in_pool', 'run_batch_in_pool', 'transform_stats',
+]
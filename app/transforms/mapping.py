@@ -0,0 +1,284 @@
+"""
+Declarative transformation mappings.
+
+A mapping is a JSON document that builds the forwarded payload from the
+received one without running user code:
+
+    {
+        "merge": false,
+        "fields": {
+            "event_type": "$.type",
+            "user.id": {"path": "$.user.id", "default": null},
+            "source": {"const": "github"},
+            "summary": {"template": "{user.name} pushed {commits.0.id}"},
+            "tier": {"if": {"path": "$.amount", "op": "gt", "value": 100},
+                     "then": "big", "else": "small"},
+            "email": {"coalesce": ["$.user.email", "$.pusher.email"]}
+        },
+        "drop": ["secret"]
+    }
+
+- `fields` maps output keys (dotted keys create nested objects) to expressions.
+- Expressions: a "$.a.b" path string, any other JSON value as a constant, or
+  one of {"path", "default"}, {"const"}, {"template"}, {"if", "then", "else"},
+  {"coalesce": [...]}.
+- Conditions: {"path", "op", "value"} with op one of eq, ne, gt, gte, lt, lte,
+  in, contains, exists, truthy; or {"all": [...]}, {"any": [...]}, {"not": ...}.
+- `merge: true` starts from a copy of the input instead of an empty object;
+  nested objects are copied before a dotted key writes into them, so the input
+  is never modified.
+- `drop` removes top-level keys from the result, after `fields` are applied.
+
+compile_mapping() validates a mapping and compiles it once into plain Python
+closures, so applying it costs only dict lookups.
+"""
+
+import copy
+import operator
+import string
+
+from app.core.serialization import loads
+
+MISSING = object()
+
+
+class MappingError(ValueError):
+    """The mapping document is invalid"""
+
+
+def _compile_path(path: str):
+    """Getter for a "$.a.b.0" path; numeric parts index lists"""
+    if path == "$":
+        return lambda data: data
+    if not path.startswith("$."):
+        raise MappingError(f"Path '{path}' must start with '$.'")
+    parts = []
+    for part in path[2:].split("."):
+        if not part:
+            raise MappingError(f"Empty segment in path '{path}'")
+        parts.append(int(part) if part.lstrip("-").isdigit() else part)
+    parts = tuple(parts)
+
+    # Object-only paths (the common case) get a getter without per-step type dispatch
+    if all(isinstance(part, str) for part in parts):
+        if len(parts) == 1:
+            key = parts[0]
+            return lambda data: data.get(key, MISSING) if type(data) is dict else MISSING
+        if len(parts) == 2:
+            first, second = parts
+
+            def get_two(data):
+                if type(data) is dict:
+                    data = data.get(first)
+                    if type(data) is dict:
+                        return data.get(second, MISSING)
+                return MISSING
+
+            return get_two
+
+    def get(data):
+        for part in parts:
+            if isinstance(data, dict):
+                data = data.get(part if isinstance(part, str) else str(part), MISSING)
+            elif isinstance(data, list) and isinstance(part, int) and -len(data) <= part < len(data):
+                data = data[part]
+            else:
+                return MISSING
+            if data is MISSING:
+                return MISSING
+        return data
+
+    return get
+
+
+def _compile_template(template: str):
+    """Getter that fills "{a.b}" placeholders from the input (missing values render empty)"""
+    if not isinstance(template, str):
+        raise MappingError("template must be a string")
+    pieces = []
+    try:
+        parsed = list(string.Formatter().parse(template))
+    except ValueError as e:
+        raise MappingError(f"Invalid template: {e}")
+    for literal, field, spec, conversion in parsed:
+        if literal:
+            pieces.append(literal)
+        if field is not None:
+            if spec or conversion:
+                raise MappingError("Template placeholders don't support format specs or conversions")
+            pieces.append(_compile_path("$." + field if field else "$"))
+
+    def render(data):
+        out = []
+        for piece in pieces:
+            if isinstance(piece, str):
+                out.append(piece)
+            else:
+                value = piece(data)
+                if value is not MISSING and value is not None:
+                    out.append(value if isinstance(value, str) else str(value))
+        return "".join(out)
+
+    return render
+
+
+COMPARISONS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "in": lambda value, options: value in options,
+    "contains": lambda value, item: item in value,
+}
+
+
+def _compile_condition(cond):
+    if not isinstance(cond, dict):
+        raise MappingError(f"Condition must be an object, got {cond!r}")
+    if "all" in cond or "any" in cond:
+        key = "all" if "all" in cond else "any"
+        if not isinstance(cond[key], list) or not cond[key]:
+            raise MappingError(f"'{key}' needs a non-empty list of conditions")
+        checks = tuple(_compile_condition(c) for c in cond[key])
+        if key == "all":
+            return lambda data: all(check(data) for check in checks)
+        return lambda data: any(check(data) for check in checks)
+    if "not" in cond:
+        check = _compile_condition(cond["not"])
+        return lambda data: not check(data)
+
+    if "path" not in cond:
+        raise MappingError(f"Condition needs 'path', 'all', 'any' or 'not': {cond!r}")
+    get = _compile_path(cond["path"])
+    op = cond.get("op", "truthy")
+    if op == "exists":
+        return lambda data: get(data) is not MISSING
+    if op == "truthy":
+        return lambda data: bool(get(data)) if get(data) is not MISSING else False
+    if op not in COMPARISONS:
+        raise MappingError(f"Unknown op '{op}' (use {', '.join(sorted([*COMPARISONS, 'exists', 'truthy']))})")
+    if "value" not in cond:
+        raise MappingError(f"Op '{op}' needs a 'value'")
+    compare, expected = COMPARISONS[op], cond["value"]
+
+    def check(data):
+        value = get(data)
+        if value is MISSING:
+            return False
+        try:
+            return bool(compare(value, expected))
+        except TypeError:
+            return False
+
+    return check
+
+
+def _compile_expr(expr):
+    """Compile an expression into a function of the input returning a value or MISSING"""
+    if isinstance(expr, str):
+        if expr.startswith("$"):
+            return _compile_path(expr)
+        return lambda data, value=expr: value
+    if not isinstance(expr, dict):
+        value = expr
+        return lambda data: copy.deepcopy(value) if isinstance(value, list) else value
+
+    if "path" in expr:
+        get = _compile_path(expr["path"])
+        if "default" not in expr:
+            return get
+        default = expr["default"]
+
+        def get_or_default(data):
+            value = get(data)
+            return default if value is MISSING else value
+
+        return get_or_default
+    if "const" in expr:
+        value = expr["const"]
+        return lambda data: copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+    if "template" in expr:
+        return _compile_template(expr["template"])
+    if "if" in expr:
+        check = _compile_condition(expr["if"])
+        then = _compile_expr(expr["then"]) if "then" in expr else (lambda data: MISSING)
+        otherwise = _compile_expr(expr["else"]) if "else" in expr else (lambda data: MISSING)
+        return lambda data: then(data) if check(data) else otherwise(data)
+    if "coalesce" in expr:
+        if not isinstance(expr["coalesce"], list) or not expr["coalesce"]:
+            raise MappingError("'coalesce' needs a non-empty list of expressions")
+        options = tuple(_compile_expr(e) for e in expr["coalesce"])
+
+        def first(data):
+            for option in options:
+                value = option(data)
+                if value is not MISSING and value is not None:
+                    return value
+            return MISSING
+
+        return first
+    raise MappingError(f"Unknown expression {expr!r} (use path, const, template, if or coalesce)")
+
+
+def compile_mapping(mapping):
+    """Validate a mapping (JSON text or dict) and compile it into a transform(data) function"""
+    if isinstance(mapping, (str, bytes)):
+        try:
+            mapping = loads(mapping)
+        except ValueError as e:
+            raise MappingError(f"Mapping is not valid JSON: {e}")
+    if not isinstance(mapping, dict):
+        raise MappingError("Mapping must be a JSON object")
+    unknown = set(mapping) - {"fields", "merge", "drop"}
+    if unknown:
+        raise MappingError(f"Unknown mapping keys: {', '.join(sorted(unknown))}")
+
+    fields = mapping.get("fields", {})
+    if not isinstance(fields, dict):
+        raise MappingError("'fields' must be an object")
+    merge = bool(mapping.get("merge", False))
+    drop = mapping.get("drop", [])
+    if not isinstance(drop, list) or not all(isinstance(key, str) for key in drop):
+        raise MappingError("'drop' must be a list of keys")
+    drop = tuple(drop)
+
+    assignments = []
+    for key, expr in fields.items():
+        try:
+            getter = _compile_expr(expr)
+        except MappingError as e:
+            raise MappingError(f"Field '{key}': {e}")
+        assignments.append((tuple(key.split(".")), getter))
+    flat = tuple((path[0], getter) for path, getter in assignments if len(path) == 1)
+    nested = tuple((path, getter) for path, getter in assignments if len(path) > 1)
+
+    def transform(data):
+        result = dict(data) if merge and isinstance(data, dict) else {}
+        for key, getter in flat:
+            value = getter(data)
+            if value is not MISSING:
+                result[key] = value
+        # Dicts built or copied by this call; any other dict belongs to the input
+        owned = set()
+        for path, getter in nested:
+            value = getter(data)
+            if value is MISSING:
+                continue
+            target = result
+            for part in path[:-1]:
+                child = target.get(part)
+                if not isinstance(child, dict):
+                    child = target[part] = {}
+                    owned.add(id(child))
+                elif id(child) not in owned:
+                    child = target[part] = dict(child)
+                    owned.add(id(child))
+                target = child
+            target[path[-1]] = value
+        for key in drop:
+            result.pop(key, None)
+        return result
+
+    return transform
@@ -0,0 +1,340 @@
+"""
+Sandboxed transform execution pool.
+
+Transform scripts are user code. Run inline, one `while True` or huge
+allocation blocks a worker for the whole job timeout. With TRANSFORM_POOL=True
+workers send transforms to this service instead. It keeps TRANSFORM_POOL_SIZE
+long-lived sandbox processes, each with a warm compiled-script cache, and
+enforces per-call limits:
+
+- wall clock: TRANSFORM_TIMEOUT_MS (in-process timer, with a kill as backstop)
+- CPU: TRANSFORM_CPU_SECONDS (RLIMIT_CPU soft limit, re-armed per call)
+- memory: TRANSFORM_MEMORY_MB (RLIMIT_AS for the whole sandbox)
+
+Outcomes are counted per webhook. A webhook that keeps hitting limits is
+put in a penalty box, and its transforms are skipped until the box expires,
+so it cannot tie up sandboxes that other webhooks need.
+
+Run with: python -m app.transforms.pool
+"""
+
+import argparse
+import logging
+import multiprocessing
+import resource
+import signal
+import time
+import uuid
+from multiprocessing.connection import wait
+
+import msgpack
+
+from app.core.config import settings
+from .sandbox import (
+    ScriptCache, TransformCPULimit, TransformTimeout, compile_transform_batch, transform_bodies, transform_body
+)
+
+logger = logging.getLogger(__name__)
+
+REQUEST_KEY = "whook:transform:requests"
+REPLY_KEY = "whook:transform:reply:{id}"
+REPLY_TTL = 60
+STATS_KEY = "whook:transform:stats:{webhook_id}"
+STATS_INDEX_KEY = "whook:transform:webhooks"
+STRIKES_KEY = "whook:transform:strikes:{webhook_id}"
+PENALTY_KEY = "whook:transform:penalty:{webhook_id}"
+
+LIMIT_OUTCOMES = ("timeout", "cpu", "memory")
+
+
+def transform_pool_enabled() -> bool:
+    return settings.TRANSFORM_POOL
+
+
+def _call_pool(redis_conn, webhook_id, script: str, request: dict):
+    """Queue one sandbox call and wait for its reply; returns the reply dict or None"""
+    if webhook_id is not None and redis_conn.exists(PENALTY_KEY.format(webhook_id=webhook_id)):
+        redis_conn.hincrby(STATS_KEY.format(webhook_id=webhook_id), "skipped", 1)
+        return {'status': 'skipped'}
+
+    reply = REPLY_KEY.format(id=uuid.uuid4().hex)
+    redis_conn.rpush(REQUEST_KEY, msgpack.packb({
+        'webhook_id': webhook_id,
+        'script': script,
+        'reply': reply,
+        # Unix time after which nobody waits for the reply, so the pool skips the call
+        'start_by': time.time() + settings.TRANSFORM_QUEUE_WAIT_SECONDS,
+        **request,
+    }, use_bin_type=True))
+    wait_seconds = settings.TRANSFORM_TIMEOUT_MS / 1000.0 + settings.TRANSFORM_QUEUE_WAIT_SECONDS
+    item = redis_conn.blpop(reply, timeout=max(1, int(wait_seconds + 0.999)))
+    if item is None:
+        return {'status': 'unavailable'}
+    return msgpack.unpackb(item[1], raw=False)
+
+
+def run_in_pool(redis_conn, webhook_id, script: str, body: bytes):
+    """
+    Run a transform in the pool. Returns (status, body) where status is 'ok',
+    'skipped' (webhook is penalised), 'unavailable' (no reply) or the failure kind.
+    `redis_conn` must be a bytes (decode_responses=False) connection.
+    """
+    result = _call_pool(redis_conn, webhook_id, script, {'body': body})
+    if result['status'] == 'ok':
+        return "ok", result['body']
+    return result['status'], body
+
+
+def run_batch_in_pool(redis_conn, webhook_id, script: str, bodies: list):
+    """
+    Run a script's batch transform over many bodies in one sandbox call.
+    Returns (status, bodies) like run_in_pool; the limits apply to the whole batch.
+    """
+    result = _call_pool(redis_conn, webhook_id, script, {'bodies': bodies})
+    if result['status'] == 'ok':
+        return "ok", result['body']
+    return result['status'], bodies
+
+
+def transform_stats(redis_conn) -> dict:
+    """Per-webhook outcome counters and remaining penalty time"""
+    stats = {}
+    for webhook_id in sorted(redis_conn.smembers(STATS_INDEX_KEY), key=int):
+        counters = redis_conn.hgetall(STATS_KEY.format(webhook_id=webhook_id))
+        stats[webhook_id] = {
+            **{field: int(value) for field, value in counters.items() if field != 'last_error'},
+            'last_error': counters.get('last_error'),
+            'penalty_seconds': max(0, redis_conn.ttl(PENALTY_KEY.format(webhook_id=webhook_id))),
+        }
+    return stats
+
+
+def _raise_cpu_limit(signum, frame):
+    raise TransformCPULimit("CPU limit exceeded")
+
+
+def _raise_timeout(signum, frame):
+    raise TransformTimeout("time limit exceeded")
+
+
+def sandbox_main(conn, memory_mb: int, cpu_seconds: int, timeout_ms: float, cache_size: int):
+    """Sandbox process: run transforms sent over `conn` until the pipe closes"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGXCPU, _raise_cpu_limit)
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    _, cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)
+    cache = ScriptCache(cache_size)
+    batch_cache = ScriptCache(cache_size, compiler=compile_transform_batch)
+
+    while True:
+        try:
+            script, body, bodies = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+
+        try:
+            if cpu_seconds:
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                soft = int(usage.ru_utime + usage.ru_stime) + cpu_seconds + 1
+                if cpu_hard != resource.RLIM_INFINITY:
+                    soft = min(soft, cpu_hard)
+                resource.setrlimit(resource.RLIMIT_CPU, (soft, cpu_hard))
+            signal.setitimer(signal.ITIMER_REAL, timeout_ms / 1000.0)
+            try:
+                if bodies is not None:
+                    result = ('ok', transform_bodies(batch_cache.get(script), bodies))
+                else:
+                    result = ('ok', transform_body(cache.get(script), body))
+            finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                if cpu_seconds:
+                    resource.setrlimit(resource.RLIMIT_CPU, (cpu_hard, cpu_hard))
+        except (TransformTimeout, TransformCPULimit) as e:
+            result = (e.kind, str(e))
+        except MemoryError:
+            result = ('memory', "memory limit exceeded")
+        except Exception as e:
+            result = ('error', f"{type(e).__name__}: {e}")
+        conn.send(result)
+
+
+class Sandbox:
+    """One sandbox process and the request it is working on"""
+
+    def __init__(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=sandbox_main,
+            args=(child_conn, settings.TRANSFORM_MEMORY_MB, settings.TRANSFORM_CPU_SECONDS,
+                  settings.TRANSFORM_TIMEOUT_MS, settings.TRANSFORM_CACHE_SIZE),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.request = None
+        self.deadline = 0.0
+        self.tasks = 0
+
+    def assign(self, request: dict):
+        self.request = request
+        self.tasks += 1
+        # The in-process timer should fire first; the kill is for code stuck in C
+        self.deadline = time.monotonic() + settings.TRANSFORM_TIMEOUT_MS / 1000.0 + settings.TRANSFORM_KILL_GRACE_SECONDS
+        self.conn.send((request['script'], request.get('body'), request.get('bodies')))
+
+    def stop(self):
+        self.conn.close()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+class TransformPool:
+    """Feeds queued transform requests to idle sandboxes and replies with the outcome"""
+
+    def __init__(self, redis_conn, size: int):
+        self.redis = redis_conn
+        self.size = size
+        self.sandboxes = []
+        self.running = False
+        self.completed = 0
+
+    def stop(self, *args):
+        self.running = False
+
+    def run(self):
+        self.sandboxes = [Sandbox() for _ in range(self.size)]
+        self.running = True
+        while self.running:
+            busy = [s for s in self.sandboxes if s.request is not None]
+            idle = [s for s in self.sandboxes if s.request is None]
+
+            if idle:
+                if busy:
+                    raw = self.redis.lpop(REQUEST_KEY)
+                else:
+                    item = self.redis.blpop(REQUEST_KEY, timeout=1)
+                    raw = item[1] if item else None
+                if raw is not None:
+                    request = msgpack.unpackb(raw, raw=False)
+                    if time.time() > request.get('start_by', float('inf')):
+                        self.expire(request)
+                    else:
+                        idle[0].assign(request)
+                    continue
+
+            busy = [s for s in self.sandboxes if s.request is not None]
+            if not busy:
+                continue
+            timeout = 0.005 if idle else max(0.0, min(s.deadline for s in busy) - time.monotonic())
+            ready = wait([s.conn for s in busy], timeout=timeout)
+            for sandbox in busy:
+                if sandbox.conn in ready:
+                    self.collect(sandbox)
+                elif time.monotonic() > sandbox.deadline:
+                    self.kill(sandbox)
+
+        for sandbox in self.sandboxes:
+            sandbox.stop()
+
+    def collect(self, sandbox: Sandbox):
+        try:
+            status, payload = sandbox.conn.recv()
+        except (EOFError, OSError):
+            # Died mid-call (e.g. killed by the kernel for exceeding memory)
+            self.finish(sandbox.request, 'memory', "sandbox process died")
+            self.replace(sandbox)
+            return
+        self.finish(sandbox.request, status, payload)
+        sandbox.request = None
+        if sandbox.tasks >= settings.TRANSFORM_MAX_TASKS_PER_SANDBOX:
+            self.replace(sandbox)
+
+    def kill(self, sandbox: Sandbox):
+        logger.warning(f"Transform for webhook {sandbox.request.get('webhook_id')} ignored its timer; killing sandbox")
+        sandbox.process.kill()
+        self.finish(sandbox.request, 'timeout', "time limit exceeded")
+        self.replace(sandbox)
+
+    def replace(self, sandbox: Sandbox):
+        index = self.sandboxes.index(sandbox)
+        sandbox.request = None
+        sandbox.stop()
+        self.sandboxes[index] = Sandbox()
+
+    def expire(self, request: dict):
+        """Drop a call whose worker stopped waiting (it carried on without the transform)"""
+        webhook_id = request.get('webhook_id')
+        if webhook_id is not None:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.sadd(STATS_INDEX_KEY, webhook_id)
+            pipe.hincrby(STATS_KEY.format(webhook_id=webhook_id), 'expired', 1)
+            pipe.execute()
+
+    def finish(self, request: dict, status: str, payload):
+        """Reply to the waiting worker and record the outcome for the webhook"""
+        self.completed += 1
+        reply = {'status': status}
+        if status == 'ok':
+            reply['body'] = payload
+        else:
+            reply['error'] = payload
+
+        webhook_id = request.get('webhook_id')
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.rpush(request['reply'], msgpack.packb(reply, use_bin_type=True))
+        pipe.expire(request['reply'], REPLY_TTL)
+        if webhook_id is not None:
+            pipe.sadd(STATS_INDEX_KEY, webhook_id)
+            pipe.hincrby(STATS_KEY.format(webhook_id=webhook_id), status, 1)
+            if status != 'ok':
+                pipe.hset(STATS_KEY.format(webhook_id=webhook_id), 'last_error', str(payload)[:500])
+        pipe.execute()
+
+        if webhook_id is not None and status in LIMIT_OUTCOMES:
+            self.strike(webhook_id, status)
+
+    def strike(self, webhook_id, status: str):
+        """Penalise webhooks that keep hitting limits so they stop occupying sandboxes"""
+        key = STRIKES_KEY.format(webhook_id=webhook_id)
+        strikes = self.redis.incr(key)
+        if strikes == 1:
+            self.redis.expire(key, settings.TRANSFORM_STRIKE_WINDOW_SECONDS)
+        if strikes >= settings.TRANSFORM_MAX_STRIKES:
+            self.redis.set(PENALTY_KEY.format(webhook_id=webhook_id), status, ex=settings.TRANSFORM_PENALTY_SECONDS)
+            self.redis.delete(key)
+            logger.warning(f"Webhook {webhook_id} transforms skipped for {settings.TRANSFORM_PENALTY_SECONDS}s "
+                           f"after {strikes} {status} failures")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Whook sandboxed transform pool')
+    parser.add_argument('--if-enabled', action='store_true', help='Exit quietly unless TRANSFORM_POOL=True')
+    args = parser.parse_args()
+
+    if not transform_pool_enabled():
+        if args.if_enabled:
+            return 0
+        print("Transform pool requires TRANSFORM_POOL=True")
+        return 1
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+    from redis import Redis
+
+    pool = TransformPool(Redis.from_url(settings.REDIS_URL, decode_responses=False), settings.TRANSFORM_POOL_SIZE)
+    signal.signal(signal.SIGTERM, pool.stop)
+    signal.signal(signal.SIGINT, pool.stop)
+    print(f"✅ Transform pool started ({pool.size} sandboxes, {settings.TRANSFORM_TIMEOUT_MS:g}ms, "
+          f"{settings.TRANSFORM_CPU_SECONDS}s CPU, {settings.TRANSFORM_MEMORY_MB}MB)")
+    pool.run()
+    print(f"👋 Transform pool stopped after {pool.completed} transforms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
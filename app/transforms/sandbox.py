@@ -0,0 +1,131 @@
+"""
+Restricted execution of user transform scripts.
+
+Used inline by the worker and inside the sandbox processes of the
+transform pool (app.transforms.pool).
+"""
+
+import csv
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+from RestrictedPython import compile_restricted, safe_globals
+from RestrictedPython.Eval import default_guarded_getitem, default_guarded_getiter
+from RestrictedPython.Guards import full_write_guard, guarded_iter_unpack_sequence
+
+from app.core.serialization import dumps_bytes, loads
+
+
+class TransformError(Exception):
+    """A transform failed; `kind` says how (error, timeout, cpu, memory)"""
+    kind = "error"
+
+
+class TransformTimeout(TransformError):
+    kind = "timeout"
+
+
+class TransformCPULimit(TransformError):
+    kind = "cpu"
+
+
+def script_globals() -> dict:
+    """Globals a transform script runs with"""
+    script_env = safe_globals.copy()
+    script_env.update({'json': json, 'time': time, 'csv': csv})
+    script_env['_write_'] = full_write_guard
+    # Loops, comprehensions and subscripts (transform_batch iterates over its items)
+    script_env['_getiter_'] = default_guarded_getiter
+    script_env['_getitem_'] = default_guarded_getitem
+    script_env['_iter_unpack_sequence_'] = guarded_iter_unpack_sequence
+    return script_env
+
+
+def _exec_script(script: str) -> dict:
+    byte_code = compile_restricted(script, '<string>', 'exec')
+    local_env = {}
+    exec(byte_code, script_globals(), local_env)
+    return local_env
+
+
+def compile_transform(script: str):
+    """Compile a script and return its transform(data) function"""
+    local_env = _exec_script(script)
+    transform_func = local_env.get('transform')
+    if callable(transform_func):
+        return transform_func
+    batch_func = local_env.get('transform_batch')
+    if callable(batch_func):
+        return lambda data: batch_func([data])[0]
+    raise TransformError("script does not define transform(data)")
+
+
+def compile_transform_batch(script: str):
+    """
+    Compile a script and return a function of a list of payloads. Uses the
+    script's transform_batch(items) if it defines one, else calls transform per item.
+    """
+    local_env = _exec_script(script)
+    batch_func = local_env.get('transform_batch')
+    if callable(batch_func):
+        return batch_func
+    transform_func = local_env.get('transform')
+    if not callable(transform_func):
+        raise TransformError("script does not define transform(data) or transform_batch(items)")
+    return lambda items: [transform_func(data) for data in items]
+
+
+def transform_body(transform_func, body) -> bytes:
+    """Apply a compiled transform to a JSON body, returning the JSON bytes to forward"""
+    return dumps_bytes(transform_func(loads(body)))
+
+
+def transform_bodies(batch_func, bodies: list) -> list:
+    """
+    Apply a compiled batch transform to many bodies in one call. Bodies that are
+    not JSON are left out of the batch and returned unchanged.
+    """
+    results = list(bodies)
+    positions, items = [], []
+    for position, body in enumerate(bodies):
+        try:
+            items.append(loads(body))
+        except ValueError:
+            continue
+        positions.append(position)
+    if not items:
+        return results
+    transformed = batch_func(items)
+    if not isinstance(transformed, (list, tuple)) or len(transformed) != len(items):
+        raise TransformError(f"transform_batch returned {type(transformed).__name__} "
+                             f"instead of a list of {len(items)} items")
+    for position, data in zip(positions, transformed):
+        results[position] = dumps_bytes(data)
+    return results
+
+
+class ScriptCache:
+    """LRU of compiled transforms keyed by script hash"""
+
+    def __init__(self, maxsize: int = 256, compiler=compile_transform):
+        self.maxsize = maxsize
+        self.compiler = compiler
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, script: str):
+        key = hashlib.sha1(script.encode("utf-8")).hexdigest()
+        func = self.entries.get(key)
+        if func is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return func
+        self.misses += 1
+        func = self.compiler(script)
+        self.entries[key] = func
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return func
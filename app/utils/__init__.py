@@ -1,4 +1,4 @@
-from .auth import get_current_user, require_auth, get_or_create_user
+from .auth import get_current_user, require_auth, require_admin, get_or_create_user
 from .websocket import ConnectionManager
 
-__all__ = ['get_current_user', 'require_auth', 'get_or_create_user', 'ConnectionManager']
+__all__ = ['get_current_user', 'require_auth', 'require_admin', 'get_or_create_user', 'ConnectionManager']
@@ -3,6 +3,7 @@ from typing import Optional
 from datetime import datetime
 from app.models import User
 from app.core import SessionLocal
+from app.core.config import settings
 
 
 def get_current_user(request: Request) -> Optional[dict]:
@@ -18,6 +19,14 @@ def require_auth(request: Request) -> dict:
     return user
 
 
+def require_admin(request: Request) -> dict:
+    """Require an authenticated user listed in ADMIN_EMAILS"""
+    user = require_auth(request)
+    if (user.get('email') or '').lower() not in settings.ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return user
+
+
 async def get_or_create_user(email: str, name: str, picture: str, google_id: str) -> dict:
     """Get existing user or create new one, returns user data dict"""
     db = SessionLocal()
@@ -0,0 +1,61 @@
+import json
+
+from app.core.serialization import loads
+
+
+def parse_key_spec(spec):
+    """Split a key spec like 'header:X-Customer' or 'json:data.customer.id' into (source, name)"""
+    if not spec or not spec.strip():
+        return None, None
+    source, _, name = spec.strip().partition(":")
+    source = source.lower()
+    if source not in ("header", "json", "query") or not name:
+        raise ValueError(f"Invalid key '{spec}' (use header:<name>, json:<path> or query:<name>)")
+    return source, name
+
+
+def json_path(data, path: str):
+    """Follow a dotted path (list indexes allowed) through parsed JSON; None when missing"""
+    for part in path.split("."):
+        if isinstance(data, dict):
+            data = data.get(part)
+        elif isinstance(data, list) and part.lstrip("-").isdigit():
+            index = int(part)
+            data = data[index] if -len(data) <= index < len(data) else None
+        else:
+            return None
+        if data is None:
+            return None
+    return data
+
+
+def extract_key(spec, headers: dict, body, query_params: dict = None):
+    """
+    Value of a key spec for one delivery, as a string, or None when the spec is
+    empty or the value is missing. `body` may be raw text or already-parsed JSON.
+    """
+    source, name = parse_key_spec(spec)
+    if source is None:
+        return None
+
+    if source == "header":
+        lowered = name.lower()
+        for header, value in (headers or {}).items():
+            if header.lower() == lowered:
+                return value
+        return None
+
+    if source == "query":
+        value = (query_params or {}).get(name)
+        return None if value is None else str(value)
+
+    if isinstance(body, (str, bytes)):
+        try:
+            body = loads(body)
+        except ValueError:
+            return None
+    value = json_path(body, name)
+    if value is None:
+        return None
+    # Non-string values keep the stdlib encoding: stored dedup keys and ordering partitions depend on it
+    return value if isinstance(value, str) else json.dumps(value, sort_keys=True)
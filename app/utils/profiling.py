@@ -0,0 +1,217 @@
+"""
+Opt-in profiling: a low-overhead sampling profiler, slow request/job sampling
+and per-route slow SQL recording.
+
+Profiles are written in the collapsed-stack ("folded") format understood by
+flamegraph.pl, speedscope and inferno.
+"""
+
+import contextvars
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from sqlalchemy import event
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SLOW_SQL_KEY = "whook:slowsql:{route}"
+SLOW_SQL_ROUTES_KEY = "whook:slowsql:routes"
+
+# Label of the route or job currently running in this context, used to attribute SQL
+current_route: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_route", default=None)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    cwd = os.getcwd()
+    if filename.startswith(cwd):
+        filename = filename[len(cwd) + 1:]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples thread stacks from a background thread and aggregates them as folded stacks"""
+
+    def __init__(self, interval: Optional[float] = None, thread_id: Optional[int] = None):
+        self.interval = interval if interval is not None else settings.PROFILE_SAMPLE_INTERVAL_MS / 1000.0
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="whook-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        return self
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_id is not None and thread_id != self.thread_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def write(self, path: str) -> str:
+        """Append folded stacks to `path` (appending lets several processes share one file)"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a") as f:
+            f.write(self.folded())
+        return path
+
+
+def profile_output_path(label: str) -> str:
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(settings.PROFILE_OUTPUT_DIR, f"{label}-{os.getpid()}-{stamp}.folded")
+
+
+def profile_for(seconds: float, label: str) -> str:
+    """Profile the whole process for `seconds` in the background; returns the output path"""
+    path = profile_output_path(label)
+    profiler = SamplingProfiler().start()
+
+    def finish():
+        time.sleep(seconds)
+        profiler.stop().write(path)
+        logger.warning(f"Profile written: {path} ({profiler.samples} samples)")
+
+    threading.Thread(target=finish, name="whook-profiler-timer", daemon=True).start()
+    return path
+
+
+class SlowSampler:
+    """Samples a fraction of requests/jobs and keeps the profile only if they ran slow"""
+
+    def __init__(self, label: str, threshold_ms: float, sample_rate: float):
+        self.label = label
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self._busy = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def begin(self) -> Optional[SamplingProfiler]:
+        """Start a profiler on the current thread if this call is sampled and none is running"""
+        if random.random() >= self.sample_rate or not self._busy.acquire(blocking=False):
+            return None
+        return SamplingProfiler(thread_id=threading.get_ident()).start()
+
+    def end(self, profiler: Optional[SamplingProfiler], name: str, elapsed_ms: float):
+        if elapsed_ms >= self.threshold_ms:
+            logger.warning(f"Slow {self.label}: {name} took {elapsed_ms:.1f} ms")
+        if profiler is None:
+            return
+        profiler.stop()
+        self._busy.release()
+        if elapsed_ms >= self.threshold_ms and profiler.stacks:
+            safe_name = "".join(c if c.isalnum() else "_" for c in name).strip("_")[:80]
+            profiler.write(profile_output_path(f"slow-{self.label}-{safe_name}"))
+
+
+def install_sql_recorder(engine, redis_conn):
+    """Record statements slower than PROFILE_SLOW_SQL_MS per route into Redis sorted sets"""
+    threshold = settings.PROFILE_SLOW_SQL_MS / 1000.0
+    keep = settings.PROFILE_SLOW_SQL_TOP_N
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("whook_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["whook_query_start"].pop()
+        elapsed = time.perf_counter() - started
+        if elapsed < threshold:
+            return
+        route = str(current_route.get() or "unknown")
+        key = SLOW_SQL_KEY.format(route=route)
+        try:
+            pipe = redis_conn.pipeline(transaction=False)
+            pipe.sadd(SLOW_SQL_ROUTES_KEY, route)
+            pipe.zadd(key, {" ".join(statement.split())[:2000]: round(elapsed * 1000, 3)}, gt=True)
+            pipe.zremrangebyrank(key, 0, -(keep + 1))
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Slow SQL record failed: {e}")
+
+
+def get_slow_queries(redis_conn, limit: int = 20) -> dict:
+    """Slowest recorded statements per route, slowest first"""
+    result = {}
+    for route in sorted(redis_conn.smembers(SLOW_SQL_ROUTES_KEY)):
+        entries = redis_conn.zrevrange(SLOW_SQL_KEY.format(route=route), 0, limit - 1, withscores=True)
+        result[route] = [{"statement": stmt, "duration_ms": score} for stmt, score in entries]
+    return result
+
+
+def clear_slow_queries(redis_conn):
+    routes = redis_conn.smembers(SLOW_SQL_ROUTES_KEY)
+    if routes:
+        redis_conn.delete(*[SLOW_SQL_KEY.format(route=r) for r in routes])
+    redis_conn.delete(SLOW_SQL_ROUTES_KEY)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that labels SQL by route and samples slow HTTP requests"""
+
+    def __init__(self, app):
+        self.app = app
+        self.sampler = SlowSampler("request", settings.PROFILE_SLOW_REQUEST_MS, settings.PROFILE_SLOW_SAMPLE_RATE)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token = current_route.set(_RouteLabel(scope))
+        profiler = self.sampler.begin() if self.sampler.enabled else None
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if self.sampler.enabled:
+                self.sampler.end(profiler, str(current_route.get()), (time.perf_counter() - started) * 1000)
+            current_route.reset(token)
+
+
+class _RouteLabel:
+    """Resolves to the matched route template lazily, since routing happens after the middleware"""
+
+    def __init__(self, scope):
+        self.scope = scope
+
+    def __str__(self):
+        route = self.scope.get("route")
+        path = getattr(route, "path", None) or self.scope.get("path", "")
+        return f"{self.scope.get('method', '')} {path}"
+
+    def __bool__(self):
+        return True
@@ -0,0 +1 @@
+"""Benchmarks for Whook (run with python -m benchmarks.<name>)"""
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmark for a running Whook deployment.
+
+Drives open-loop traffic (constant-rate or bursts) at a webhook whose only
+destination is a local stub server, then reports ingest latency, end-to-end
+ingest-to-forward latency, achieved throughput and process resource use as
+JSON so runs against different backends or commits can be diffed.
+
+Usage:
+    python -m benchmarks.load run --rate 200 --duration 30 --output sqlite.json
+    python -m benchmarks.load burst --burst-size 500 --bursts 5 --output burst.json
+    python -m benchmarks.load sweep --start-rate 100 --max-rate 5000 --output sweep.json
+    python -m benchmarks.load compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import string
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Fixed payload sizes (bytes) so runs are comparable across commits
+PAYLOAD_SIZES = [256, 4096, 65536]
+
+SEQ_HEADER = "X-Whook-Bench-Seq"
+SENT_HEADER = "X-Whook-Bench-Sent"
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def summarize(values):
+    """Latency summary in milliseconds"""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p90_ms": round(percentile(values, 90) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(max(values) * 1000, 3),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+    }
+
+
+def make_payload(size: int, seq: int) -> bytes:
+    """Build a JSON body padded to roughly `size` bytes"""
+    base = {"event": "bench", "seq": seq, "padding": ""}
+    overhead = len(json.dumps(base))
+    base["padding"] = "x" * max(0, size - overhead)
+    return json.dumps(base).encode("utf-8")
+
+
+class StubDestination:
+    """Minimal HTTP/1.1 server that records when each forwarded delivery arrives"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.server = None
+        self.arrivals = {}
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/sink"
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                received_at = time.time()
+                headers = {}
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0") or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                seq = headers.get(SEQ_HEADER.lower())
+                sent = headers.get(SENT_HEADER.lower())
+                if seq is not None and sent is not None:
+                    self.arrivals.setdefault(int(seq), received_at - float(sent))
+
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+class ResourceSampler:
+    """Samples CPU time and RSS of server/worker processes from /proc"""
+
+    def __init__(self, pids, interval: float = 1.0):
+        self.pids = [int(p) for p in pids]
+        self.interval = interval
+        self.samples = []
+        self._task = None
+        self._ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def _read(self, pid):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu = (int(fields[11]) + int(fields[12])) / self._ticks
+            rss_kb = 0
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss_kb = int(line.split()[1])
+                        break
+            return cpu, rss_kb
+        except (OSError, IndexError, ValueError):
+            return None
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            for pid in self.pids:
+                reading = self._read(pid)
+                if reading:
+                    self.samples.append((now, pid, reading[0], reading[1]))
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.pids:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def report(self):
+        """Per-process CPU utilisation and peak RSS over the sampling window"""
+        result = {}
+        for pid in self.pids:
+            rows = [s for s in self.samples if s[1] == pid]
+            if len(rows) < 2:
+                continue
+            elapsed = rows[-1][0] - rows[0][0]
+            cpu_seconds = rows[-1][2] - rows[0][2]
+            result[str(pid)] = {
+                "cpu_seconds": round(cpu_seconds, 3),
+                "cpu_percent": round(cpu_seconds / elapsed * 100, 1) if elapsed > 0 else None,
+                "peak_rss_mb": round(max(r[3] for r in rows) / 1024, 1),
+            }
+        return result
+
+
+def setup_bench_webhook(destination_url: str) -> str:
+    """Create a throwaway user/webhook pointing at the stub destination"""
+    from app.core import SessionLocal, sharding
+    from app.models import User, Webhook, Destination
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.google_id == "whook-bench").first()
+        if not user:
+            user = User(email="bench@whook.local", name="Benchmark", google_id="whook-bench")
+            db.add(user)
+            db.flush()
+
+        path = "bench" + "".join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        webhook = Webhook(url=path, name="Benchmark", user_id=user.id)
+        db.add(webhook)
+        db.flush()
+        webhook.shard = sharding.assign_shard(webhook)
+        db.add(Destination(url=destination_url, webhook_id=webhook.id))
+        db.commit()
+        return path
+    finally:
+        db.close()
+
+
+def teardown_bench_webhook(path: str):
+    """Remove the benchmark webhook and everything stored for it"""
+    from app.core import SessionLocal, sharding
+    from app.models import Webhook
+
+    db = SessionLocal()
+    try:
+        webhook = db.query(Webhook).filter(Webhook.url == path).first()
+        if webhook:
+            sharding.delete_requests(webhook, db)
+            db.delete(webhook)
+            db.commit()
+    finally:
+        db.close()
+
+
+def backend_name() -> str:
+    from app.core.config import settings
+    url = settings.DATABASE_URL
+    if url.startswith("sqlite"):
+        return "sqlite"
+    if url.startswith("mysql"):
+        return "mysql"
+    return "postgresql"
+
+
+def queue_mode() -> str:
+    from app.core.config import settings
+    return settings.QUEUE_MODE
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+async def send_one(client, url, seq, size, scheduled_at, results):
+    """Send one delivery; latency is measured from its scheduled time (no coordinated omission)"""
+    body = make_payload(size, seq)
+    headers = {
+        "Content-Type": "application/json",
+        SEQ_HEADER: str(seq),
+        SENT_HEADER: repr(time.time()),
+    }
+    try:
+        resp = await client.post(url, content=body, headers=headers)
+        ok = resp.status_code in (200, 201, 202)
+    except httpx.HTTPError:
+        ok = False
+    results.append((seq, size, time.perf_counter() - scheduled_at, ok))
+
+
+async def open_loop(client, url, schedule, results):
+    """Fire requests at their scheduled offsets without waiting for earlier responses"""
+    start = time.perf_counter()
+    tasks = []
+    for seq, (offset, size) in enumerate(schedule):
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send_one(client, url, seq, size, start + offset, results)))
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - start
+
+
+def constant_rate_schedule(rate: float, duration: float, sizes):
+    count = int(rate * duration)
+    return [(i / rate, sizes[i % len(sizes)]) for i in range(count)]
+
+
+def burst_schedule(burst_size: int, bursts: int, interval: float, sizes):
+    return [
+        (b * interval, sizes[(b * burst_size + i) % len(sizes)])
+        for b in range(bursts)
+        for i in range(burst_size)
+    ]
+
+
+async def wait_for_forwards(stub, expected: int, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while len(stub.arrivals) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.2)
+
+
+async def run_phase(args, stub, url, schedule, label):
+    """Run one traffic phase and return its metrics"""
+    results = []
+    stub.arrivals.clear()
+    sampler = ResourceSampler(args.pids)
+    sampler.start()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        elapsed = await open_loop(client, url, schedule, results)
+
+    accepted = sum(1 for r in results if r[3])
+    await wait_for_forwards(stub, accepted, args.drain)
+    await sampler.stop()
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    ingest = [r[2] for r in results if r[3]]
+    by_size = {
+        str(size): summarize([r[2] for r in results if r[3] and r[1] == size])
+        for size in sorted({r[1] for r in results})
+    }
+    end_to_end = list(stub.arrivals.values())
+
+    return {
+        "label": label,
+        "offered": len(schedule),
+        "accepted": accepted,
+        "errors": len(results) - accepted,
+        "forwarded": len(stub.arrivals),
+        "elapsed_s": round(elapsed, 3),
+        "achieved_rps": round(accepted / elapsed, 1) if elapsed > 0 else None,
+        "ingest": summarize(ingest),
+        "ingest_by_payload_size": by_size,
+        "end_to_end": summarize(end_to_end),
+        "resources": {
+            "processes": sampler.report(),
+            "client_cpu_seconds": round(
+                (usage_after.ru_utime + usage_after.ru_stime) - (usage_before.ru_utime + usage_before.ru_stime), 3
+            ),
+        },
+    }
+
+
+def phase_sustained(phase, slo_ms: float) -> bool:
+    """A rate is sustained if almost everything was accepted, forwarded, and ingest p99 met the SLO"""
+    if phase["offered"] == 0 or phase["ingest"]["count"] == 0:
+        return False
+    return (
+        phase["errors"] <= phase["offered"] * 0.01
+        and phase["forwarded"] >= phase["accepted"] * 0.99
+        and phase["ingest"]["p99_ms"] <= slo_ms
+    )
+
+
+async def main_async(args):
+    stub = StubDestination(port=args.stub_port)
+    await stub.start()
+
+    path = args.webhook or setup_bench_webhook(stub.url)
+    url = f"{args.base_url.rstrip('/')}/{path}"
+    sizes = args.sizes or PAYLOAD_SIZES
+
+    print(f"🔗 Target: {url}")
+    print(f"🎯 Stub destination: {stub.url}")
+
+    report = {
+        "benchmark": "load",
+        "mode": args.command,
+        "backend": args.backend or backend_name(),
+        "queue_mode": args.queue_mode or queue_mode(),
+        "commit": git_commit(),
+        "started_at": datetime.utcnow().isoformat() + "Z",
+        "payload_sizes": sizes,
+        "phases": [],
+    }
+
+    try:
+        if args.command == "run":
+            schedule = constant_rate_schedule(args.rate, args.duration, sizes)
+            report["phases"].append(await run_phase(args, stub, url, schedule, f"constant-{args.rate:g}rps"))
+        elif args.command == "burst":
+            schedule = burst_schedule(args.burst_size, args.bursts, args.interval, sizes)
+            report["phases"].append(await run_phase(args, stub, url, schedule, f"burst-{args.burst_size}x{args.bursts}"))
+        elif args.command == "sweep":
+            rate = args.start_rate
+            max_sustained = None
+            while rate <= args.max_rate:
+                schedule = constant_rate_schedule(rate, args.duration, sizes)
+                phase = await run_phase(args, stub, url, schedule, f"sweep-{rate:g}rps")
+                phase["sustained"] = phase_sustained(phase, args.slo_ms)
+                report["phases"].append(phase)
+                print(f"  {rate:>8g} rps → achieved {phase['achieved_rps']} rps, "
+                      f"ingest p99 {phase['ingest'].get('p99_ms')} ms, sustained={phase['sustained']}")
+                if not phase["sustained"]:
+                    break
+                max_sustained = rate
+                rate *= args.step
+            report["max_sustained_rps"] = max_sustained
+    finally:
+        await stub.stop()
+        if not args.webhook and not args.keep:
+            teardown_bench_webhook(path)
+
+    return report
+
+
+def compare(old_path: str, new_path: str) -> int:
+    """Print per-phase metric deltas between two result files"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    old_phases = {p["label"]: p for p in old["phases"]}
+    print(f"{old.get('backend')}/{old.get('queue_mode', 'rq')} → {new.get('backend')}/{new.get('queue_mode', 'rq')}")
+    metrics = [
+        ("achieved_rps", lambda p: p["achieved_rps"]),
+        ("ingest.p50_ms", lambda p: p["ingest"].get("p50_ms")),
+        ("ingest.p99_ms", lambda p: p["ingest"].get("p99_ms")),
+        ("end_to_end.p50_ms", lambda p: p["end_to_end"].get("p50_ms")),
+        ("end_to_end.p99_ms", lambda p: p["end_to_end"].get("p99_ms")),
+    ]
+
+    print(f"{'phase':<24} {'metric':<20} {'old':>12} {'new':>12} {'delta':>9}")
+    for phase in new["phases"]:
+        before = old_phases.get(phase["label"])
+        if not before:
+            continue
+        for name, get in metrics:
+            a, b = get(before), get(phase)
+            if a is None or b is None:
+                continue
+            delta = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+            print(f"{phase['label']:<24} {name:<20} {a:>12} {b:>12} {delta:>9}")
+
+    if "max_sustained_rps" in new or "max_sustained_rps" in old:
+        print(f"max_sustained_rps: {old.get('max_sustained_rps')} → {new.get('max_sustained_rps')}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Whook load and latency benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def common(p):
+        p.add_argument("--base-url", default="http://localhost:5000", help="Whook server base URL")
+        p.add_argument("--webhook", help="Existing webhook path (default: create a temporary one)")
+        p.add_argument("--keep", action="store_true", help="Keep the temporary webhook after the run")
+        p.add_argument("--sizes", type=int, nargs="+", help=f"Payload sizes in bytes (default: {PAYLOAD_SIZES})")
+        p.add_argument("--connections", type=int, default=256, help="Max concurrent client connections")
+        p.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+        p.add_argument("--drain", type=float, default=30.0, help="Seconds to wait for forwards after sending")
+        p.add_argument("--stub-port", type=int, default=0, help="Port for the stub destination (0 = random)")
+        p.add_argument("--pids", type=int, nargs="*", default=[], help="Server/worker PIDs to sample CPU and RSS for")
+        p.add_argument("--backend", help="Backend label for the report (default: from DATABASE_URL)")
+        p.add_argument("--queue-mode", help="Queue mode label for the report (default: from QUEUE_MODE)")
+        p.add_argument("--output", help="Write JSON results to this file")
+
+    run = sub.add_parser("run", help="Open-loop constant-rate traffic")
+    common(run)
+    run.add_argument("--rate", type=float, default=100.0, help="Requests per second")
+    run.add_argument("--duration", type=float, default=10.0, help="Seconds of traffic")
+
+    burst = sub.add_parser("burst", help="Periodic bursts of traffic")
+    common(burst)
+    burst.add_argument("--burst-size", type=int, default=500, help="Requests per burst")
+    burst.add_argument("--bursts", type=int, default=5, help="Number of bursts")
+    burst.add_argument("--interval", type=float, default=2.0, help="Seconds between bursts")
+
+    sweep = sub.add_parser("sweep", help="Step the rate up to find max sustained throughput")
+    common(sweep)
+    sweep.add_argument("--start-rate", type=float, default=100.0, help="First rate to try")
+    sweep.add_argument("--max-rate", type=float, default=10000.0, help="Stop after this rate")
+    sweep.add_argument("--step", type=float, default=1.5, help="Rate multiplier between steps")
+    sweep.add_argument("--duration", type=float, default=10.0, help="Seconds per step")
+    sweep.add_argument("--slo-ms", type=float, default=100.0, help="Ingest p99 required to count as sustained")
+
+    cmp_parser = sub.add_parser("compare", help="Diff two result files")
+    cmp_parser.add_argument("old")
+    cmp_parser.add_argument("new")
+
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.command == "compare":
+        return compare(args.old, args.new)
+
+    report = asyncio.run(main_async(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"📄 Results written to {args.output}")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
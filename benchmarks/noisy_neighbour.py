@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Noisy-neighbour latency isolation benchmark.
+
+One "noisy" webhook receives a large burst while several "quiet" webhooks
+receive a steady trickle. The quiet webhooks are first measured alone
+(baseline), then alongside the burst (mixed). The isolation ratio is the
+quiet webhooks' mixed end-to-end p99 divided by their baseline p99; with a
+shared FIFO it grows with the burst size, with FAIR_SCHEDULING=True it
+should stay close to 1.
+
+Run it once per server configuration and diff the results:
+
+    FAIR_SCHEDULING=False ./run.sh   # then:
+    python -m benchmarks.noisy_neighbour run --output fifo.json
+    FAIR_SCHEDULING=True ./run.sh    # then:
+    python -m benchmarks.noisy_neighbour run --output fair.json
+    python -m benchmarks.noisy_neighbour compare fifo.json fair.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime
+
+import httpx
+
+from benchmarks.load import (
+    StubDestination,
+    backend_name,
+    git_commit,
+    send_one,
+    setup_bench_webhook,
+    summarize,
+    teardown_bench_webhook,
+    wait_for_forwards,
+)
+
+# Sequence numbers are partitioned per webhook so the stub can attribute arrivals
+SEQ_STRIDE = 1_000_000
+
+
+def noisy_schedule(count: int, spread: float, size: int):
+    """(offset, size) pairs for the burst, spread evenly over `spread` seconds"""
+    return [(i * spread / count if count else 0.0, size) for i in range(count)]
+
+
+def quiet_schedule(rate: float, duration: float, size: int):
+    return [(i / rate, size) for i in range(int(rate * duration))]
+
+
+async def drive(client, targets):
+    """Send every (webhook index, url, schedule) open-loop; returns per-webhook results"""
+    start = time.perf_counter()
+    events = sorted(
+        (offset, index, seq, size, url)
+        for index, url, schedule in targets
+        for seq, (offset, size) in enumerate(schedule)
+    )
+    results = {index: [] for index, _, _ in targets}
+    tasks = []
+    for offset, index, seq, size, url in events:
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(
+            send_one(client, url, index * SEQ_STRIDE + seq, size, start + offset, results[index])
+        ))
+    await asyncio.gather(*tasks)
+    return results, time.perf_counter() - start
+
+
+def arrivals_for(stub, indexes):
+    return [
+        latency for seq, latency in stub.arrivals.items()
+        if seq // SEQ_STRIDE in indexes
+    ]
+
+
+async def run_phase(args, stub, client, targets, label):
+    stub.arrivals.clear()
+    results, elapsed = await drive(client, targets)
+    accepted = sum(1 for rows in results.values() for r in rows if r[3])
+    await wait_for_forwards(stub, accepted, args.drain)
+
+    quiet = [index for index, _, _ in targets if index > 0]
+    phase = {
+        "label": label,
+        "elapsed_s": round(elapsed, 3),
+        "accepted": accepted,
+        "forwarded": len(stub.arrivals),
+        "quiet": {
+            "ingest": summarize([r[2] for i in quiet for r in results[i] if r[3]]),
+            "end_to_end": summarize(arrivals_for(stub, set(quiet))),
+            "per_webhook_p99_ms": {
+                str(i): summarize(arrivals_for(stub, {i})).get("p99_ms") for i in quiet
+            },
+        },
+    }
+    if 0 in results:
+        phase["noisy"] = {
+            "ingest": summarize([r[2] for r in results[0] if r[3]]),
+            "end_to_end": summarize(arrivals_for(stub, {0})),
+        }
+    return phase
+
+
+async def main_async(args):
+    from app.core.config import settings
+
+    stub = StubDestination(port=args.stub_port)
+    await stub.start()
+    base = args.base_url.rstrip("/")
+
+    paths = [setup_bench_webhook(stub.url) for _ in range(args.quiet + 1)]
+    noisy_url = f"{base}/{paths[0]}"
+    quiet_targets = [
+        (i, f"{base}/{path}", quiet_schedule(args.quiet_rate, args.duration, args.size))
+        for i, path in enumerate(paths) if i > 0
+    ]
+    burst = noisy_schedule(args.burst, args.burst_spread, args.size)
+
+    print(f"🔊 Noisy webhook: {noisy_url} ({args.burst} requests over {args.burst_spread}s)")
+    print(f"🔈 {args.quiet} quiet webhooks at {args.quiet_rate:g} rps each for {args.duration:g}s")
+
+    report = {
+        "benchmark": "noisy_neighbour",
+        "label": args.label or ("fair" if settings.FAIR_SCHEDULING else "fifo"),
+        "backend": backend_name(),
+        "commit": git_commit(),
+        "started_at": datetime.utcnow().isoformat() + "Z",
+        "burst": args.burst,
+        "quiet_webhooks": args.quiet,
+        "quiet_rate": args.quiet_rate,
+        "phases": [],
+    }
+
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    try:
+        async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+            baseline = await run_phase(args, stub, client, quiet_targets, "baseline")
+            report["phases"].append(baseline)
+            mixed = await run_phase(args, stub, client, [(0, noisy_url, burst)] + quiet_targets, "mixed")
+            report["phases"].append(mixed)
+    finally:
+        await stub.stop()
+        if not args.keep:
+            for path in paths:
+                teardown_bench_webhook(path)
+
+    before = baseline["quiet"]["end_to_end"].get("p99_ms")
+    after = mixed["quiet"]["end_to_end"].get("p99_ms")
+    report["isolation_ratio"] = round(after / before, 2) if before and after else None
+    print(f"  quiet e2e p99: baseline {before} ms → mixed {after} ms "
+          f"(isolation ratio {report['isolation_ratio']})")
+    return report
+
+
+def compare(old_path: str, new_path: str) -> int:
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def metrics(report):
+        mixed = {p["label"]: p for p in report["phases"]}["mixed"]
+        return [
+            ("quiet e2e p50_ms", mixed["quiet"]["end_to_end"].get("p50_ms")),
+            ("quiet e2e p99_ms", mixed["quiet"]["end_to_end"].get("p99_ms")),
+            ("noisy e2e p99_ms", mixed["noisy"]["end_to_end"].get("p99_ms")),
+            ("isolation_ratio", report.get("isolation_ratio")),
+        ]
+
+    print(f"{'metric':<20} {old['label']:>12} {new['label']:>12}")
+    for (name, a), (_, b) in zip(metrics(old), metrics(new)):
+        print(f"{name:<20} {a!s:>12} {b!s:>12}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Whook noisy-neighbour latency isolation benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Measure quiet-webhook latency with and without a noisy burst")
+    run.add_argument("--base-url", default="http://localhost:5000", help="Whook server base URL")
+    run.add_argument("--burst", type=int, default=5000, help="Requests sent to the noisy webhook")
+    run.add_argument("--burst-spread", type=float, default=1.0, help="Seconds over which the burst is sent")
+    run.add_argument("--quiet", type=int, default=4, help="Number of quiet webhooks")
+    run.add_argument("--quiet-rate", type=float, default=5.0, help="Requests per second per quiet webhook")
+    run.add_argument("--duration", type=float, default=20.0, help="Seconds of quiet traffic per phase")
+    run.add_argument("--size", type=int, default=1024, help="Payload size in bytes")
+    run.add_argument("--connections", type=int, default=256, help="Max concurrent client connections")
+    run.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    run.add_argument("--drain", type=float, default=120.0, help="Seconds to wait for forwards after sending")
+    run.add_argument("--stub-port", type=int, default=0, help="Port for the stub destination (0 = random)")
+    run.add_argument("--keep", action="store_true", help="Keep the temporary webhooks after the run")
+    run.add_argument("--label", help="Label for the report (default: fair/fifo from FAIR_SCHEDULING)")
+    run.add_argument("--output", help="Write JSON results to this file")
+
+    cmp_parser = sub.add_parser("compare", help="Diff two result files")
+    cmp_parser.add_argument("old")
+    cmp_parser.add_argument("new")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.command == "compare":
+        return compare(args.old, args.new)
+
+    report = asyncio.run(main_async(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"📄 Results written to {args.output}")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
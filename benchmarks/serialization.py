@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Bytes and CPU per delivery for each serialization step of the pipeline.
+
+Compares the stdlib path (pickle job payloads, json for stored headers,
+notifications and API responses) with the app.core.serialization path
+(msgpack job payloads, orjson everywhere else) at several payload sizes.
+No server or Redis needed.
+
+Usage:
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --output serialization.json
+"""
+
+import argparse
+import json
+import pickle
+import sys
+import time
+from datetime import datetime
+
+from starlette.responses import JSONResponse as StdlibJSONResponse
+
+from app.core.serialization import JSONResponse, QueueSerializer, dumps, loads, msgpack, orjson
+
+BODY_SIZES = [256, 4096, 65536]
+
+HEADERS = dict(
+    {
+        "host": "whook.example.com",
+        "content-type": "application/json",
+        "user-agent": "GitHub-Hookshot/abc123",
+        "x-github-event": "push",
+        "x-github-delivery": "72d3162e-cc78-11e3-81ab-4c9367dc0958",
+        "x-hub-signature-256": "sha256=" + "f" * 64,
+        "accept": "*/*",
+    },
+    **{f"x-forwarded-{i}": "10.0.0.1" for i in range(8)},
+)
+QUERY_PARAMS = {"source": "github", "env": "production"}
+
+
+def make_body(size: int) -> str:
+    base = {"event": "push", "repository": {"id": 1, "name": "whook"}, "commits": []}
+    commit = {"id": "a" * 40, "message": "Update README", "author": {"name": "dev", "email": "dev@example.com"}}
+    while len(json.dumps(base)) < size:
+        base["commits"].append(dict(commit))
+    return json.dumps(base)
+
+
+def stdlib_steps(body: str):
+    """One delivery through the stdlib codecs; returns bytes produced per step"""
+    job = pickle.dumps(("worker.process_webhook_in_background", None, [1, HEADERS, body, QUERY_PARAMS], {}),
+                       protocol=pickle.HIGHEST_PROTOCOL)
+    pickle.loads(job)
+    stored_headers = json.dumps(HEADERS)
+    stored_query = json.dumps(QUERY_PARAMS)
+    notification = json.dumps({"type": "new_webhook_request", "webhook_id": 1, "request_id": 1,
+                               "timestamp": "2024-01-01T00:00:00", "body_length": len(body)})
+    response = StdlibJSONResponse({"id": 1, "headers": json.loads(stored_headers), "body": body,
+                                   "query_params": json.loads(stored_query)}).body
+    return {"queue_payload": len(job), "stored_json": len(stored_headers) + len(stored_query),
+            "notification": len(notification), "response": len(response)}
+
+
+def fast_steps(body: str):
+    """One delivery through app.core.serialization; returns bytes produced per step"""
+    job = QueueSerializer.dumps(("worker.process_webhook_in_background", None, [1, HEADERS, body, QUERY_PARAMS], {}))
+    QueueSerializer.loads(job)
+    stored_headers = dumps(HEADERS)
+    stored_query = dumps(QUERY_PARAMS)
+    notification = dumps({"type": "new_webhook_request", "webhook_id": 1, "request_id": 1,
+                          "timestamp": "2024-01-01T00:00:00", "body_length": len(body)})
+    response = JSONResponse({"id": 1, "headers": loads(stored_headers), "body": body,
+                             "query_params": loads(stored_query)}).body
+    return {"queue_payload": len(job), "stored_json": len(stored_headers) + len(stored_query),
+            "notification": len(notification), "response": len(response)}
+
+
+def cpu_per_call(fn, min_time: float) -> float:
+    """Mean CPU microseconds per call"""
+    for _ in range(20):
+        fn()
+    calls = 0
+    start = time.process_time()
+    while True:
+        for _ in range(50):
+            fn()
+        calls += 50
+        elapsed = time.process_time() - start
+        if elapsed >= min_time:
+            return elapsed / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialization bytes/CPU per delivery")
+    parser.add_argument("--min-time", type=float, default=0.5, help="CPU seconds per measurement")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'body':>7} {'step':<14} {'stdlib B':>9} {'fast B':>9} {'saved':>7}")
+    for size in BODY_SIZES:
+        body = make_body(size)
+        std_bytes, fast_bytes = stdlib_steps(body), fast_steps(body)
+        std_us = cpu_per_call(lambda: stdlib_steps(body), args.min_time)
+        fast_us = cpu_per_call(lambda: fast_steps(body), args.min_time)
+        for step in std_bytes:
+            saved = (std_bytes[step] - fast_bytes[step]) / std_bytes[step] * 100
+            print(f"{len(body):>7} {step:<14} {std_bytes[step]:>9} {fast_bytes[step]:>9} {saved:>6.1f}%")
+        print(f"{len(body):>7} {'cpu µs':<14} {std_us:>9.1f} {fast_us:>9.1f} {(std_us - fast_us) / std_us * 100:>6.1f}%")
+        results.append({
+            "body_bytes": len(body),
+            "bytes": {"stdlib": std_bytes, "fast": fast_bytes},
+            "cpu_us_per_delivery": {"stdlib": round(std_us, 2), "fast": round(fast_us, 2)},
+        })
+
+    report = {
+        "benchmark": "serialization",
+        "python": sys.version.split()[0],
+        "orjson": orjson is not None,
+        "msgpack": msgpack is not None,
+        "started_at": datetime.utcnow().isoformat() + "Z",
+        "cases": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"📄 Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Declarative mappings vs equivalent RestrictedPython scripts.
+
+Each case pairs a mapping with the script it replaces and checks that both
+produce the same output. It then reports CPU per call for the transform
+alone (payload already parsed) and for the whole transform_body step
+(parse, transform, serialize). No server or Redis needed.
+
+Usage:
+    python -m benchmarks.transform_dsl
+    python -m benchmarks.transform_dsl --output transform_dsl.json
+"""
+
+import argparse
+import json
+import sys
+from datetime import datetime
+
+from app.core.serialization import loads
+from app.transforms import compile_mapping, compile_transform, transform_body
+from benchmarks.serialization import cpu_per_call
+
+PAYLOAD = {
+    "type": "invoice.paid",
+    "created": 1700000000,
+    "amount": 250,
+    "currency": "usd",
+    "user": {"id": 42, "name": "Ada", "email": "ada@example.com"},
+    "metadata": {"order_id": "ord_123", "channel": "web"},
+    "lines": [{"sku": "a", "qty": 1}, {"sku": "b", "qty": 2}],
+}
+
+CASES = {
+    "rename": (
+        """
+def transform(data):
+    return {
+        'event': data.get('type'),
+        'timestamp': data.get('created'),
+        'user_id': data.get('user', {}).get('id'),
+    }
+""",
+        {"fields": {"event": "$.type", "timestamp": "$.created", "user_id": "$.user.id"}},
+    ),
+    "pick_nested": (
+        """
+def transform(data):
+    user = data.get('user', {})
+    metadata = data.get('metadata', {})
+    return {
+        'customer': {'id': user.get('id'), 'email': user.get('email')},
+        'order': metadata.get('order_id'),
+        'source': 'billing',
+    }
+""",
+        {"fields": {"customer.id": "$.user.id", "customer.email": "$.user.email",
+                    "order": "$.metadata.order_id", "source": {"const": "billing"}}},
+    ),
+    "template": (
+        """
+def transform(data):
+    user = data.get('user', {})
+    return {
+        'text': str(user.get('name')) + ' paid ' + str(data.get('amount')) + ' ' + str(data.get('currency')),
+        'order': data.get('metadata', {}).get('order_id'),
+    }
+""",
+        {"fields": {"text": {"template": "{user.name} paid {amount} {currency}"},
+                    "order": "$.metadata.order_id"}},
+    ),
+    "conditional": (
+        """
+def transform(data):
+    amount = data.get('amount', 0)
+    return {
+        'event': data.get('type'),
+        'priority': 'high' if amount > 100 else 'normal',
+        'channel': data.get('metadata', {}).get('channel') or 'unknown',
+    }
+""",
+        {"fields": {"event": "$.type",
+                    "priority": {"if": {"path": "$.amount", "op": "gt", "value": 100},
+                                 "then": "high", "else": "normal"},
+                    "channel": {"coalesce": ["$.metadata.channel", {"const": "unknown"}]}}},
+    ),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Declarative mapping vs RestrictedPython transform CPU")
+    parser.add_argument("--min-time", type=float, default=0.5, help="CPU seconds per measurement")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    body = json.dumps(PAYLOAD).encode()
+    data = loads(body)
+    results = []
+    print(f"{'case':<12} {'step':<10} {'script µs':>10} {'mapping µs':>11} {'speedup':>8}")
+    for name, (script, mapping) in CASES.items():
+        script_func = compile_transform(script)
+        mapping_func = compile_mapping(mapping)
+        if script_func(data) != mapping_func(data):
+            print(f"❌ {name}: mapping output differs from script output")
+            return 1
+
+        timings = {}
+        for step, measure in (
+            ("transform", lambda func: (lambda: func(data))),
+            ("body", lambda func: (lambda: transform_body(func, body))),
+        ):
+            script_us = cpu_per_call(measure(script_func), args.min_time)
+            mapping_us = cpu_per_call(measure(mapping_func), args.min_time)
+            timings[step] = {"script": round(script_us, 3), "mapping": round(mapping_us, 3)}
+            print(f"{name:<12} {step:<10} {script_us:>10.2f} {mapping_us:>11.2f} {script_us / mapping_us:>7.1f}x")
+        results.append({"case": name, "cpu_us_per_call": timings})
+
+    report = {
+        "benchmark": "transform_dsl",
+        "python": sys.version.split()[0],
+        "started_at": datetime.utcnow().isoformat() + "Z",
+        "body_bytes": len(body),
+        "cases": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"📄 Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the worker's hot functions.
+
+Runs `process_webhook_in_background`, `forward_to_destination` and the
+transform step in process against a temporary SQLite database, with Redis
+and outbound HTTP replaced by in-memory stand-ins. Reports time per call
+and allocations per call (via tracemalloc) as JSON.
+
+Usage:
+    python -m benchmarks.worker_micro
+    python -m benchmarks.worker_micro --filter transform --output micro.json
+    python -m benchmarks.worker_micro --compare before.json after.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# The worker reads DATABASE_URL at import time, so point it at a scratch DB first
+_db_dir = tempfile.mkdtemp(prefix="whook-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+
+import worker  # noqa: E402
+from app.models import Base, User, Webhook, Destination  # noqa: E402
+
+BODY_SIZES = [256, 4096, 65536]
+
+HEADER_SETS = {
+    "small": {
+        "host": "whook.local",
+        "content-type": "application/json",
+        "user-agent": "bench/1.0",
+        "content-length": "0",
+    },
+    "large": dict(
+        {
+            "host": "whook.local",
+            "content-type": "application/json",
+            "user-agent": "GitHub-Hookshot/abc123",
+            "x-hub-signature-256": "sha256=" + "f" * 64,
+            "x-github-delivery": "72d3162e-cc78-11e3-81ab-4c9367dc0958",
+        },
+        **{f"x-custom-header-{i}": "v" * 64 for i in range(40)},
+    ),
+}
+
+TRANSFORM_SCRIPTS = {
+    "none": None,
+    "rename": (
+        "def transform(data):\n"
+        "    return {'event_type': data.get('event'), 'sequence': data.get('seq'), 'processed': True}\n"
+    ),
+    "heavy": (
+        "def transform(data):\n"
+        "    out = {}\n"
+        "    for key in data:\n"
+        "        out[key.upper()] = data[key]\n"
+        "    out['items'] = [{'index': i, 'label': 'item-' + str(i)} for i in range(200)]\n"
+        "    return out\n"
+    ),
+}
+
+
+class FakeJob:
+    id = "bench-job"
+
+
+class FakeQueue:
+    """Stands in for an RQ queue; records enqueues without touching Redis"""
+
+    def __init__(self):
+        self.enqueued = 0
+
+    def enqueue(self, *args, **kwargs):
+        self.enqueued += 1
+        return FakeJob()
+
+    def enqueue_in(self, *args, **kwargs):
+        return self.enqueue(*args, **kwargs)
+
+
+class FakeRedis:
+    """Stands in for the pub/sub and metrics Redis connections"""
+
+    def __init__(self):
+        self.published = 0
+        self.scripts = 0
+
+    def publish(self, channel, message):
+        self.published += 1
+        return 1
+
+    def register_script(self, script):
+        return self.run_script
+
+    def run_script(self, keys=None, args=None, client=None):
+        self.scripts += 1
+        return 1
+
+
+class FakeResponse:
+    status_code = 200
+
+
+def fake_post(url, data=None, headers=None, timeout=None, **kwargs):
+    return FakeResponse()
+
+
+def install_fakes():
+    worker.queues = {lane: FakeQueue() for lane in worker.LANES}
+    worker.conn = FakeRedis()
+    worker.pubsub_conn = FakeRedis()
+    worker.requests.post = fake_post
+
+
+def make_body(size: int) -> bytes:
+    base = {"event": "bench", "seq": 1, "padding": ""}
+    base["padding"] = "x" * max(0, size - len(json.dumps(base)))
+    return json.dumps(base).encode("utf-8")
+
+
+def setup_database(destination_count: int, script):
+    """Create tables and a webhook with the given number of destinations"""
+    Base.metadata.create_all(bind=worker.worker_engine)
+    db = worker.WorkerSessionLocal()
+    try:
+        user = db.query(User).filter(User.google_id == "bench").first()
+        if not user:
+            user = User(email="bench@whook.local", name="Bench", google_id="bench")
+            db.add(user)
+            db.flush()
+        webhook = Webhook(
+            url=f"bench-{destination_count}-{len(script or '')}-{time.time_ns()}",
+            name="Bench",
+            user_id=user.id,
+            transformation_script=script,
+        )
+        db.add(webhook)
+        db.flush()
+        for i in range(destination_count):
+            db.add(Destination(url=f"http://127.0.0.1:9/dest-{i}", webhook_id=webhook.id))
+        db.commit()
+        return webhook.id
+    finally:
+        db.close()
+
+
+def time_calls(fn, min_time: float, min_iterations: int):
+    """Time individual calls until both the time and iteration floors are met"""
+    for _ in range(min(10, min_iterations)):
+        fn()
+
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        deadline = time.perf_counter() + min_time
+        while len(samples) < min_iterations or time.perf_counter() < deadline:
+            start = time.perf_counter_ns()
+            fn()
+            samples.append(time.perf_counter_ns() - start)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    samples.sort()
+    n = len(samples)
+    return {
+        "iterations": n,
+        "mean_us": round(sum(samples) / n / 1000, 2),
+        "median_us": round(samples[n // 2] / 1000, 2),
+        "p99_us": round(samples[min(n - 1, int(n * 0.99))] / 1000, 2),
+        "min_us": round(samples[0] / 1000, 2),
+    }
+
+
+def measure_allocations(fn, iterations: int):
+    """Peak bytes allocated per call and bytes still retained after the calls"""
+    fn()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        peaks = []
+        for _ in range(iterations):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+        gc.collect()
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "peak_bytes_per_call": int(sum(peaks) / len(peaks)),
+        "retained_bytes_per_call": int(max(0, retained - baseline) / iterations),
+    }
+
+
+def build_cases():
+    """Yield (name, params, callable) for every benchmark case"""
+    for header_name, headers in HEADER_SETS.items():
+        for size in BODY_SIZES:
+            body = make_body(size)
+            yield (
+                f"forward_to_destination[headers={header_name},body={size}]",
+                {"function": "forward_to_destination", "headers": header_name, "body_bytes": size},
+                lambda body=body, headers=headers: worker.forward_to_destination(
+                    "http://127.0.0.1:9/dest", body, headers
+                ),
+            )
+
+    for script_name, script in TRANSFORM_SCRIPTS.items():
+        if script is None:
+            continue
+        for size in BODY_SIZES:
+            body = make_body(size)
+            yield (
+                f"apply_transformation[script={script_name},body={size}]",
+                {"function": "apply_transformation", "script": script_name, "body_bytes": size},
+                lambda body=body, script=script: worker.apply_transformation(script, body),
+            )
+
+    for script_name, script in TRANSFORM_SCRIPTS.items():
+        for destinations in (0, 3):
+            webhook_id = setup_database(destinations, script)
+            for header_name, headers in HEADER_SETS.items():
+                for size in BODY_SIZES:
+                    body = make_body(size)
+                    yield (
+                        f"process_webhook_in_background[script={script_name},dests={destinations},"
+                        f"headers={header_name},body={size}]",
+                        {
+                            "function": "process_webhook_in_background",
+                            "script": script_name,
+                            "destinations": destinations,
+                            "headers": header_name,
+                            "body_bytes": size,
+                        },
+                        lambda webhook_id=webhook_id, headers=headers, body=body: worker.process_webhook_in_background(
+                            webhook_id, headers, body, {"source": "bench"}
+                        ),
+                    )
+
+
+def compare(old_path: str, new_path: str) -> int:
+    with open(old_path) as f:
+        old = {c["name"]: c for c in json.load(f)["cases"]}
+    with open(new_path) as f:
+        new = json.load(f)["cases"]
+
+    print(f"{'case':<90} {'old µs':>10} {'new µs':>10} {'delta':>8} {'alloc Δ':>10}")
+    for case in new:
+        before = old.get(case["name"])
+        if not before:
+            continue
+        a, b = before["time"]["median_us"], case["time"]["median_us"]
+        alloc = case["allocations"]["peak_bytes_per_call"] - before["allocations"]["peak_bytes_per_call"]
+        print(f"{case['name']:<90} {a:>10} {b:>10} {(b - a) / a * 100:>+7.1f}% {alloc:>+10}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for worker hot functions")
+    parser.add_argument("--filter", help="Only run cases whose name contains this substring")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Minimum seconds of timing per case")
+    parser.add_argument("--min-iterations", type=int, default=50, help="Minimum timed calls per case")
+    parser.add_argument("--alloc-iterations", type=int, default=20, help="Calls traced for allocation stats")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Diff two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+
+    logging_level = worker.logger.level
+    worker.logger.setLevel("CRITICAL")
+    install_fakes()
+
+    results = []
+    for name, params, fn in build_cases():
+        if args.filter and args.filter not in name:
+            continue
+        timing = time_calls(fn, args.min_time, args.min_iterations)
+        allocations = measure_allocations(fn, args.alloc_iterations)
+        results.append({"name": name, "params": params, "time": timing, "allocations": allocations})
+        print(f"{name:<90} {timing['median_us']:>10.1f} µs {allocations['peak_bytes_per_call']:>10} B")
+
+    worker.logger.setLevel(logging_level)
+
+    report = {
+        "benchmark": "worker_micro",
+        "python": sys.version.split()[0],
+        "started_at": datetime.utcnow().isoformat() + "Z",
+        "cases": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"📄 Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
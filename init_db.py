@@ -54,6 +54,61 @@ def create_database_if_not_exists(db_url):
         print(f"Note: Could not auto-create database: {e}")
 
 
+def add_missing_columns(engine, metadata):
+    """create_all() never alters existing tables, so add columns introduced since they were created"""
+    from sqlalchemy.schema import CreateColumn
+    
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"))
+                print(f"✅ Added column {table.name}.{column.name}")
+
+
+def ensure_request_autoincrement(engine):
+    """
+    SQLite reuses the ids of deleted rows unless a table is AUTOINCREMENT, and
+    archived requests keep their ids. Rebuild a webhook_request table created
+    without it, and start its sequence above every id ever issued.
+    """
+    from app.models import ArchivePartition, WebhookRequest
+    
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.begin() as conn:
+        sql = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'webhook_request'"
+        )).scalar() or ""
+        if "AUTOINCREMENT" not in sql.upper():
+            table = WebhookRequest.__table__
+            columns = ", ".join(column.name for column in table.columns)
+            for index in inspect(conn).get_indexes("webhook_request"):
+                conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+            conn.execute(text("ALTER TABLE webhook_request RENAME TO webhook_request_old"))
+            table.create(conn)
+            conn.execute(text(f"INSERT INTO webhook_request ({columns}) SELECT {columns} FROM webhook_request_old"))
+            conn.execute(text("DROP TABLE webhook_request_old"))
+            print("✅ Rebuilt webhook_request with AUTOINCREMENT ids")
+        
+        highest = max(
+            conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM webhook_request")).scalar(),
+            conn.execute(text(f"SELECT COALESCE(MAX(max_id), 0) FROM {ArchivePartition.__tablename__}")).scalar(),
+            conn.execute(text("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'webhook_request'")).scalar(),
+        )
+        if highest:
+            conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'webhook_request'"))
+            conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('webhook_request', :seq)"), {"seq": highest})
+
+
 def init_database():
     """Initialize the database with tables and indexes"""
     db_url = os.getenv('DATABASE_URL', '')
@@ -66,6 +121,9 @@ def init_database():
     
     # Create database if needed
     create_database_if_not_exists(db_url)
+    shard_urls = [u.strip() for u in os.getenv('DATABASE_SHARD_URLS', '').split(',') if u.strip()]
+    for shard_url in shard_urls:
+        create_database_if_not_exists(shard_url)
     
     # Now import and create tables
     from app.models import Base
@@ -74,8 +132,15 @@ def init_database():
     try:
         # Create all tables
         Base.metadata.create_all(bind=engine)
+        add_missing_columns(engine, Base.metadata)
+        ensure_request_autoincrement(engine)
         print("✅ Tables created successfully!")
         
+        from app.core.sharding import init_shards
+        created = init_shards()
+        if created:
+            print(f"✅ Request tables created on shards: {', '.join(map(str, created))}")
+        
         # Verify tables were created
         inspector = inspect(engine)
         tables = inspector.get_table_names()
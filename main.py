@@ -11,21 +11,34 @@ from starlette.middleware.sessions import SessionMiddleware
 import asyncio
 
 from app.core.config import settings
-from app.routes import auth_router, webhooks_router, websocket_router
-from app.routes.websocket import redis_listener
+from app.core import engine, redis_conn
+from app.core.database import replica_router, shard_router
+from app.core import assets, embedded
+from app.core.serialization import JSONResponse
+from app.routes import auth_router, admin_router, webhooks_router, websocket_router
+from app.routes.websocket import broadcast_event, redis_listener
+from app.utils.profiling import ProfilingMiddleware, install_sql_recorder
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Whook - Webhook Manager",
     description="High-performance webhook management system",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=JSONResponse
 )
 
 # Add session middleware for OAuth
 app.add_middleware(SessionMiddleware, secret_key=settings.SECRET_KEY)
 
-# Mount static files
+# Route labelling for slow SQL, plus slow request sampling when enabled
+app.add_middleware(ProfilingMiddleware)
+if settings.PROFILE_SQL:
+    for db_engine in [engine, *replica_router.engines, *shard_router.engines[1:]]:
+        install_sql_recorder(db_engine, redis_conn)
+
+# Mount static files: sources, and the fingerprinted build templates link to when present
 app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount(assets.URL_PREFIX, assets.AssetFiles(directory=settings.ASSET_DIR, check_dir=False), name="assets")
 
 
 @app.get("/favicon.ico")
@@ -35,14 +48,20 @@ async def favicon():
 
 # Include routers
 app.include_router(auth_router, tags=["Authentication"])
+# Admin routes must come before the catch-all webhook routes
+app.include_router(admin_router, tags=["Admin"])
 app.include_router(webhooks_router, tags=["Webhooks"])
 app.include_router(websocket_router, tags=["WebSocket"])
 
 
 @app.on_event("startup")
 async def startup_event():
-    """Start the Redis listener on app startup"""
-    asyncio.create_task(redis_listener())
+    """Start the Redis listener (or, in embedded mode, the in-process queue) on app startup"""
+    if embedded.embedded_enabled():
+        await embedded.get_queue().start(broadcast_event)
+        print("✅ Embedded queue started")
+    else:
+        asyncio.create_task(redis_listener())
     print("✅ Application started successfully")
     print(f"📍 Server running on http://{settings.APP_HOST}:{settings.APP_PORT}")
 
@@ -50,6 +69,8 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
+    if embedded.embedded_enabled():
+        await embedded.get_queue().stop()
     print("👋 Application shutting down")
 
 
@@ -2,8 +2,8 @@
 
 cleanup() {
     echo "Stopping services..."
-    kill $WORKER_PID $SERVER_PID 2>/dev/null
-    wait $WORKER_PID $SERVER_PID 2>/dev/null
+    kill $WORKER_PID $SERVER_PID $WRITER_PID $DISPATCHER_PID $TRANSFORM_PID $SPOOL_PID $ARCHIVE_PID 2>/dev/null
+    wait $WORKER_PID $SERVER_PID $WRITER_PID $DISPATCHER_PID $TRANSFORM_PID $SPOOL_PID $ARCHIVE_PID 2>/dev/null
     exit 0
 }
 
@@ -17,6 +17,29 @@ if [ $? -ne 0 ]; then
     exit 1
 fi
 
+# Fingerprinted, precompressed static assets (templates fall back to /static if this fails)
+uv run python -m app.core.assets
+
+# Single SQLite writer (exits immediately unless SQLITE_WRITER=True with SQLite)
+uv run python -m app.core.sqlite_writer --if-enabled &
+WRITER_PID=$!
+
+# Fair scheduling dispatcher (exits immediately unless FAIR_SCHEDULING=True)
+uv run python -m app.core.fair_scheduler --if-enabled &
+DISPATCHER_PID=$!
+
+# Sandboxed transform pool (exits immediately unless TRANSFORM_POOL=True)
+uv run python -m app.transforms.pool --if-enabled &
+TRANSFORM_PID=$!
+
+# Ingest spool drainer (exits immediately unless SPOOL_ENABLED=True)
+uv run python -m app.core.spool --if-enabled &
+SPOOL_PID=$!
+
+# Cold storage archiver (exits immediately unless ARCHIVE_ENABLED=True)
+uv run python -m app.core.archive --if-enabled &
+ARCHIVE_PID=$!
+
 uv run python worker.py &
 WORKER_PID=$!
 
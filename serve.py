@@ -0,0 +1,168 @@
+"""
+Production launcher: runs every Whook service under one supervisor.
+
+    python serve.py
+
+Starts the optional services (SQLite writer, transform pool, archiver, fair
+scheduling dispatcher, spool drainer; each exits at once when its feature is off), the
+autoscaling worker pool, and uvicorn with WEB_WORKERS processes. A service
+that crashes is restarted with backoff. SIGTERM/SIGINT stops them front to
+back so nothing is lost in between: the web server first (no new
+deliveries), then the spool drainer and dispatcher, then the worker pool
+(in-flight jobs finish), then the archiver, transform pool and SQLite writer. Each
+gets SHUTDOWN_TIMEOUT seconds before it is killed.
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from app.core.config import settings
+
+# Started in this order, stopped in reverse
+SERVICES = [
+    ("sqlite-writer", ["-m", "app.core.sqlite_writer", "--if-enabled"]),
+    ("transform-pool", ["-m", "app.transforms.pool", "--if-enabled"]),
+    ("archiver", ["-m", "app.core.archive", "--if-enabled"]),
+    ("worker-pool", ["worker.py"]),
+    ("dispatcher", ["-m", "app.core.fair_scheduler", "--if-enabled"]),
+    ("spool-drainer", ["-m", "app.core.spool", "--if-enabled"]),
+    ("web", None),
+]
+
+MAX_RESTART_DELAY = 30
+
+
+def descendants(pid):
+    """Pids of every process under `pid` (children, their children, ...)"""
+    parents = {}
+    try:
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    with open(f"/proc/{entry}/stat") as f:
+                        # The command name may contain spaces; fields after it start at ')'
+                        parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+    except OSError:
+        # No /proc (macOS)
+        output = subprocess.run(["ps", "-A", "-o", "pid=", "-o", "ppid="], capture_output=True, text=True).stdout
+        for line in output.splitlines():
+            child, parent = line.split()
+            parents[int(child)] = int(parent)
+
+    found, pending = [], [pid]
+    while pending:
+        parent = pending.pop()
+        children = [child for child, ppid in parents.items() if ppid == parent]
+        found.extend(children)
+        pending.extend(children)
+    return found
+
+
+def kill_tree(process):
+    """
+    SIGKILL a service and everything it started. Lane workers and RQ's work
+    horses run in process groups of their own, so killing the service's group
+    would leave them running. Everything is stopped before anything is killed
+    so no process can start new children while they are collected.
+    """
+    def send(pid, sig, group=False):
+        try:
+            (os.killpg if group else os.kill)(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    send(process.pid, signal.SIGSTOP, group=True)
+    stopped = set()
+    while True:
+        found = [pid for pid in descendants(process.pid) if pid not in stopped]
+        if not found:
+            break
+        for pid in found:
+            send(pid, signal.SIGSTOP)
+        stopped.update(found)
+    for pid in stopped:
+        send(pid, signal.SIGKILL)
+    send(process.pid, signal.SIGKILL, group=True)
+
+
+class Supervisor:
+    def __init__(self, services):
+        self.services = services
+        self.processes = {}
+        self.restarts = {}
+        self.next_start = {}
+        self.stopping = False
+
+    def start(self, name):
+        args = self.services[name] or web_command()
+        # Own session: a terminal Ctrl+C reaches the supervisor only, which stops services in order
+        self.processes[name] = subprocess.Popen([sys.executable, *args], start_new_session=True)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        for name in self.services:
+            self.start(name)
+        print("✅ Whook started: " + ", ".join(f"{name}={p.pid}" for name, p in self.processes.items()))
+
+        while not self.stopping:
+            time.sleep(1)
+            self.supervise()
+        self.stop()
+
+    def supervise(self):
+        now = time.monotonic()
+        for name, process in list(self.processes.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            if code == 0:
+                # Feature disabled (--if-enabled) or a clean exit: leave it stopped
+                del self.processes[name]
+                continue
+            if name not in self.next_start:
+                self.restarts[name] = self.restarts.get(name, 0) + 1
+                delay = min(MAX_RESTART_DELAY, 2 ** (self.restarts[name] - 1))
+                print(f"⚠️  {name} exited ({code}), restarting in {delay}s")
+                self.next_start[name] = now + delay
+            elif now >= self.next_start[name]:
+                del self.next_start[name]
+                self.start(name)
+
+    def request_stop(self, signum, frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        print("Stopping services...")
+
+    def stop(self):
+        for name in reversed(self.services):
+            process = self.processes.pop(name, None)
+            if process is None or process.poll() is not None:
+                continue
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(settings.SHUTDOWN_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                print(f"⚠️  {name} did not stop within {settings.SHUTDOWN_TIMEOUT:g}s, killing it")
+                # Worker and uvicorn children too
+                kill_tree(process)
+                process.wait()
+        print("👋 Whook stopped")
+
+
+def main():
+    print("Initializing database...")
+    if subprocess.run([sys.executable, "init_db.py"]).returncode != 0:
+        print("Database initialization failed!")
+        sys.exit(1)
+    Supervisor(dict(SERVICES)).run()
+
+
+if __name__ == "__main__":
+    main()
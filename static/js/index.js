@@ -64,6 +64,56 @@ function connectWebSocket() {
 connectWebSocket();
 
 // Convert UTC timestamps to local time
+// Live metrics (GET /api/metrics): per-second sparklines, polled while the page is visible
+const METRICS_POLL_MS = 2000;
+let metricsTimer = null;
+
+function sparklinePoints(values, width = 120, height = 24) {
+    const max = Math.max(1, ...values);
+    const step = values.length > 1 ? width / (values.length - 1) : width;
+    return values.map((v, i) => `${(i * step).toFixed(1)},${(height - (v / max) * (height - 2) - 1).toFixed(1)}`).join(' ');
+}
+
+function renderMetrics(data) {
+    Object.entries(data.webhooks).forEach(([url, series]) => {
+        const card = document.querySelector(`.webhook-card[data-webhook-url="${url}"]`);
+        if (!card) return;
+        const live = card.querySelector('.live-metrics');
+        live.hidden = false;
+        live.querySelector('polyline').setAttribute('points', sparklinePoints(series.requests));
+        // The newest second is still filling up, so show the last complete one
+        live.querySelector('.throughput').textContent = series.requests[series.requests.length - 2] || 0;
+        const p95 = series.totals.p95;
+        live.querySelector('.latency-p95').textContent = p95 === null ? '–' : `≤${p95}ms`;
+
+        const attempts = series.totals.forwarded + series.totals.failed;
+        const rate = card.querySelector('.success-rate');
+        if (rate && attempts) {
+            const percent = Math.round(series.totals.forwarded / attempts * 100);
+            rate.textContent = `${percent}%`;
+            rate.classList.toggle('degraded', percent < 95);
+        }
+    });
+}
+
+async function pollMetrics() {
+    metricsTimer = -1;  // Poll in flight
+    try {
+        const response = await fetch('/api/metrics?resolution=second');
+        if (response.status === 404) return;  // Live metrics are disabled
+        if (response.ok) renderMetrics(await response.json());
+    } catch (e) {
+        console.error('Error loading metrics:', e);
+    }
+    metricsTimer = document.hidden ? null : setTimeout(pollMetrics, METRICS_POLL_MS);
+}
+
+document.addEventListener('visibilitychange', () => {
+    if (!document.hidden && !metricsTimer && document.querySelector('.webhook-card')) {
+        pollMetrics();
+    }
+});
+
 function formatLocalTime(utcString) {
     const date = new Date(utcString);
     return date.toLocaleString(undefined, {
@@ -85,6 +135,10 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
+    if (document.querySelector('.webhook-card')) {
+        pollMetrics();
+    }
+
     const createDialog = document.querySelector('.create-dialog');
     const deleteDialog = document.querySelector('.delete-dialog');
     const successAlert = document.querySelector('.success-alert');
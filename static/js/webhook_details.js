@@ -81,6 +81,7 @@ function addNewRequestToList(data) {
     const newItem = document.createElement('div');
     newItem.className = 'request-item';
     newItem.setAttribute('data-request-id', data.request_id);
+    newItem.setAttribute('data-version', data.timestamp || '');
     newItem.setAttribute('data-status', '200');
     newItem.onclick = function() { showRequest(data.request_id); };
     
@@ -195,6 +196,7 @@ function loadMoreRequests() {
                 const newItem = document.createElement('div');
                 newItem.className = 'request-item';
                 newItem.setAttribute('data-request-id', req.id);
+                newItem.setAttribute('data-version', req.timestamp || '');
                 newItem.setAttribute('data-status', '200');
                 newItem.onclick = function() { showRequest(req.id); };
                 
@@ -269,7 +271,9 @@ function showRequest(requestId) {
         clickedItem.classList.add('active');
     }
     
-    fetch(`/webhook/request/${requestId}`)
+    // Stored requests never change: with the timestamp as version the browser caches them for good
+    const version = clickedItem ? (clickedItem.dataset.version || '').replace(/Z$/, '') : '';
+    fetch(`/webhook/request/${requestId}` + (version ? `?v=${encodeURIComponent(version)}` : ''))
         .then(response => response.json())
         .then(data => {
             currentRequestData = data;
@@ -302,7 +306,7 @@ function updateRequestDetails(data) {
     }
     document.getElementById('timestamp').textContent = displayTimestamp;
     document.getElementById('response-time').textContent = '245ms';
-    document.getElementById('size').textContent = `${data.body.length} bytes`;
+    document.getElementById('size').textContent = `${data.body_length ?? data.body.length} bytes`;
     
     // Update Body tab
     updateBodyTab(data.body);
@@ -97,14 +97,14 @@ def check_db_count(webhook_path: str) -> int:
 
 
 def check_queue_status():
-    """Check RQ queue status"""
+    """Check RQ ingest lane status"""
     from redis import Redis
     from rq import Queue
     from rq.registry import FailedJobRegistry, StartedJobRegistry
     from app.core.config import settings
     
     conn = Redis.from_url(settings.REDIS_URL, decode_responses=False)
-    q = Queue(connection=conn)
+    q = Queue('ingest', connection=conn)
     
     pending = len(q.job_ids)
     failed_registry = FailedJobRegistry(queue=q)
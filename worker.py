@@ -1,17 +1,17 @@
 import os
-import json
+import argparse
+import threading
 import requests
 import logging
-from datetime import datetime
+import multiprocessing
+import signal
+from datetime import datetime, timedelta
 from redis import Redis
 from rq import Worker, Queue
-from RestrictedPython import compile_restricted, safe_globals
-from RestrictedPython.Guards import full_write_guard
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 import time
-import csv
 
 load_dotenv()
 
@@ -19,23 +19,40 @@ logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
 from app.models import Webhook, WebhookRequest
+from app.core.config import settings
+from app.core.database import ShardRouter, apply_sqlite_pragmas
+from app.core.redis_client import LANES, make_lane_queues, lane_listen_order, record_lane_wait, job_age_seconds
+from app.core.autoscale import Autoscaler, autoscaling_enabled
+from app.core.sqlite_writer import sqlite_writer_enabled, submit_write, new_request_notification
+from app.core import archive, batching, dedup, fair_scheduler, metrics, ordered, routing, sharding, sinks
+from app.core.serialization import QueueSerializer, dumps, loads, encode_bytes, decode_bytes
+from app.transforms import (
+    ScriptCache, compile_mapping, compile_transform_batch, transform_body, transform_bodies,
+    transform_pool_enabled, run_in_pool, run_batch_in_pool
+)
+from app.utils.profiling import (
+    SamplingProfiler, SlowSampler, current_route, install_sql_recorder, profile_output_path
+)
 
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///wh.db')
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
 DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
 
-if DATABASE_URL.startswith("sqlite"):
-    worker_engine = create_engine(
-        DATABASE_URL,
-        connect_args={"check_same_thread": False, "timeout": 30},
-        echo=False
-    )
-else:
+def create_worker_engine(url):
+    """Engine with a smaller pool than the API's: each work-horse handles one job at a time"""
+    if url.startswith("sqlite"):
+        sqlite_engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000},
+            echo=False
+        )
+        event.listen(sqlite_engine, "connect", apply_sqlite_pragmas)
+        return sqlite_engine
     worker_pool_size = max(2, DB_POOL_SIZE // 4)
     worker_max_overflow = max(5, DB_MAX_OVERFLOW // 4)
-    worker_engine = create_engine(
-        DATABASE_URL,
+    return create_engine(
+        url,
         pool_size=worker_pool_size,
         max_overflow=worker_max_overflow,
         pool_pre_ping=True,
@@ -44,29 +61,387 @@ else:
         echo=False
     )
 
+
+worker_engine = create_worker_engine(DATABASE_URL)
+
 WorkerSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=worker_engine)
 
+# webhook_request rows live on the webhook's shard (app.core.sharding); shard 0 is worker_engine
+worker_shards = ShardRouter([worker_engine, *[create_worker_engine(url) for url in settings.DATABASE_SHARD_URLS]])
+
 conn = Redis.from_url(REDIS_URL, decode_responses=False)
 pubsub_conn = Redis.from_url(REDIS_URL, decode_responses=True)
-queue = Queue(connection=conn)
+queues = make_lane_queues(conn)
+
+# Compiled transforms for inline execution (TRANSFORM_POOL off). RQ forks a work-horse per job,
+# so scripts are compiled in the worker process up front and every horse inherits them.
+script_cache = ScriptCache(settings.TRANSFORM_CACHE_SIZE)
+batch_cache = ScriptCache(settings.TRANSFORM_CACHE_SIZE, compiler=compile_transform_batch)
+# Declarative mappings compile to plain closures and always run inline
+mapping_cache = ScriptCache(settings.TRANSFORM_CACHE_SIZE, compiler=compile_mapping)
 
 
-def forward_to_destination(dest_url, transformed_body, headers):
-    """Forward webhook to a single destination"""
+def warm_script_cache():
+    """Compile every webhook's transform once in the long-lived worker process"""
+    db = WorkerSessionLocal()
     try:
-        forward_headers = {k: v for k, v in headers.items() if k.lower() not in ['host', 'content-length']}
-        if 'content-type' not in [k.lower() for k in forward_headers.keys()]:
-            forward_headers['Content-Type'] = 'application/json'
-        
-        resp = requests.post(dest_url, data=transformed_body, headers=forward_headers, timeout=10)
+        rows = db.query(Webhook.transformation_script, Webhook.transformation_mapping).filter(
+            (Webhook.transformation_script.isnot(None)) | (Webhook.transformation_mapping.isnot(None))
+        ).all()
+    finally:
+        db.close()
+        # Forked work-horses must not share the parent's pooled connections
+        worker_engine.dispose()
+    for script, mapping in rows[:settings.TRANSFORM_CACHE_SIZE]:
+        if mapping and mapping.strip():
+            caches, source = (mapping_cache,), mapping
+        else:
+            caches, source = (script_cache, batch_cache), script
+        if source and source.strip():
+            for cache in caches:
+                try:
+                    cache.get(source)
+                except Exception:
+                    pass
+
+
+def retry_delay(attempt):
+    delays = settings.FORWARD_RETRY_DELAYS or [0]
+    return delays[min(attempt, len(delays) - 1)]
+
+
+def record_metrics(webhook_id, **counts):
+    """Add to a webhook's live metrics (app.core.metrics); never fails the job"""
+    if webhook_id is None or not metrics.metrics_enabled():
+        return
+    try:
+        metrics.record(conn, webhook_id, **counts)
+    except Exception as e:
+        logger.warning(f"Metrics update failed: {e}")
+
+
+def schedule_retry(dest_url, transformed_body, headers, attempt, reason, webhook_id=None):
+    """Move a failed forward to the retry lane with backoff, until FORWARD_MAX_RETRIES"""
+    if attempt >= settings.FORWARD_MAX_RETRIES:
+        logger.error(f"Forward gave up after {attempt + 1} attempts: {dest_url} - {reason}")
+        return False
+    delay = retry_delay(attempt)
+    try:
+        queues['retry'].enqueue_in(
+            timedelta(seconds=delay),
+            'worker.forward_to_destination',
+            dest_url,
+            transformed_body,
+            headers,
+            attempt + 1,
+            webhook_id,
+            job_timeout=30,
+            result_ttl=3600
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Queue retry failed: {e}")
+        return False
+
+
+def forward_headers(headers):
+    """The original headers minus hop-specific ones, with a JSON Content-Type if none was sent"""
+    result = {k: v for k, v in headers.items() if k.lower() not in ['host', 'content-length']}
+    if 'content-type' not in [k.lower() for k in result.keys()]:
+        result['Content-Type'] = 'application/json'
+    return result
+
+
+FORWARD_TIMEOUT = 10
+
+
+def post_to_destination(dest_url, transformed_body, headers):
+    """POST a forward with the original headers (minus hop-specific ones)"""
+    return requests.post(dest_url, data=transformed_body, headers=forward_headers(headers), timeout=FORWARD_TIMEOUT)
+
+
+def is_retryable(status_code):
+    return status_code >= 500 or status_code == 429
+
+
+def forward_to_destination(dest_url, transformed_body, headers, attempt=0, webhook_id=None):
+    """Forward webhook to a single destination, retrying on connection errors and 5xx/429"""
+    started = time.perf_counter()
+    result = _forward_once(dest_url, transformed_body, headers, attempt, webhook_id)
+    record_metrics(
+        webhook_id,
+        forwarded=int(result['success']),
+        failed=int(not result['success']),
+        latency_ms=(time.perf_counter() - started) * 1000
+    )
+    return result
+
+
+def _forward_once(dest_url, transformed_body, headers, attempt, webhook_id):
+    if sinks.is_sink(dest_url):
+        try:
+            sinks.get_sink(dest_url).write([transformed_body])
+            return {'url': dest_url, 'success': True}
+        except sinks.SinkError as e:
+            logger.error(f"Sink write failed: {dest_url} - {e}")
+            retrying = schedule_retry(dest_url, transformed_body, headers, attempt, str(e), webhook_id)
+            return {'url': dest_url, 'error': str(e), 'success': False, 'retrying': retrying}
+    try:
+        resp = post_to_destination(dest_url, transformed_body, headers)
+        if is_retryable(resp.status_code):
+            retrying = schedule_retry(dest_url, transformed_body, headers, attempt, f"HTTP {resp.status_code}", webhook_id)
+            return {'url': dest_url, 'status': resp.status_code, 'success': False, 'retrying': retrying}
         return {'url': dest_url, 'status': resp.status_code, 'success': True}
     except requests.RequestException as e:
         logger.error(f"Forward failed: {dest_url} - {e}")
-        return {'url': dest_url, 'error': str(e), 'success': False}
+        retrying = schedule_retry(dest_url, transformed_body, headers, attempt, str(e), webhook_id)
+        return {'url': dest_url, 'error': str(e), 'success': False, 'retrying': retrying}
 
 
-def process_webhook_in_background(webhook_id, headers, body, query_params=None):
-    """Background task to process webhook request"""
+def schedule_batch_retry(dest_url, items, raw_options, attempt, reason):
+    """Retry a batch (or the part of it that failed) on the retry lane with the usual backoff"""
+    if attempt >= settings.FORWARD_MAX_RETRIES:
+        logger.error(f"Batch forward gave up after {attempt + 1} attempts: {dest_url} - "
+                     f"{len(items)} deliveries - {reason}")
+        batching.record(conn, dropped=len(items))
+        return False
+    try:
+        queues['retry'].enqueue_in(
+            timedelta(seconds=retry_delay(attempt)),
+            'worker.forward_batch',
+            dest_url,
+            items,
+            raw_options,
+            attempt + 1,
+            job_timeout=30,
+            result_ttl=3600
+        )
+        batching.record(conn, retried=len(items))
+        return True
+    except Exception as e:
+        logger.error(f"Queue batch retry failed: {e}")
+        return False
+
+
+def forward_batch(dest_url, items, raw_options, attempt=0):
+    """
+    POST buffered deliveries as one JSON array or NDJSON request (or one bulk write
+    for a non-HTTP sink). Connection errors
+    and 5xx/429 retry the whole batch; a 2xx reply listing {"failed": [indexes]}
+    retries only those deliveries; 413 splits the batch in two.
+    """
+    options = batching.parse_options(raw_options)
+    if sinks.is_sink(dest_url):
+        try:
+            sinks.get_sink(dest_url).write(items)
+        except sinks.SinkError as e:
+            logger.error(f"Sink write failed: {dest_url} - {e}")
+            retrying = schedule_batch_retry(dest_url, items, raw_options, attempt, str(e))
+            return {'url': dest_url, 'count': len(items), 'error': str(e), 'success': False, 'retrying': retrying}
+        batching.record(conn, requests=1, delivered=len(items))
+        return {'url': dest_url, 'count': len(items), 'success': True}
+
+    headers = {'Content-Type': batching.FORMATS[options['format']], 'X-Whook-Batch-Size': str(len(items))}
+    try:
+        resp = requests.post(dest_url, data=batching.encode(items, options['format']), headers=headers, timeout=10)
+    except requests.RequestException as e:
+        logger.error(f"Batch forward failed: {dest_url} - {e}")
+        retrying = schedule_batch_retry(dest_url, items, raw_options, attempt, str(e))
+        return {'url': dest_url, 'count': len(items), 'error': str(e), 'success': False, 'retrying': retrying}
+
+    if resp.status_code == 413 and len(items) > 1:
+        half = len(items) // 2
+        for part in (items[:half], items[half:]):
+            queues['forward'].enqueue('worker.forward_batch', dest_url, part, raw_options, attempt,
+                                      job_timeout=30, result_ttl=3600)
+        return {'url': dest_url, 'count': len(items), 'status': 413, 'success': False, 'split': True}
+    if is_retryable(resp.status_code):
+        retrying = schedule_batch_retry(dest_url, items, raw_options, attempt, f"HTTP {resp.status_code}")
+        return {'url': dest_url, 'count': len(items), 'status': resp.status_code, 'success': False, 'retrying': retrying}
+    if resp.status_code >= 400:
+        logger.error(f"Batch forward rejected: {dest_url} - HTTP {resp.status_code} - {len(items)} deliveries")
+        batching.record(conn, requests=1, dropped=len(items))
+        return {'url': dest_url, 'count': len(items), 'status': resp.status_code, 'success': False}
+
+    failed = batching.failed_indexes(resp.content, len(items)) or []
+    batching.record(conn, requests=1, delivered=len(items) - len(failed))
+    if failed:
+        schedule_batch_retry(dest_url, [items[i] for i in failed], raw_options, attempt,
+                             f"{len(failed)} of {len(items)} reported failed")
+    return {'url': dest_url, 'count': len(items), 'status': resp.status_code, 'success': True, 'failed': failed}
+
+
+def schedule_flush(dest_url, raw_options, when):
+    """Queue a flush of a destination's batch buffer now or after its linger time"""
+    if when == 'now':
+        queues['forward'].enqueue('worker.flush_batch', dest_url, raw_options,
+                                  job_timeout=batching.FLUSH_TIMEOUT, result_ttl=0)
+    elif when == 'later':
+        linger = batching.parse_options(raw_options)['linger_ms']
+        queues['forward'].enqueue_in(timedelta(milliseconds=linger), 'worker.flush_batch', dest_url, raw_options,
+                                     job_timeout=batching.FLUSH_TIMEOUT, result_ttl=0)
+
+
+def flush_batch(dest_url, raw_options):
+    """Send the next batch from a destination's buffer and re-arm the flush if more is waiting"""
+    options = batching.parse_options(raw_options)
+    bid = batching.buffer_id(dest_url, raw_options)
+    flush, items = batching.take(conn, bid, options)
+    result = None
+    if items:
+        result = forward_batch(dest_url, items, raw_options)
+        # Not reached if the job dies: the sweep puts the batch back in the buffer
+        batching.ack(conn, flush)
+    schedule_flush(dest_url, raw_options, batching.rearm(conn, bid, options))
+    return result
+
+
+def sweep_batches():
+    """Maintenance job: recover batches of dead flushes and flush buffers whose flush job was lost"""
+    due = batching.sweep(conn)
+    for dest_url, raw_options in due:
+        logger.warning(f"Flushing stranded batch buffer for {dest_url}")
+        schedule_flush(dest_url, raw_options, 'now')
+    return len(due)
+
+
+def schedule_batch_sweep():
+    """Queue a sweep unless one was queued in the last BATCH_SWEEP_INTERVAL (by any pool)"""
+    if conn.set(batching.SWEEP_KEY, 1, nx=True, ex=settings.BATCH_SWEEP_INTERVAL):
+        queues['maintenance'].enqueue('worker.sweep_batches', job_timeout=60, result_ttl=0)
+
+
+def sweep_partitions():
+    """Maintenance job: restart ordered partitions whose drain job died with deliveries queued"""
+    scheduled = ordered.sweep(pubsub_conn, queues['ordered'])
+    if scheduled:
+        logger.warning(f"Restarted {scheduled} stalled ordered partitions")
+    return scheduled
+
+
+def schedule_ordered_sweep():
+    """Queue a partition sweep unless one was queued in the last ORDERED_SWEEP_INTERVAL (by any pool)"""
+    if conn.set(ordered.SWEEP_KEY, 1, nx=True, ex=settings.ORDERED_SWEEP_INTERVAL):
+        queues['maintenance'].enqueue('worker.sweep_partitions', job_timeout=60, result_ttl=0)
+
+
+def destination_batch_options(destinations):
+    """url -> batch options JSON for destinations forwarded in batches (sinks always are, for bulk writes)"""
+    return {
+        dest.url: dest.batch_options or "{}"
+        for dest in destinations
+        if dest.batch_options or sinks.is_sink(dest.url)
+    }
+
+
+def enqueue_forwards(destination_urls, transformed_body, headers, batch_options=None, webhook_id=None):
+    """
+    Queue one forward job per destination on the forward lane. Destinations with
+    batch options (url -> JSON) get the delivery appended to their batch buffer instead.
+    """
+    for dest_url in destination_urls:
+        if batch_options and dest_url in batch_options:
+            try:
+                _, when = batching.add(conn, dest_url, batch_options[dest_url], transformed_body)
+                schedule_flush(dest_url, batch_options[dest_url], when)
+            except Exception as e:
+                logger.error(f"Batch buffer failed: {e}")
+            continue
+        try:
+            queues['forward'].enqueue(
+                'worker.forward_to_destination',
+                dest_url,
+                transformed_body,
+                headers,
+                0,
+                webhook_id,
+                job_timeout=30,
+                result_ttl=3600
+            )
+        except Exception as e:
+            logger.error(f"Queue forward failed: {e}")
+
+
+def apply_transformation(transformation_script, body, webhook_id=None, transformation_mapping=None):
+    """
+    Run the webhook's transform on a JSON body, returning the bytes to forward.
+    A declarative mapping takes precedence over the RestrictedPython script.
+    """
+    if transformation_mapping and transformation_mapping.strip():
+        try:
+            return transform_body(mapping_cache.get(transformation_mapping), body)
+        except Exception as e:
+            logger.warning(f"Mapping error: {e}")
+        return body
+    if not transformation_script or not transformation_script.strip():
+        return body
+    if transform_pool_enabled():
+        status, result = run_in_pool(conn, webhook_id, transformation_script, body)
+        if status not in ('ok', 'skipped'):
+            logger.warning(f"Transform {status} for webhook {webhook_id}; forwarding original body")
+        return result
+    try:
+        return transform_body(script_cache.get(transformation_script), body)
+    except Exception as e:
+        logger.warning(f"Transform error: {e}")
+    return body
+
+
+def apply_transformation_batch(transformation_script, bodies, webhook_id=None, transformation_mapping=None):
+    """
+    Transform many bodies of one webhook at once, returning the bytes to forward for each.
+    Scripts get a single transform_batch(items) call (or per-item transform as a fallback);
+    if it fails, the original bodies are forwarded.
+    """
+    if len(bodies) == 1 or (transformation_mapping and transformation_mapping.strip()):
+        return [apply_transformation(transformation_script, body, webhook_id, transformation_mapping)
+                for body in bodies]
+    if not transformation_script or not transformation_script.strip():
+        return list(bodies)
+    if transform_pool_enabled():
+        status, results = run_batch_in_pool(conn, webhook_id, transformation_script, list(bodies))
+        if status not in ('ok', 'skipped'):
+            logger.warning(f"Batch transform {status} for webhook {webhook_id}; forwarding original bodies")
+        return results
+    try:
+        return transform_bodies(batch_cache.get(transformation_script), bodies)
+    except Exception as e:
+        logger.warning(f"Batch transform error: {e}")
+    return list(bodies)
+
+
+def route_deliveries(webhook_id, routes, deliveries, record=True):
+    """Destination URLs for each delivery after the destinations' routing rules, counting matches and skips"""
+    index = routing.route_index(routes)
+    if not index.has_rules:
+        return [index.urls] * len(deliveries)
+    selected, matched, skipped = [], [], []
+    for headers, body, query_params in deliveries:
+        urls, hits, misses = index.select(headers, body, query_params)
+        selected.append(urls)
+        matched += hits
+        skipped += misses
+    if not record:
+        return selected
+    try:
+        routing.record(pubsub_conn, webhook_id, matched, skipped)
+    except Exception as e:
+        logger.warning(f"Could not record routing counters: {e}")
+    return selected
+
+
+def store_requests(webhook_id, deliveries, notify=None, record_routing=True):
+    """
+    Store deliveries of one webhook, notify dashboards and apply the webhook's transform
+    to all of them in one call. `deliveries` is a list of (headers, body, query_params).
+    Notifications are published on Redis unless `notify` is given (embedded mode
+    passes a direct WebSocket broadcast).
+    Returns (request_ids, destination_urls per delivery, transformed_bodies, batch_options),
+    or None if the webhook is gone.
+    """
+    # Jobs queued before bodies were kept as bytes carry str bodies
+    deliveries = [(headers, body.encode('utf-8') if isinstance(body, str) else body, query_params)
+                  for headers, body, query_params in deliveries]
     from sqlalchemy.orm import joinedload
     from contextlib import contextmanager
     
@@ -82,79 +457,123 @@ def process_webhook_in_background(webhook_id, headers, body, query_params=None):
         finally:
             session.close()
     
-    try:
-        with get_db_session() as db:
-            webhook = db.query(Webhook).options(joinedload(Webhook.destinations)).filter(Webhook.id == webhook_id).first()
-            
-            if not webhook:
-                logger.error(f"Webhook {webhook_id} not found")
-                return None
-            
-            query_params_json = json.dumps(query_params) if query_params else None
-            
-            new_request = WebhookRequest(
-                webhook_id=webhook_id,
-                headers=json.dumps(headers),
-                body=body,
-                query_params=query_params_json,
-                timestamp=datetime.utcnow()
+    with get_db_session() as db:
+        webhook = db.query(Webhook).options(joinedload(Webhook.destinations)).filter(Webhook.id == webhook_id).first()
+        
+        if not webhook:
+            logger.error(f"Webhook {webhook_id} not found")
+            return None
+        
+        webhook_url = webhook.url
+        routes = tuple((dest.url, dest.routing_rules) for dest in webhook.destinations)
+        batch_options = destination_batch_options(webhook.destinations)
+        transformation_script = webhook.transformation_script
+        transformation_mapping = webhook.transformation_mapping
+        shard = sharding.shard_of(webhook)
+        
+        if sqlite_writer_enabled():
+            # The writer process inserts in batches and publishes the notification after commit
+            for headers, body, query_params in deliveries:
+                submit_write(
+                    pubsub_conn,
+                    'insert_request',
+                    webhook_id=webhook_id,
+                    webhook_url=webhook_url,
+                    headers=dumps(headers),
+                    body=encode_bytes(body),
+                    body_length=len(body),
+                    query_params=dumps(query_params) if query_params else None,
+                    timestamp=datetime.utcnow().isoformat()
+                )
+            stored = []
+        else:
+            new_requests = [
+                WebhookRequest(
+                    webhook_id=webhook_id,
+                    headers=dumps(headers),
+                    raw_body=body,
+                    query_params=dumps(query_params) if query_params else None,
+                    timestamp=datetime.utcnow()
+                )
+                for headers, body, query_params in deliveries
+            ]
+            store = db if shard == 0 else worker_shards.session(shard)
+            try:
+                store.add_all(new_requests)
+                store.flush()
+                stored = [(req.id, req.timestamp.isoformat(), len(req.raw_body)) for req in new_requests]
+                if store is not db:
+                    store.commit()
+            finally:
+                if store is not db:
+                    store.close()
+
+    record_metrics(webhook_id, requests=len(deliveries), body_bytes=sum(len(body) for _, body, _ in deliveries))
+
+    # Notify clients
+    for request_id, request_timestamp, body_length in stored:
+        try:
+            notification = new_request_notification(
+                webhook_id, webhook_url, request_id, request_timestamp, body_length
             )
-            db.add(new_request)
-            db.flush()
-            
-            request_id = new_request.id
-            webhook_url = webhook.url
-            request_timestamp = new_request.timestamp.isoformat()
-            destination_urls = [dest.url for dest in webhook.destinations]
-            transformation_script = webhook.transformation_script
-
-        # Notify clients
-        try:
-            notification = {
-                'type': 'new_webhook_request',
-                'webhook_id': webhook_id,
-                'webhook_url': webhook_url,
-                'request_id': request_id,
-                'timestamp': request_timestamp,
-                'body_length': len(body) if body else 0
-            }
-            pubsub_conn.publish('webhook_events', json.dumps(notification))
+            if notify is not None:
+                notify(notification)
+            else:
+                pubsub_conn.publish('webhook_events', dumps(notification))
         except Exception:
             pass
 
-        # Transform body if script exists
-        transformed_body = body
-        if transformation_script and transformation_script.strip():
-            try:
-                data = json.loads(body)
-                script_globals = safe_globals.copy()
-                script_globals.update({'json': json, 'time': time, 'csv': csv})
-                script_globals['_write_'] = full_write_guard
-
-                byte_code = compile_restricted(transformation_script, '<string>', 'exec')
-                local_env = {}
-                exec(byte_code, script_globals, local_env)
-                
-                transform_func = local_env.get('transform')
-                if callable(transform_func):
-                    transformed_data = transform_func(data)
-                    transformed_body = json.dumps(transformed_data)
-            except Exception as e:
-                logger.warning(f"Transform error: {e}")
+    # Transform bodies if a script or mapping exists
+    transformed_bodies = apply_transformation_batch(
+        transformation_script, [body for _, body, _ in deliveries], webhook_id, transformation_mapping
+    )
+    request_ids = [request_id for request_id, _, _ in stored] or [None] * len(deliveries)
+    destination_urls = route_deliveries(webhook_id, routes, deliveries, record=record_routing)
+    return request_ids, destination_urls, transformed_bodies, batch_options
+
+
+def release_dedup(webhook_id, deliveries):
+    """Deliveries could not be stored: forget their dedup claims so the provider's retry gets through"""
+    deliveries = [(headers, body.encode('utf-8') if isinstance(body, str) else body, query_params)
+                  for headers, body, query_params in deliveries]
+    try:
+        db = WorkerSessionLocal()
+        try:
+            spec = db.query(Webhook.dedup_key).filter(Webhook.id == webhook_id).scalar()
+        finally:
+            db.close()
+        if spec:
+            dedup.release(pubsub_conn, webhook_id, spec, deliveries)
+    except Exception as e:
+        logger.warning(f"Could not release dedup claims of webhook {webhook_id}: {e}")
+
+
+def store_request(webhook_id, headers, body, query_params=None):
+    """
+    Store a delivery, notify dashboards and apply the webhook's transform.
+    Returns (request_id, destination_urls, transformed_body, batch_options), or None if the webhook is gone.
+    """
+    stored = store_requests(webhook_id, [(headers, body, query_params)])
+    if stored is None:
+        return None
+    request_ids, destination_urls, transformed_bodies, batch_options = stored
+    return request_ids[0], destination_urls[0], transformed_bodies[0], batch_options
+
+
+def process_webhook_in_background(webhook_id, headers, body, query_params=None):
+    """Background task to process webhook request"""
+    try:
+        try:
+            stored = store_request(webhook_id, headers, body, query_params)
+        except Exception:
+            release_dedup(webhook_id, [(headers, body, query_params)])
+            raise
+        if stored is None:
+            return None
+        request_id, destination_urls, transformed_body, batch_options = stored
         
         # Queue forwarding jobs
-        for dest_url in destination_urls:
-            try:
-                queue.enqueue(
-                    'worker.forward_to_destination',
-                    dest_url,
-                    transformed_body,
-                    headers,
-                    job_timeout=30,
-                    result_ttl=3600
-                )
-            except Exception as e:
-                logger.error(f"Queue forward failed: {e}")
+        enqueue_forwards(destination_urls, transformed_body, headers, batch_options, webhook_id)
 
         return request_id
 
@@ -163,6 +582,386 @@ def process_webhook_in_background(webhook_id, headers, body, query_params=None):
         return None
 
 
+def process_fair_delivery(tenant, token, webhook_id, headers, body, query_params=None):
+    """Ingest job dispatched by the fair scheduler; frees the tenant's in-flight slot when done"""
+    try:
+        return process_webhook_in_background(webhook_id, headers, body, query_params)
+    finally:
+        try:
+            fair_scheduler.release(pubsub_conn, tenant, token)
+        except Exception as e:
+            logger.warning(f"Could not release fair slot for {tenant}: {e}")
+
+
+def process_fair_batch(tenant, tokens, webhook_id, deliveries):
+    """
+    Ingest job for several deliveries of one webhook dispatched together by the fair
+    scheduler. They are stored in one transaction and transformed in one call.
+    `deliveries` is a list of (headers, body, query_params).
+    """
+    try:
+        try:
+            stored = store_requests(webhook_id, deliveries)
+        except Exception:
+            release_dedup(webhook_id, deliveries)
+            raise
+        if stored is None:
+            return None
+        request_ids, destination_urls, transformed_bodies, batch_options = stored
+        for (headers, _, _), urls, transformed_body in zip(deliveries, destination_urls, transformed_bodies):
+            enqueue_forwards(urls, transformed_body, headers, batch_options, webhook_id)
+        return request_ids
+    except Exception as e:
+        logger.error(f"Process webhook batch error: {e}")
+        return None
+    finally:
+        try:
+            fair_scheduler.release(pubsub_conn, tenant, *tokens)
+        except Exception as e:
+            logger.warning(f"Could not release fair slots for {tenant}: {e}")
+
+
+def drain_partition(partition):
+    """
+    Deliver one ordered partition's backlog in arrival order, one delivery at a time.
+    Progress is kept on the head item, so a retry resumes with the destinations still owed.
+    A job stops after ORDERED_DRAIN_BATCH deliveries or when it nears its timeout
+    (ORDERED_LOCK_TTL), whichever comes first, and queues its continuation.
+    """
+    queue_key = ordered.PARTITION_KEY.format(partition=partition)
+    # Room for one more store and forward before RQ kills the job
+    deadline = time.monotonic() + max(settings.ORDERED_LOCK_TTL - 2 * FORWARD_TIMEOUT, FORWARD_TIMEOUT)
+    try:
+        for _ in range(settings.ORDERED_DRAIN_BATCH):
+            if time.monotonic() >= deadline:
+                break
+            raw = pubsub_conn.lindex(queue_key, 0)
+            if raw is None:
+                if ordered.release(pubsub_conn, partition):
+                    return
+                continue
+            ordered.hold(pubsub_conn, partition, 0)
+            delay = drain_head(partition, queue_key, raw, deadline)
+            if delay is not None:
+                # Head-of-line blocking is the point: later deliveries wait for this one
+                schedule_partition_retry(partition, delay)
+                return
+    except Exception as e:
+        # Keep the lock and come back; if even that fails the lock expires and the next delivery schedules a drain
+        logger.error(f"Ordered drain failed (partition {partition}): {e}")
+        schedule_partition_retry(partition, retry_delay(0))
+        return
+
+    # Batch or time used up: yield the worker to other partitions, keeping the lock
+    queues['ordered'].enqueue('worker.drain_partition', partition, job_timeout=settings.ORDERED_LOCK_TTL, result_ttl=0)
+
+
+def schedule_partition_retry(partition, delay):
+    ordered.hold(pubsub_conn, partition, delay)
+    queues['ordered'].enqueue_in(
+        timedelta(seconds=delay), 'worker.drain_partition', partition,
+        job_timeout=settings.ORDERED_LOCK_TTL, result_ttl=0
+    )
+
+
+def drain_head(partition, queue_key, raw, deadline):
+    """
+    Store and forward a partition's head delivery, popping it once it is done.
+    Returns the delay before it must be tried again, or None to move on; past
+    `deadline` it returns None early, leaving the head with its progress saved.
+    """
+    try:
+        item = loads(raw)
+    except Exception as e:
+        logger.error(f"Dropping unreadable ordered delivery (partition {partition}): {e}")
+        pubsub_conn.lpop(queue_key)
+        return None
+
+    if 'destinations' not in item:
+        attempt = item.get('attempt', 0)
+        try:
+            stored = store_request(
+                item['webhook_id'], item['headers'], decode_bytes(item['body']), item['query_params']
+            )
+        except Exception as e:
+            if attempt < settings.FORWARD_MAX_RETRIES:
+                delay = retry_delay(attempt)
+                item['attempt'] = attempt + 1
+                pubsub_conn.lset(queue_key, 0, dumps(item))
+                logger.warning(f"Ordered store failed (partition {partition}): {e}, retrying in {delay}s")
+                return delay
+            logger.error(f"Ordered store gave up after {attempt + 1} attempts (partition {partition}): {e}")
+            release_dedup(item['webhook_id'], [(item['headers'], decode_bytes(item['body']), item['query_params'])])
+            stored = None
+        if stored is None:
+            pubsub_conn.lpop(queue_key)
+            return None
+        item['destinations'], item['transformed_body'] = stored[1], encode_bytes(stored[2])
+        item['delivered'], item['attempt'] = [], 0
+        pubsub_conn.lset(queue_key, 0, dumps(item))
+
+    for dest_url in item['destinations']:
+        if dest_url in item['delivered']:
+            continue
+        if time.monotonic() >= deadline:
+            return None
+        started = time.perf_counter()
+        try:
+            if sinks.is_sink(dest_url):
+                sinks.get_sink(dest_url).write([decode_bytes(item['transformed_body'])])
+                reason = None
+            else:
+                resp = post_to_destination(dest_url, decode_bytes(item['transformed_body']), item['headers'])
+                reason = f"HTTP {resp.status_code}" if is_retryable(resp.status_code) else None
+        except (requests.RequestException, sinks.SinkError) as e:
+            reason = str(e)
+        record_metrics(
+            item['webhook_id'],
+            forwarded=int(reason is None),
+            failed=int(reason is not None),
+            latency_ms=(time.perf_counter() - started) * 1000
+        )
+
+        if reason and item['attempt'] < settings.FORWARD_MAX_RETRIES:
+            delay = retry_delay(item['attempt'])
+            item['attempt'] += 1
+            pubsub_conn.lset(queue_key, 0, dumps(item))
+            logger.warning(f"Ordered forward to {dest_url} failed ({reason}), retrying in {delay}s")
+            return delay
+        if reason:
+            logger.error(f"Ordered forward gave up after {item['attempt'] + 1} attempts: {dest_url} - {reason}")
+        item['delivered'].append(dest_url)
+        item['attempt'] = 0
+        pubsub_conn.lset(queue_key, 0, dumps(item))
+
+    pubsub_conn.lpop(queue_key)
+    return None
+
+
+def replay_request(request_id):
+    """Maintenance job: forward a stored request to its webhook's destinations again"""
+    prepared = prepare_replay(request_id)
+    if prepared is None:
+        return None
+    destination_urls, transformed_body, headers, batch_options = prepared
+    enqueue_forwards(destination_urls, transformed_body, headers, batch_options)
+    return len(destination_urls)
+
+
+def prepare_replay(request_id, record_routing=True):
+    """
+    Load a stored request and route and transform it again.
+    Returns (destination_urls, transformed_body, headers, batch_options), or None if it is gone.
+    """
+    from sqlalchemy.orm import joinedload
+
+    req = None
+    shard = worker_shards.shard_for_request(request_id)
+    if shard is not None:
+        store = worker_shards.session(shard)
+        try:
+            req = store.query(WebhookRequest).filter(WebhookRequest.id == request_id).first()
+        finally:
+            store.close()
+
+    db = WorkerSessionLocal()
+    try:
+        if not req:
+            # Archived requests keep their ids
+            req = archive.find_request(db, request_id)
+        if not req:
+            logger.error(f"Request {request_id} not found for replay")
+            return None
+        headers = loads(req.headers)
+        body = req.body_bytes
+        query_params = loads(req.query_params) if req.query_params else None
+        webhook_id = req.webhook_id
+        webhook = db.query(Webhook).options(joinedload(Webhook.destinations)).filter(Webhook.id == webhook_id).first()
+        if not webhook:
+            logger.error(f"Webhook {webhook_id} not found for replay")
+            return None
+        routes = tuple((dest.url, dest.routing_rules) for dest in webhook.destinations)
+        batch_options = destination_batch_options(webhook.destinations)
+        transformation_script = webhook.transformation_script
+        transformation_mapping = webhook.transformation_mapping
+    finally:
+        db.close()
+
+    destination_urls = route_deliveries(webhook.id, routes, [(headers, body, query_params)], record=record_routing)[0]
+    transformed_body = apply_transformation(transformation_script, body, webhook.id, transformation_mapping)
+    return destination_urls, transformed_body, headers, batch_options
+
+
+class WhookWorker(Worker):
+    """RQ worker that records lane wait times, labels job SQL and samples jobs when profiling"""
+    
+    profile_until = 0.0
+    profile_path = None
+    slow_sampler = SlowSampler("job", settings.PROFILE_SLOW_JOB_MS, settings.PROFILE_SLOW_SAMPLE_RATE)
+
+    def perform_job(self, job, queue):
+        if job.enqueued_at:
+            try:
+                record_lane_wait(pubsub_conn, queue.name, job_age_seconds(job.enqueued_at))
+            except Exception:
+                pass
+
+        token = current_route.set(f"job {job.func_name}")
+        in_window = time.time() < self.profile_until
+        if in_window:
+            profiler = SamplingProfiler(thread_id=threading.get_ident()).start()
+        elif self.slow_sampler.enabled:
+            profiler = self.slow_sampler.begin()
+        else:
+            profiler = None
+        started = time.perf_counter()
+        try:
+            return super().perform_job(job, queue)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if in_window:
+                profiler.stop().write(self.profile_path)
+            elif self.slow_sampler.enabled:
+                self.slow_sampler.end(profiler, job.func_name or "job", elapsed_ms)
+            current_route.reset(token)
+
+
+def run_lane_worker(lane, detach=False):
+    """Run one worker for `lane` (listening on higher-priority lanes when idle)"""
+    if detach:
+        # Own process group so a terminal Ctrl+C reaches only the pool parent,
+        # which then asks each worker for exactly one warm shutdown
+        os.setpgrp()
+    if settings.PROFILE_SQL:
+        for shard_engine in worker_shards.engines:
+            install_sql_recorder(shard_engine, pubsub_conn)
+    if not transform_pool_enabled():
+        try:
+            warm_script_cache()
+        except Exception as e:
+            logger.warning(f"Could not warm transform cache: {e}")
+
+    listen = [queues[name] for name in lane_listen_order(lane)]
+    # The legacy 'default' queue is drained by ingest workers so jobs queued before lanes existed still run
+    if lane == 'ingest':
+        listen.append(Queue(connection=conn, serializer=QueueSerializer))
+    worker = WhookWorker(listen, connection=conn, serializer=QueueSerializer, log_job_description=False)
+    worker.work(with_scheduler=True)
+
+
+def run_pool(sizes, max_sizes=None):
+    """
+    Start and supervise workers per lane, scaling each lane between sizes and
+    max_sizes by queue depth and wait (app.core.autoscale); SIGTERM/SIGINT drains them
+    """
+    max_sizes = max_sizes or sizes
+    processes = {}
+    retiring = []
+    stopping = False
+    autoscaler = Autoscaler(queues, sizes, max_sizes) if autoscaling_enabled(sizes, max_sizes) else None
+
+    def spawn(lane, slot):
+        process = multiprocessing.Process(
+            target=run_lane_worker, args=(lane, True), name=f"whook-{lane}-{slot}"
+        )
+        process.start()
+        processes[(lane, slot)] = process
+
+    def lane_slots(lane):
+        return sorted(slot for process_lane, slot in processes if process_lane == lane)
+
+    def scale(lane, target):
+        slots = lane_slots(lane)
+        if target > len(slots):
+            free = [slot for slot in range(target) if slot not in slots]
+            for slot in free[:target - len(slots)]:
+                spawn(lane, slot)
+        for slot in reversed(slots[target:]):
+            # Warm shutdown: the job it is running finishes first
+            process = processes.pop((lane, slot))
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+            retiring.append(process)
+        if target != len(slots):
+            print(f"↕️  {lane}: {len(slots)} → {target} workers")
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        print("Draining workers (in-flight jobs finish first)...")
+        for process in [*processes.values(), *retiring]:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for lane in LANES:
+        for slot in range(sizes.get(lane, 0)):
+            spawn(lane, slot)
+    print("✅ Worker pool started: " + ", ".join(
+        f"{lane}={sizes.get(lane, 0)}" + (f"..{max_sizes[lane]}" if max_sizes.get(lane, 0) > sizes.get(lane, 0) else "")
+        for lane in LANES
+    ))
+
+    next_scale = time.monotonic() + settings.WORKER_AUTOSCALE_INTERVAL
+    sweeps = [(settings.BATCH_SWEEP_INTERVAL, schedule_batch_sweep),
+              (settings.ORDERED_SWEEP_INTERVAL, schedule_ordered_sweep)]
+    next_sweep = {schedule: time.monotonic() for _, schedule in sweeps}
+    while not stopping:
+        time.sleep(1)
+        for interval, schedule in sweeps:
+            if interval and time.monotonic() >= next_sweep[schedule]:
+                next_sweep[schedule] = time.monotonic() + interval
+                try:
+                    schedule()
+                except Exception as e:
+                    logger.warning(f"Could not queue {schedule.__name__}: {e}")
+        for (lane, slot), process in list(processes.items()):
+            if not process.is_alive() and not stopping:
+                logger.warning(f"Worker {process.name} exited ({process.exitcode}), restarting")
+                spawn(lane, slot)
+        retiring[:] = [process for process in retiring if process.is_alive()]
+
+        if autoscaler is not None and not stopping and time.monotonic() >= next_scale:
+            next_scale = time.monotonic() + settings.WORKER_AUTOSCALE_INTERVAL
+            try:
+                targets = autoscaler.targets({lane: len(lane_slots(lane)) for lane in LANES})
+            except Exception as e:
+                logger.warning(f"Autoscaler could not read queue load: {e}")
+                continue
+            for lane, target in targets.items():
+                scale(lane, target)
+
+    for process in [*processes.values(), *retiring]:
+        process.join()
+    print("👋 Worker pool stopped")
+
+
 if __name__ == '__main__':
-    worker = Worker([queue], connection=conn, log_job_description=False)
-    worker.work(with_scheduler=False)
+    parser = argparse.ArgumentParser(description='Whook background worker')
+    parser.add_argument('--lane', choices=LANES,
+                        help='Run a single worker for this lane instead of the full pool')
+    parser.add_argument('--profile', type=float, metavar='SECONDS',
+                        help='Sample every job run in the next SECONDS into one folded profile')
+    parser.add_argument('--slow-job-ms', type=float, metavar='MS',
+                        help='Profile sampled jobs slower than MS (overrides PROFILE_SLOW_JOB_MS)')
+    args = parser.parse_args()
+
+    if settings.QUEUE_MODE == 'embedded':
+        print("QUEUE_MODE=embedded: deliveries are processed in the web process, no worker needed")
+        raise SystemExit(0)
+
+    if args.slow_job_ms is not None:
+        WhookWorker.slow_sampler.threshold_ms = args.slow_job_ms
+    if args.profile:
+        WhookWorker.profile_until = time.time() + args.profile
+        WhookWorker.profile_path = profile_output_path("worker")
+        logger.warning(f"Profiling jobs for {args.profile:g}s into {WhookWorker.profile_path}")
+
+    if args.lane:
+        run_lane_worker(args.lane)
+    else:
+        run_pool(settings.WORKER_POOL_SIZES, settings.WORKER_POOL_MAX_SIZES)